@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+标签分类树基准：在测试库中建 depth 层、每层 width 个分类的树（每个分类的父级随机取自上一层），每个分类下 tags 个标签，
+比较旧实现（递归逐个节点查询子分类、沿 parent_category 逐级懒加载路径）与物化路径
+（tag_get_sub_categories / TagCategory.get_full_path）取所有根分类子树、所有标签路径的耗时与查询数，
+以及标签上冗余的 category_path 在根分类改名后的批量刷新
+
+    python benchmarks/bench_category_tree.py [depth] [width] [tags]
+"""
+import os
+import random
+import sys
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'intellikeeper_api.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from device.models import Device  # noqa: E402
+from tag.models import Tag, TagCategory  # noqa: E402
+from tag.services import tag_get_sub_categories  # noqa: E402
+from user.models import User  # noqa: E402
+
+
+def sub_categories_legacy(category):
+    result = [category]
+    for child in TagCategory.objects.filter(parent_category=category):
+        result.extend(sub_categories_legacy(child))
+    return result
+
+
+def path_legacy(tag):
+    category = tag.category
+    path = []
+    while category is not None:
+        path.append(category.name)
+        category = category.parent_category
+    return '/'.join(reversed(path))
+
+
+def seed(depth, width, tag_count):
+    user = User.objects.create(mobile='+8613800000000')
+    device = Device.objects.create(device_id='bench-category-tree', belongs_to=user, is_active=True)
+    levels = []
+    for level in range(depth):
+        parents = levels[-1] if levels else [None]
+        levels.append([TagCategory.objects.create(device=device, name='c{}-{}'.format(level, i), color='#000000',
+                                                  parent_category=random.choice(parents)) for i in range(width)])
+    categories = [category for level in levels for category in level]
+    Tag.objects.bulk_create([Tag(device=device, tid=i * tag_count + j, name=str(i * tag_count + j), category=category)
+                             for i, category in enumerate(categories) for j in range(tag_count)])
+    # bulk_create 不经过 Tag.save，冗余的分类路径与颜色一次补齐
+    Tag.refresh_category_labels(TagCategory.objects.all())
+    return levels[0]
+
+
+def rename(categories):
+    for category in categories:
+        category.name += '+'
+        category.save()
+
+
+def measure(func):
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(None)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        started = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - started
+    return result, seconds, len(queries)
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    tag_count = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        roots = seed(depth, width, tag_count)
+        print('depth {} x width {}: {} categories, {} tags'.format(
+            depth, width, TagCategory.objects.count(), Tag.objects.count()))
+
+        legacy, seconds, queries = measure(lambda: [
+            {category.id for category in sub_categories_legacy(root)} for root in roots])
+        print('subtree, legacy: {:.3f} s, {:,} queries'.format(seconds, queries))
+        subtrees, seconds, queries = measure(lambda: [
+            {category.id for category in tag_get_sub_categories(root)} for root in roots])
+        print('subtree, tree_path: {:.3f} s, {:,} queries'.format(seconds, queries))
+        assert legacy == subtrees
+
+        tags = list(Tag.objects.select_related('category'))
+        legacy, seconds, queries = measure(lambda: [path_legacy(tag) for tag in tags])
+        print('path, legacy: {:.3f} s, {:,} queries'.format(seconds, queries))
+        tags = list(Tag.objects.select_related('category'))
+        paths, seconds, queries = measure(lambda: [tag.category.get_full_path() for tag in tags])
+        print('path, tree_path: {:.3f} s, {:,} queries'.format(seconds, queries))
+        assert legacy == paths
+        assert legacy == [tag.category_path for tag in tags]
+
+        _, seconds, queries = measure(lambda: rename(roots))
+        print('rename {} roots, refresh category_path: {:.3f} s, {:,} queries'.format(len(roots), seconds, queries))
+        tags = list(Tag.objects.select_related('category'))
+        assert [path_legacy(tag) for tag in tags] == [tag.category_path for tag in tags]
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
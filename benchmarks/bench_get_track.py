@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+get_track 轨迹计算基准：在测试库中为一个基站的 tags 个标签写入 hours 小时、每 interval 秒一条的轨迹，
+比较旧实现（每个标签一次查询、每行懒加载三个阅读器）与 tag.tracks.build_tracks（一次流式查询 +
+阅读器坐标表 + 批量定位）的耗时与查询数；旧实现按行发查询，两种实现在同样的前 legacy_tags 个标签上比较，
+之后 build_tracks 再以查询集计算全部标签
+写入的轨迹不带定位结果，build_tracks 的耗时包含读取时的定位
+
+    python benchmarks/bench_get_track.py [tags] [hours] [interval] [legacy_tags]
+"""
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'intellikeeper_api.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from device.models import Device  # noqa: E402
+from tag.models import Reader, Tag, TagTrack  # noqa: E402
+from tag.tracks import build_tracks  # noqa: E402
+from user.models import User  # noqa: E402
+
+
+def get_track_legacy(obj):
+    raw_track = TagTrack.objects.filter(tag=obj, created__gte=(timezone.now() - timedelta(days=2))).order_by('id')
+    track = []
+    for raw_position in raw_track:
+        position: TagTrack = raw_position
+        data = [x for x in [
+            (position.reader1, position.distance1),
+            (position.reader2, position.distance2),
+            (position.reader3, position.distance3),
+        ] if x[0] is not None]
+        if len(data) == 0:
+            continue
+        sorted(data, key=lambda x: x[1], reverse=True)
+        if len(track) > 0 and (abs(data[0][0].x - track[-1][0]) < 2 and abs(data[0][0].y - track[-1][1]) < 2):
+            continue
+        track.append((data[0][0].x, data[0][0].y, position.created))
+    return track
+
+
+def seed(tag_count, hours, interval):
+    user = User.objects.create(mobile='+8613800000000')
+    device = Device.objects.create(device_id='bench-get-track', belongs_to=user, is_active=True)
+    readers = [Reader.objects.create(rid=i, name='bench-reader-{}'.format(i), device=device, x=i % 4 * 5, y=i // 4 * 5)
+               for i in range(16)]
+    Tag.objects.bulk_create([Tag(device=device, tid=tid, name=str(tid)) for tid in range(tag_count)])
+    tags = list(Tag.objects.filter(device=device))
+
+    now = timezone.now()
+    samples = hours * 3600 // interval
+    batch = []
+    for step in range(samples):
+        created = now - timedelta(seconds=(samples - step) * interval)
+        for tag in tags:
+            near = random.sample(readers, 3)
+            batch.append(TagTrack(
+                tag_id=tag.id,
+                reader1_id=near[0].id, distance1=random.random() * 5,
+                reader2_id=near[1].id, distance2=random.random() * 5,
+                reader3_id=near[2].id, distance3=random.random() * 5,
+                created=created
+            ))
+        if len(batch) >= 10000:
+            TagTrack.objects.bulk_create(batch)
+            batch = []
+    TagTrack.objects.bulk_create(batch)
+    return device, tags
+
+
+def measure(func):
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(None)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        started = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - started
+    return result, seconds, len(queries)
+
+
+def main():
+    tag_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    hours = int(sys.argv[2]) if len(sys.argv) > 2 else 48
+    interval = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    legacy_tags = int(sys.argv[4]) if len(sys.argv) > 4 else 2
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        device, tags = seed(tag_count, hours, interval)
+        rows = TagTrack.objects.count()
+        print('{} tags, {} h every {} s: {:,} tracks'.format(tag_count, hours, interval, rows))
+
+        # 同一批标签上比较两种实现
+        subset = tags[:legacy_tags]
+        legacy, seconds, queries = measure(lambda: {tag.id: get_track_legacy(tag) for tag in subset})
+        print('legacy, {} tags: {:.2f} s, {:,} queries ({:.3f} s per tag)'.format(
+            len(subset), seconds, queries, seconds / len(subset)))
+        subset_qs = Tag.objects.filter(id__in=[tag.id for tag in subset])
+        tracks, seconds, queries = measure(lambda: build_tracks(device.id, subset_qs))
+        print('build_tracks, same {} tags: {:.2f} s, {} queries ({:.3f} s per tag)'.format(
+            len(subset), seconds, queries, seconds / len(subset)))
+        assert tracks.keys() == legacy.keys()
+
+        # 全部标签以子查询传入，标签数超过 SQLite 的参数个数上限（999）也只是一条轨迹查询
+        tracks, seconds, queries = measure(lambda: build_tracks(device.id, Tag.objects.filter(device=device)))
+        print('build_tracks, all {} tags: {:.2f} s, {} queries, {:,.0f} tracks/s ({:.3f} s per tag)'.format(
+            tag_count, seconds, queries, rows / seconds, seconds / tag_count))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
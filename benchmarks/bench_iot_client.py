@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+IoTDA 客户端基准：在本地起一个模拟 IoTDA show_device 接口的 HTTP 服务（支持 keep-alive），
+比较旧的用法（每次调用都重新构建凭证、HttpConfig 与 IoTDAClient，新建连接）与进程内共享客户端（复用连接池）
+单次调用的平均延迟，以及 threads 个线程并发使用共享客户端时的吞吐；请求日志关闭，不计入耗时
+
+    python benchmarks/bench_iot_client.py [calls] [threads]
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'intellikeeper_api.settings')
+django.setup()
+
+from huaweicloudsdkiotda.v5 import ShowDeviceRequest  # noqa: E402
+
+from device.iot import build_iot_client, get_iot_client, reset_iot_client  # noqa: E402
+from intellikeeper_api.hwyun_settings import HwyunSettings  # noqa: E402
+
+
+class ShowDeviceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头与响应体一次发出，避免 keep-alive 连接上的 Nagle / 延迟确认等待
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = json.dumps({'device_id': self.path.rsplit('/', 1)[-1], 'status': 'ONLINE'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(calls, call):
+    started = time.perf_counter()
+    for i in range(calls):
+        assert call(i).status == 'ONLINE'
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ShowDeviceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    HwyunSettings.endpoint = 'http://127.0.0.1:{}'.format(server.server_port)
+    logging.disable(logging.INFO)
+    reset_iot_client()
+    try:
+        def legacy(i):
+            return build_iot_client().show_device(ShowDeviceRequest(device_id='bench-{}'.format(i)))
+
+        def shared(i):
+            return get_iot_client().show_device(ShowDeviceRequest(device_id='bench-{}'.format(i)))
+
+        # 预热：导入、首次构建
+        legacy(0)
+        shared(0)
+        legacy_latency = measure(calls, legacy)
+        shared_latency = measure(calls, shared)
+        print('{} calls, legacy (new client per call): {:.2f} ms/call'.format(calls, legacy_latency * 1000))
+        print('{} calls, shared client: {:.2f} ms/call ({:.2f} ms saved per call)'.format(
+            calls, shared_latency * 1000, (legacy_latency - shared_latency) * 1000))
+
+        with ThreadPoolExecutor(threads) as executor:
+            started = time.perf_counter()
+            assert all(result.status == 'ONLINE' for result in executor.map(shared, range(calls)))
+            seconds = time.perf_counter() - started
+        print('{} calls on {} threads, shared client: {:.0f} calls/s'.format(calls, threads, calls / seconds))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+轨迹平滑质量基准：合成一条已知真值的标签运动轨迹，给三个阅读器的距离加上高斯噪声，
+比较直接三边定位与 TrackSmoother 平滑后相对真值的误差，以及每次更新的耗时
+
+    python benchmarks/bench_smoothing.py [samples] [noise] [interval]
+"""
+import math
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intellikeeper_api.track_settings import TrackSettings  # noqa: E402
+from tag.positioning import locate  # noqa: E402
+from tag.smoothing import TrackSmoother  # noqa: E402
+
+READERS = np.array([(0.0, 0.0), (30.0, 0.0), (0.0, 30.0)])
+
+
+def ground_truth(samples, interval):
+    """
+    在 30 x 30 的区域内以半径 8、每 20 分钟一圈的速度绕圈
+    """
+    angle = 2 * math.pi * np.arange(samples) * interval / 1200
+    return np.column_stack((15 + 8 * np.cos(angle), 15 + 8 * np.sin(angle)))
+
+
+def rmse(estimate, truth):
+    return float(np.sqrt(((estimate - truth) ** 2).sum(axis=1).mean()))
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    noise = float(sys.argv[2]) if len(sys.argv) > 2 else 1.5
+    interval = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    rng = np.random.default_rng(0)
+    truth = ground_truth(samples, interval)
+    distances = np.hypot(*(truth[:, None, :] - READERS[None, :, :]).transpose(2, 0, 1))
+    distances = np.abs(distances + rng.normal(0, noise, distances.shape))
+    raw = locate(np.broadcast_to(READERS, (samples, 3, 2)), distances)
+
+    smoother = TrackSmoother(TrackSettings.smoothing_process_noise, TrackSettings.smoothing_measurement_noise,
+                             TrackSettings.smoothing_max_gap)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    times = [start + timedelta(seconds=i * interval) for i in range(samples)]
+    rows = raw.tolist()
+    smoothed = np.empty((samples, 2))
+    started = time.perf_counter()
+    for i, (x, y, error) in enumerate(rows):
+        smoothed[i] = smoother.update(1, times[i], x, y, error)
+    seconds = time.perf_counter() - started
+
+    print('{} samples every {} s, distance noise sigma {}'.format(samples, interval, noise))
+    print('raw trilateration RMSE: {:.3f}'.format(rmse(raw[:, :2], truth)))
+    print('smoothed RMSE:          {:.3f}'.format(rmse(smoothed, truth)))
+    print('update cost: {:.1f} us/sample'.format(seconds / samples * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+saveProps 标签帧解码微基准：比较旧的逐帧切片解码与 struct.iter_unpack 单遍解码，
+以及 dateutil 与固定格式的 event_time 解析
+
+    python benchmarks/bench_tag_frames.py
+"""
+import os
+import random
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'daemon'))
+
+from dateutil.parser import parse  # noqa: E402
+
+from daemon import parse_tags_byte_stream, parse_event_time  # noqa: E402
+
+
+def parse_tags_byte_stream_legacy(tags_byte_stream: bytes):
+    if len(tags_byte_stream) % 14 != 0:
+        return None
+    tags = []
+    while len(tags_byte_stream) > 0:
+        frame = tags_byte_stream[:14]
+        tags.append(struct.unpack('>HHHHHHH', frame))
+        tags_byte_stream = tags_byte_stream[14:]
+    return tags
+
+
+def make_payload(frames):
+    return b''.join(
+        struct.pack('>HHHHHHH', tid % 0xFFFF, random.randrange(0xFFFF), random.randrange(1000),
+                    random.randrange(0xFFFF), random.randrange(1000), 0xFFFF, 0)
+        for tid in range(frames)
+    ).hex()
+
+
+def frames_per_second(decode, payload, frames):
+    runs = max(1, 200000 // frames)
+    if decode is parse_tags_byte_stream_legacy and frames >= 100000:
+        runs = 1
+    seconds = min(timeit.repeat(lambda: decode(bytes.fromhex(payload)), number=runs, repeat=3))
+    return frames * runs / seconds
+
+
+def main():
+    print('{:>8} {:>16} {:>16} {:>8}'.format('frames', 'legacy frames/s', 'new frames/s', 'speedup'))
+    for frames in (10, 1000, 100000):
+        payload = make_payload(frames)
+        assert parse_tags_byte_stream(bytes.fromhex(payload)) == parse_tags_byte_stream_legacy(bytes.fromhex(payload))
+        before = frames_per_second(parse_tags_byte_stream_legacy, payload, frames)
+        after = frames_per_second(parse_tags_byte_stream, payload, frames)
+        print('{:>8} {:>16,.0f} {:>16,.0f} {:>7.1f}x'.format(frames, before, after, after / before))
+
+    event_time = '20200708T074912Z'
+    assert parse_event_time(event_time) == parse(event_time)
+    before = min(timeit.repeat(lambda: parse(event_time), number=20000, repeat=3))
+    after = min(timeit.repeat(lambda: parse_event_time(event_time), number=20000, repeat=3))
+    print('event_time: dateutil {:,.0f}/s, fast path {:,.0f}/s'.format(20000 / before, 20000 / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+TagTrack 写入与区间读取基准：在测试库中按时间顺序写入 rows 条轨迹（默认 1000 万），
+统计 bulk_create 的写入速率，再比较有无 (tag, created) 索引时按标签读取最近两天轨迹的耗时，
+最后执行一次 rotate_tracks 的保留期清理
+PostgreSQL 上 TagTrack 为按月分区表，SQLite 上为普通表
+
+    python benchmarks/bench_tag_track.py [rows] [tags] [days]
+"""
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'intellikeeper_api.settings')
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from device.models import Device  # noqa: E402
+from tag.models import Reader, Tag, TagTrack  # noqa: E402
+from user.models import User  # noqa: E402
+
+BATCH_SIZE = 10000
+
+
+def insert_tracks(tags, readers, rows, days):
+    now = timezone.now()
+    start = now - timedelta(days=days)
+    step = timedelta(days=days) / rows
+    written = 0
+    report_every = max(rows // 10, BATCH_SIZE)
+    started = chunk_started = time.perf_counter()
+    while written < rows:
+        count = min(BATCH_SIZE, rows - written)
+        TagTrack.objects.bulk_create([TagTrack(
+            tag_id=tags[(written + i) % len(tags)],
+            reader1_id=readers[0], distance1=random.random() * 10,
+            reader2_id=readers[1], distance2=random.random() * 10,
+            reader3_id=readers[2], distance3=random.random() * 10,
+            created=start + step * (written + i)
+        ) for i in range(count)])
+        written += count
+        if written % report_every == 0 or written == rows:
+            elapsed = time.perf_counter() - chunk_started
+            print('  {:>12,} rows  {:>10,.0f} rows/s'.format(written, report_every / elapsed if elapsed else 0))
+            chunk_started = time.perf_counter()
+    return rows / (time.perf_counter() - started)
+
+
+def read_tracks(tags, samples=200):
+    since = timezone.now() - timedelta(days=2)
+    picked = random.sample(tags, min(samples, len(tags)))
+    rows = 0
+    started = time.perf_counter()
+    for tag_id in picked:
+        rows += len(list(TagTrack.objects.filter(tag_id=tag_id, created__gte=since).order_by('created', 'id')
+                         .values_list('reader1_id', 'distance1', 'created')))
+    return (time.perf_counter() - started) / len(picked) * 1000, rows / len(picked)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    tag_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    days = int(sys.argv[3]) if len(sys.argv) > 3 else 120
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        user = User.objects.create(mobile='+8613800000000')
+        device = Device.objects.create(device_id='bench-track', belongs_to=user, is_active=True)
+        readers = [Reader.objects.create(rid=i, name='bench-reader-{}'.format(i), device=device, x=i, y=i).id
+                   for i in range(3)]
+        Tag.objects.bulk_create([Tag(device=device, tid=tid, name=str(tid)) for tid in range(tag_count)])
+        tags = list(Tag.objects.values_list('id', flat=True))
+
+        print('{} ({}), {:,} rows over {} days, {} tags'.format(
+            connection.vendor, 'partitioned' if connection.vendor == 'postgresql' else 'single table',
+            rows, days, tag_count))
+        print('insert: {:,.0f} rows/s'.format(insert_tracks(tags, readers, rows, days)))
+
+        ms, per_tag = read_tracks(tags)
+        print('read 2 days by tag, (tag, created) index: {:.2f} ms/query, {:.0f} rows/query'.format(ms, per_tag))
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX tag_tagtrack_tag_created')
+        ms, per_tag = read_tracks(tags, samples=20)
+        print('read 2 days by tag, tag_id index only:   {:.2f} ms/query, {:.0f} rows/query'.format(ms, per_tag))
+
+        started = time.perf_counter()
+        call_command('rotate_tracks', retention_days=days // 2)
+        print('rotate_tracks (retention {} days): {:.2f} s'.format(days // 2, time.perf_counter() - started))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
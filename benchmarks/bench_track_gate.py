@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+轨迹写入门控基准：把一段 saveProps 流量（FileBroker 格式的 root/saveProps.jsonl）经 parse_props_message 与
+ingest_reports 在测试库中各回放一次，分别关闭与开启写入门控，比较写入的 TagTrack 行数与耗时
+不指定 root 时先生成一段合成流量：3 x 3 的阅读器网格上大部分标签静止、少数标签在网格上走动
+
+    python benchmarks/bench_track_gate.py [root] [--tags N] [--messages N]
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import django
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'daemon'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'intellikeeper_api.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from broker import FileBroker  # noqa: E402
+from daemon import parse_props_message  # noqa: E402
+from device.models import Device  # noqa: E402
+from intellikeeper_api.track_settings import TrackSettings  # noqa: E402
+from tag.cache import identity_cache  # noqa: E402
+from tag.ingest import ingest_reports  # noqa: E402
+from tag.models import Reader, TagTrack  # noqa: E402
+from tag.presence import presence_engine  # noqa: E402
+from tag.smoothing import track_smoother  # noqa: E402
+from tag.track_gate import track_write_gate  # noqa: E402
+from user.models import User  # noqa: E402
+
+DEVICE_ID = 'bench-track-gate'
+GRID = [(rid, (rid - 1) % 3 * 10.0, (rid - 1) // 3 * 10.0) for rid in range(1, 10)]
+
+
+def synthesize(root, tags, messages, interval=10):
+    """
+    每条消息包含所有标签的一帧；静止标签在固定位置附近有测距噪声，走动的标签（约 10%）沿网格绕圈
+    """
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    rng = random.Random(0)
+    homes = {tid: (rng.uniform(0, 20), rng.uniform(0, 20)) for tid in range(1, tags + 1)}
+    walkers = set(rng.sample(sorted(homes), max(1, tags // 10)))
+    with open(os.path.join(root, 'saveProps.jsonl'), 'w') as f:
+        for step in range(messages):
+            frames = []
+            for tid, (x, y) in homes.items():
+                if tid in walkers:
+                    angle = 2 * math.pi * (step / 60 + tid / tags)
+                    x, y = 10 + 9 * math.cos(angle), 10 + 9 * math.sin(angle)
+                nearest = sorted(GRID, key=lambda reader: math.hypot(reader[1] - x, reader[2] - y))[:3]
+                frame = [tid]
+                for rid, rx, ry in nearest:
+                    frame += [rid, max(0, int(round(math.hypot(rx - x, ry - y) + rng.gauss(0, 0.5))))]
+                frames.append(struct.pack('>HHHHHHH', *frame))
+            event_time = (start + timedelta(seconds=step * interval)).strftime('%Y%m%dT%H%M%SZ')
+            f.write(json.dumps({'key': DEVICE_ID, 'value': {
+                'device_id': DEVICE_ID,
+                'services': [{'event_time': event_time, 'properties': {'tags': b''.join(frames).hex()}}]
+            }}) + '\n')
+
+
+def replay(root, gate_enabled, batch_size=100):
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        user = User.objects.create(mobile='+8613800000000')
+        device = Device.objects.create(device_id=DEVICE_ID, belongs_to=user, is_active=True)
+        Reader.objects.bulk_create([Reader(rid=rid, name='R{}'.format(rid), device=device, x=x, y=y)
+                                    for rid, x, y in GRID])
+        identity_cache.warm_up()
+        presence_engine.load()
+        track_smoother.clear()
+        track_write_gate.clear()
+        TrackSettings.write_gate_enabled = gate_enabled
+
+        reports = 0
+        started = time.perf_counter()
+        batch = []
+        # parse_props_message 会打印每条消息的原始内容
+        with contextlib.redirect_stdout(io.StringIO()):
+            for record in FileBroker(root).consume('saveProps'):
+                message = parse_props_message(record)
+                if message is None:
+                    continue
+                devices = identity_cache.get_devices((message[0], ))
+                if message[0] not in devices:
+                    continue
+                batch.append((devices[message[0]], message[1], message[2]))
+                reports += len(message[2])
+                if len(batch) >= batch_size:
+                    ingest_reports(batch)
+                    batch = []
+            if batch:
+                ingest_reports(batch)
+        return reports, TagTrack.objects.count(), time.perf_counter() - started
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root', nargs='?')
+    parser.add_argument('--tags', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.root
+        if root is None:
+            root = tmp
+            synthesize(root, args.tags, args.messages)
+            print('synthetic traffic: {} tags x {} messages'.format(args.tags, args.messages))
+
+        reports, ungated, seconds = replay(root, False)
+        print('gate off: {:,} frames -> {:,} TagTrack rows, {:.1f} s'.format(reports, ungated, seconds))
+        reports, gated, seconds = replay(root, True)
+        print('gate on:  {:,} frames -> {:,} TagTrack rows, {:.1f} s'.format(reports, gated, seconds))
+        print('rows saved: {:,} ({:.1%}), {:.1f}x fewer TagTrack writes'.format(
+            ungated - gated, (ungated - gated) / ungated if ungated else 0, ungated / gated if gated else 0))
+
+
+if __name__ == '__main__':
+    main()
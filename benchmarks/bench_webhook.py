@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+外部回调吞吐基准：本地起一个 HTTP 服务作为回调目标，比较每次新建连接的 requests.request
+与 WebhookTransport（长连接池 + 单主机并发上限）的 calls/sec
+
+    python benchmarks/bench_webhook.py [calls] [threads]
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tag.webhook import WebhookTransport  # noqa: E402
+
+
+class CallbackHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def calls_per_second(call, calls, threads):
+    started = time.monotonic()
+    with ThreadPoolExecutor(threads) as executor:
+        for response in executor.map(lambda _: call(), range(calls)):
+            assert response.status_code == 200
+    return calls / (time.monotonic() - started)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CallbackHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/alarm'.format(server.server_port)
+    data = {'tag_name': 'TAG_1', 'event_type': '1'}
+
+    transport = WebhookTransport(connect_timeout=3, read_timeout=10, pool_size=threads, max_per_host=threads,
+                                 retries=0, backoff=0, stats_flush_interval=60)
+
+    for concurrency in (1, threads):
+        before = calls_per_second(lambda: requests.request('post', url, data=data), calls, concurrency)
+        after = calls_per_second(lambda: transport.request('post', url, data=data), calls, concurrency)
+        print('threads={:<3} requests.request {:>8,.0f} calls/s   WebhookTransport {:>8,.0f} calls/s'.format(
+            concurrency, before, after))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
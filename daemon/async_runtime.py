@@ -0,0 +1,151 @@
+import asyncio
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from consumer_pool import OffsetTracker, device_affinity, worker_index
+
+_STOP = None
+
+
+def call_with_db(func, *args):
+    from django.db import close_old_connections
+
+    # 线程池里的线程各自持有数据库连接，调用前后按 CONN_MAX_AGE 回收
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def drain_batches(q: asyncio.Queue, batch_size, linger_ms):
+    """
+    与 consumer_pool.drain_batches 相同的凑批规则，作用于 asyncio.Queue
+    """
+    while True:
+        record = await q.get()
+        if record is _STOP:
+            return
+        batch = [record]
+
+        deadline = time.monotonic() + linger_ms / 1000
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                record = await asyncio.wait_for(q.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if record is _STOP:
+                yield batch
+                return
+            batch.append(record)
+        yield batch
+
+
+class AsyncRuntime:
+    """
+    在一个事件循环中复用所有 topic：
+    每个 topic 由一个线程从 broker 读取消息，按基站亲和性分到 concurrency 条通道，通道内顺序处理；
+    阻塞的 ORM / 云端 SDK 调用统一交给有界线程池，一条通道卡住不影响同 topic 的其他通道
+    位移不自动提交：通道处理完一批后回报结果，读取线程每 commit_interval 秒提交一次已处理成功的位移；
+    stop() 之后读取线程不再读取，等各通道处理完已分发的消息后提交位移，run_topic 随之返回
+    """
+
+    def __init__(self, broker, max_threads, queue_size=1000, commit_interval=1.0):
+        self.broker = broker
+        self.queue_size = queue_size
+        self.commit_interval = commit_interval
+        self.executor = ThreadPoolExecutor(max_threads, thread_name_prefix='daemon-worker')
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(call_with_db, func, *args))
+
+    async def feed(self, broker, topic, partitions, lanes, affinity, acks, lanes_done):
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def put(lane, record):
+            # 通道满时阻塞读取线程，形成背压
+            asyncio.run_coroutine_threadsafe(lane.put(record), loop).result()
+
+        def commit(offsets):
+            while True:
+                try:
+                    ok, processed = acks.get_nowait()
+                except queue.Empty:
+                    break
+                offsets.processed(ok, processed)
+            offsets.commit(broker, topic)
+
+        def pump():
+            offsets = OffsetTracker()
+            records = broker.consume(topic, partitions, auto_commit=False)
+            committed = time.monotonic()
+            try:
+                for record in records:
+                    if record is not None:
+                        offsets.dispatched(record.partition, record.offset)
+                        put(lanes[worker_index(affinity(record), len(lanes))], record)
+                    if self._stopping.is_set():
+                        break
+                    if time.monotonic() - committed >= self.commit_interval:
+                        commit(offsets)
+                        committed = time.monotonic()
+            except Exception as e:
+                loop.call_soon_threadsafe(done.set_exception, e)
+            else:
+                loop.call_soon_threadsafe(done.set_result, None)
+            finally:
+                for lane in lanes:
+                    put(lane, _STOP)
+                # 已分发的消息处理完再提交，读取与提交在同一个线程中
+                lanes_done.wait()
+                commit(offsets)
+                records.close()
+
+        threading.Thread(target=pump, name='daemon-feed-{}'.format(topic), daemon=True).start()
+        await done
+
+    async def lane(self, q, acks, handler, state, batch_size, linger_ms):
+        async for batch in drain_batches(q, batch_size, linger_ms):
+            try:
+                await self.call(handler, batch, state)
+            except Exception:
+                traceback.print_exc()
+                acks.put((False, [(record.partition, record.offset) for record in batch]))
+            else:
+                acks.put((True, [(record.partition, record.offset) for record in batch]))
+
+    async def run_topic(self, topic, handler, state, partitions=None, concurrency=1, batch_size=1, linger_ms=0,
+                        affinity=device_affinity, broker=None):
+        """
+        broker 为 None 时使用运行时的 broker；同一 topic 需要以另一个消费组再读一遍时传入单独的 broker
+        """
+        lanes = [asyncio.Queue(self.queue_size) for _ in range(concurrency)]
+        acks = queue.Queue()
+        lanes_done = threading.Event()
+
+        async def run_lanes():
+            try:
+                await asyncio.gather(*(self.lane(q, acks, handler, state, batch_size, linger_ms) for q in lanes))
+            finally:
+                lanes_done.set()
+
+        await asyncio.gather(
+            self.feed(broker or self.broker, topic, partitions, lanes, affinity, acks, lanes_done),
+            run_lanes()
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
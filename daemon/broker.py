@@ -0,0 +1,165 @@
+import json
+import os
+import queue
+from collections import namedtuple
+
+# 与 kafka ConsumerRecord 同名的字段，worker 进程之间传递时只用这几个
+Record = namedtuple('Record', ('topic', 'partition', 'offset', 'key', 'value'))
+
+_CLOSED = object()
+
+
+class KafkaBroker:
+    def __init__(self, bootstrap_servers, group_id=None):
+        self.bootstrap_servers = bootstrap_servers
+        self.group_id = group_id
+        self._consumers = {}
+
+    def consume(self, topic, partitions=None, auto_commit=True, idle_ms=1000):
+        """
+        partitions 为 None 时加入消费组由 Kafka 分配分区，否则只读取指定分区
+        auto_commit 为 False 时不自动提交位移，由调用方处理完后调用 commit()；
+        此时每空闲 idle_ms 毫秒产出一次 None，调用方可以借机提交位移或退出
+        """
+        from kafka import KafkaConsumer, TopicPartition
+
+        consumer = KafkaConsumer(bootstrap_servers=self.bootstrap_servers, group_id=self.group_id,
+                                 enable_auto_commit=auto_commit)
+        if partitions is None:
+            consumer.subscribe([topic])
+        else:
+            consumer.assign([TopicPartition(topic=topic, partition=partition) for partition in partitions])
+        self._consumers[topic] = consumer
+        try:
+            if auto_commit:
+                for msg in consumer:
+                    yield Record(msg.topic, msg.partition, msg.offset, msg.key, msg.value)
+                return
+            while True:
+                polled = consumer.poll(timeout_ms=idle_ms)
+                if not polled:
+                    yield None
+                for messages in polled.values():
+                    for msg in messages:
+                        yield Record(msg.topic, msg.partition, msg.offset, msg.key, msg.value)
+        finally:
+            del self._consumers[topic]
+            consumer.close(autocommit=auto_commit)
+
+    def partitions(self, topic):
+        """
+        topic 的全部分区号
+        """
+        from kafka import KafkaConsumer
+
+        consumer = KafkaConsumer(bootstrap_servers=self.bootstrap_servers)
+        try:
+            partitions = consumer.partitions_for_topic(topic)
+        finally:
+            consumer.close(autocommit=False)
+        if not partitions:
+            raise RuntimeError('No partitions found for topic {}'.format(topic))
+        return tuple(sorted(partitions))
+
+    def commit(self, topic, offsets):
+        """
+        offsets 为 {partition: 下一条待处理消息的位移}，需在读取 consume() 的线程中调用
+        """
+        from kafka import OffsetAndMetadata, TopicPartition
+
+        self._consumers[topic].commit({
+            TopicPartition(topic=topic, partition=partition): OffsetAndMetadata(offset, '', -1)
+            for partition, offset in offsets.items()
+        })
+
+
+class MemoryBroker:
+    """
+    进程内的 broker 替身，用于离线测试与压测；close() 之后消费端读完已发布的消息即结束
+    """
+
+    def __init__(self):
+        self.topics = {}
+        self.offsets = {}
+        self.committed = {}
+
+    def _queue(self, topic):
+        return self.topics.setdefault(topic, queue.Queue())
+
+    def publish(self, topic, value, key=None, partition=0):
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        if isinstance(value, str):
+            value = value.encode()
+        offset = self.offsets.get((topic, partition), 0)
+        self.offsets[(topic, partition)] = offset + 1
+        self._queue(topic).put(Record(topic, partition, offset, key, value))
+
+    def close(self, topic=None):
+        for name in ((topic,) if topic is not None else tuple(self.topics)):
+            self._queue(name).put(_CLOSED)
+
+    def consume(self, topic, partitions=None, auto_commit=True):
+        q = self._queue(topic)
+        while True:
+            record = q.get()
+            if record is _CLOSED:
+                return
+            if partitions is None or record.partition in partitions:
+                yield record
+
+    def partitions(self, topic):
+        # 不分消费组，consume(partitions=None) 即读取全部分区
+        return None
+
+    def commit(self, topic, offsets):
+        for partition, offset in offsets.items():
+            self.committed[(topic, partition)] = offset
+
+
+class FileBroker:
+    """
+    基于文件的 broker 替身：读取 root/<topic>.jsonl，每行为
+    {"partition": 0, "key": "...", "value": {...}} 或者直接是消息体，读到文件末尾即结束
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def consume(self, topic, partitions=None, auto_commit=True):
+        path = os.path.join(self.root, '{}.jsonl'.format(topic))
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            for offset, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if isinstance(entry, dict) and 'value' in entry:
+                    partition = entry.get('partition', 0)
+                    key = entry.get('key')
+                    value = entry['value']
+                else:
+                    partition, key, value = 0, None, entry
+                if partitions is not None and partition not in partitions:
+                    continue
+                if not isinstance(value, str):
+                    value = json.dumps(value)
+                yield Record(topic, partition, offset, key.encode() if isinstance(key, str) else key,
+                             value.encode())
+
+    def partitions(self, topic):
+        return None
+
+    def commit(self, topic, offsets):
+        # 文件每次都从头读取，没有位移可提交
+        pass
+
+
+def get_broker(group_id=None):
+    from intellikeeper_api.daemon_settings import DaemonSettings
+
+    if DaemonSettings.broker == 'file':
+        return FileBroker(DaemonSettings.file_broker_root)
+    return KafkaBroker(DaemonSettings.kafka_bootstrap_servers, group_id or DaemonSettings.kafka_group_id)
@@ -0,0 +1,227 @@
+import json
+import queue
+import signal
+import sys
+import time
+import traceback
+import zlib
+from collections import deque
+from multiprocessing import Process, Queue
+
+_STOP = None
+
+
+def device_affinity(record):
+    """
+    同一基站的消息总是交给同一个 worker，保证单基站内的处理顺序
+    优先使用消息 key，其次是消息体中的 device_id，都没有时退化为按分区
+    """
+    if record.key:
+        return record.key if isinstance(record.key, bytes) else str(record.key).encode()
+    try:
+        device_id = json.loads(record.value).get('device_id')
+    except (ValueError, AttributeError):
+        device_id = None
+    if device_id is not None:
+        return str(device_id).encode()
+    return str(record.partition).encode()
+
+
+def worker_index(key: bytes, workers):
+    # 不能用 hash()：每个进程的 hash 种子不同
+    return zlib.crc32(key) % workers
+
+
+def drain_batches(q: Queue, batch_size, linger_ms):
+    """
+    收到首条消息后最多再等待 linger_ms 毫秒，凑满 batch_size 条即提前返回；收到停止信号后结束
+    """
+    while True:
+        record = q.get()
+        if record is _STOP:
+            return
+        batch = [record]
+
+        deadline = time.monotonic() + linger_ms / 1000
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                record = q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if record is _STOP:
+                yield batch
+                return
+            batch.append(record)
+        yield batch
+
+
+def worker_main(q: Queue, acks: Queue, handler, init, shutdown, batch_size, linger_ms):
+    # SIGTERM 时走正常退出流程，让 shutdown 有机会收尾
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    state = init() if init is not None else None
+    try:
+        for batch in drain_batches(q, batch_size, linger_ms):
+            try:
+                handler(batch, state)
+            except Exception:
+                # 一批处理失败不能让整个 worker 退出，否则分给它的基站都会卡住
+                traceback.print_exc()
+                acks.put((False, [(record.partition, record.offset) for record in batch]))
+            else:
+                acks.put((True, [(record.partition, record.offset) for record in batch]))
+    finally:
+        if shutdown is not None:
+            shutdown(state)
+
+
+class OffsetTracker:
+    """
+    按分区记录已分发、已处理的位移，只提交从头开始连续处理成功的部分
+    某条消息处理失败后该分区的位移停在它这里，不再继续跟踪，重启后从这条消息重新消费
+    """
+
+    def __init__(self):
+        self.inflight = {}
+        self.done = {}
+        self.failed = {}
+        self.uncommitted = {}
+
+    def dispatched(self, partition, offset):
+        if partition not in self.failed:
+            self.inflight.setdefault(partition, deque()).append(offset)
+
+    def processed(self, ok, offsets):
+        for partition, offset in offsets:
+            failed = self.failed.get(partition)
+            if failed is not None and offset > failed:
+                continue
+            if ok:
+                self.done.setdefault(partition, set()).add(offset)
+            else:
+                if failed is None:
+                    print('Partition {} stalls at offset {}, it will be consumed again after restart'.format(
+                        partition, offset))
+                self.failed[partition] = offset
+
+    def ready(self):
+        """
+        返回 {partition: 下一条待处理消息的位移}，只包含有进展的分区
+        """
+        result = {}
+        for partition, inflight in self.inflight.items():
+            done = self.done.get(partition, set())
+            offset = None
+            while inflight and inflight[0] in done:
+                offset = inflight.popleft()
+                done.discard(offset)
+            if offset is not None:
+                result[partition] = offset + 1
+        return result
+
+    def commit(self, broker, topic):
+        """
+        提交有进展的分区，需在读取 broker.consume() 的线程中调用；提交失败时下次一并带上，位移只会前进
+        """
+        self.uncommitted.update(self.ready())
+        if not self.uncommitted:
+            return
+        try:
+            broker.commit(topic, self.uncommitted)
+        except Exception:
+            traceback.print_exc()
+        else:
+            self.uncommitted = {}
+
+
+class TopicWorkerPool:
+    """
+    一个 topic 对应 N 个 worker 进程：当前进程从 broker 读取消息，按基站亲和性分发给各 worker
+    handler(batch, state) 在 worker 进程中按批处理消息，state 为 init() 在 worker 启动时的返回值，
+    worker 退出前调用 shutdown(state)
+    位移不自动提交：worker 处理完一批后回报结果，当前进程每 commit_interval 秒提交一次已处理成功的位移
+    收到 SIGTERM 时停止读取，等 worker 处理完已分发的消息并退出后再提交位移
+    """
+
+    def __init__(self, topic, handler, init=None, shutdown=None, workers=1, batch_size=1, linger_ms=0, queue_size=1000,
+                 affinity=device_affinity, commit_interval=1.0):
+        self.topic = topic
+        self.handler = handler
+        self.init = init
+        self.shutdown = shutdown
+        self.workers = workers
+        self.batch_size = batch_size
+        self.linger_ms = linger_ms
+        self.queue_size = queue_size
+        self.affinity = affinity
+        self.commit_interval = commit_interval
+
+        self.queues = []
+        self.processes = []
+        self.acks = None
+        self.offsets = OffsetTracker()
+        self._stopping = False
+
+    def start(self):
+        from django.db import connections
+
+        # 数据库连接不能被 fork 出来的 worker 共用
+        connections.close_all()
+        self.acks = Queue()
+        for _ in range(self.workers):
+            q = Queue(self.queue_size)
+            process = Process(target=worker_main,
+                              args=(q, self.acks, self.handler, self.init, self.shutdown, self.batch_size,
+                                    self.linger_ms))
+            process.start()
+            self.queues.append(q)
+            self.processes.append(process)
+
+    def dispatch(self, record):
+        self.offsets.dispatched(record.partition, record.offset)
+        self.queues[worker_index(self.affinity(record), self.workers)].put(record)
+
+    def collect(self):
+        while True:
+            try:
+                ok, offsets = self.acks.get_nowait()
+            except queue.Empty:
+                return
+            self.offsets.processed(ok, offsets)
+
+    def commit(self, broker):
+        self.collect()
+        self.offsets.commit(broker, self.topic)
+
+    def stop(self):
+        for q in self.queues:
+            q.put(_STOP)
+        for process in self.processes:
+            # worker 退出前要把回报写完，等待期间持续读取，避免管道写满互相等待
+            while process.is_alive():
+                self.collect()
+                process.join(0.1)
+
+    def _terminate(self, signum, frame):
+        self._stopping = True
+
+    def run(self, broker, partitions=None):
+        self.start()
+        signal.signal(signal.SIGTERM, self._terminate)
+        records = broker.consume(self.topic, partitions, auto_commit=False)
+        committed = time.monotonic()
+        try:
+            for record in records:
+                if record is not None:
+                    self.dispatch(record)
+                if self._stopping:
+                    break
+                if time.monotonic() - committed >= self.commit_interval:
+                    self.commit(broker)
+                    committed = time.monotonic()
+        finally:
+            self.stop()
+            self.commit(broker)
+            records.close()
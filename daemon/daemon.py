@@ -1,13 +1,24 @@
 #!/usr/bin/env python
+import asyncio
 import json
 import os
+import signal
 import struct
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
 from multiprocessing import Process
 
 import django
 from dateutil.parser import parse
-from kafka import KafkaConsumer, TopicPartition
-from kafka.consumer.fetcher import ConsumerRecord
+
+from async_runtime import AsyncRuntime
+from broker import Record, get_broker
+from consumer_pool import TopicWorkerPool
+
+
+TAG_FRAME = struct.Struct('>HHHHHHH')
 
 
 def parse_tags_byte_stream(tags_byte_stream: bytes):
@@ -17,182 +28,424 @@ def parse_tags_byte_stream(tags_byte_stream: bytes):
     01 02  03 04     05 06      07 08     09 10      11 12     13 14
     00 01  00 00     00 6d      ff ff     00 00      ff ff     00 00
     """
-    if len(tags_byte_stream) % 14 != 0:
+    if len(tags_byte_stream) % TAG_FRAME.size != 0:
         print('malformed tag stream format, len={}'.format(len(tags_byte_stream)))
         # malformed tag stream format
         return None
-    tags = []
-    while len(tags_byte_stream) > 0:
-        frame = tags_byte_stream[:14]
-        tags.append(struct.unpack('>HHHHHHH', frame))
-        tags_byte_stream = tags_byte_stream[14:]
-    return tags
+    # 一次遍历解出所有帧，不再逐帧切片复制剩余缓冲区
+    return list(TAG_FRAME.iter_unpack(memoryview(tags_byte_stream)))
+
 
+def parse_event_time(event_time: str):
+    """
+    华为云推送的 event_time 固定为 yyyyMMddTHHmmssZ（UTC），直接按位解析；其他格式交给 dateutil
+    """
+    if len(event_time) == 16 and event_time[8] == 'T' and event_time[15] == 'Z':
+        try:
+            return datetime(int(event_time[0:4]), int(event_time[4:6]), int(event_time[6:8]),
+                            int(event_time[9:11]), int(event_time[11:13]), int(event_time[13:15]),
+                            tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    return parse(event_time)
 
-def get_reader(reader_rid, device):
-    from tag.models import Reader
 
-    if reader_rid == 0xFFFF:
+def parse_props_message(msg: Record):
+    """
+    返回 (device_id, event_time, tags)，消息不合法时返回 None
+    """
+    try:
+        data = json.loads(msg.value)
+        raw_tags = data['services'][0]['properties']['tags']
+        print(raw_tags)
+        if raw_tags is None:
+            tags = []
+        else:
+            tags = parse_tags_byte_stream(bytes.fromhex(raw_tags))
+            if tags is None:
+                return None
+        return data['device_id'], parse_event_time(data['services'][0]['event_time']), tags
+    except (TypeError, KeyError, ValueError):
+        print('Malformed data: {}'.format(msg))
         return None
 
-    return Reader.objects.get_or_create(rid=reader_rid, device=device, defaults={
-        'x': 0,
-        'y': 0,
-        'name': 'READER_{}'.format(reader_rid)
-    })[0]
-
-
-def property_loop_start():
-    from device.models import Device
-    from tag.models import Tag, TagTrack
-    from tag.services import run_callbacks
-
-    consumer = KafkaConsumer(bootstrap_servers=(
-        '124.70.129.107:9094',
-        '124.70.193.90:9094',
-        '124.70.217.193:9094 '
-    ))
-    topic = TopicPartition(topic='saveProps', partition=2)
-    consumer.assign([topic])
-    for msg in consumer:
-        try:
-            print('save prop req')
-            target: ConsumerRecord = msg
-            data = json.loads(target.value)
-            raw_tags = data['services'][0]['properties']['tags']
-            print(raw_tags)
-            if raw_tags is None:
-                tags = []
-            else:
-                tags = parse_tags_byte_stream(bytes.fromhex(raw_tags))
-                if tags is None:
-                    continue
-
-            try:
-                device = Device.objects.get(device_id=data['device_id'])
-            except Device.DoesNotExist:
-                print('Unknown device with ID: {}'.format(data['device_id']))
-                continue
 
-            event_time = parse(data['services'][0]['event_time'])
-
-            detected_tags = []
-            for tid, reader1_id, reader1_dis, reader2_id, reader2_dis, reader3_id, reader3_dis in tags:
-                reader1 = get_reader(reader1_id, device)
-                reader2 = get_reader(reader2_id, device)
-                reader3 = get_reader(reader3_id, device)
-
-                tag = Tag.objects.get_or_create(tid=tid, device=device, defaults={
-                    'name': 'TAG_' + str(tid)
-                })[0]
-                TagTrack.objects.create(
-                    tag=tag,
-
-                    reader1=reader1,
-                    distance1=reader1_dis,
-                    reader2=reader2,
-                    distance2=reader2_dis,
-                    reader3=reader3,
-                    distance3=reader3_dis,
-
-                    created=event_time
-                )
-                tag.is_online = True
-                tag.save()
-                detected_tags.append(tag.id)
-
-            # 存在性检测
-            # 规则：只检查active标签、active基站且原本online标签的存在性
-            invalid_tags = Tag.objects\
-                .filter(
-                    device=device,
-                    device__is_active=True,
-                    is_active=True,
-                    is_online=True
-                )\
-                .exclude(id__in=detected_tags)
-            invalid_tags_all = list(invalid_tags.all())
-            invalid_tags.update(is_online=False)
-            for tag in invalid_tags_all:
-                print('Callback run: Tag {}'.format(tag))
-                run_callbacks(tag, 'lost_signal')
-
-        except (TypeError, KeyError, json.JSONDecodeError):
-            print('Malformed data: {}'.format(msg))
+def parse_device_status_message(msg: Record):
+    """
+    云端推送的设备状态变化（resource 为 device.status），返回 (device_id, 是否在线)，其他消息返回 None
+    """
+    try:
+        data = json.loads(msg.value)
+        if data.get('resource') != 'device.status':
+            return None
+        notify_data = data['notify_data']
+        return notify_data['header']['device_id'], notify_data['body']['status'] == 'ONLINE'
+    except (TypeError, KeyError, ValueError, AttributeError):
+        print('Malformed data: {}'.format(msg))
+        return None
+
+
+def print_stats(state):
+    from device.status import device_status
+    from intellikeeper_api.daemon_settings import DaemonSettings
+    from tag.cache import identity_cache
+    from tag.event_sink import event_sink
+    from tag.track_gate import track_write_gate
+
+    if time.monotonic() - state['stats_printed'] < DaemonSettings.stats_interval:
+        return
+    print('Identity cache stats: {}'.format(identity_cache.stats()))
+    print('Callback dispatcher stats: {}'.format(state['dispatcher'].stats()))
+    print('Alert gate stats: {}'.format(state['dispatcher'].gate.stats()))
+    print('Track write gate stats: {}'.format(track_write_gate.stats()))
+    print('Event sink stats: {}'.format(event_sink.stats()))
+    print('Device status stats: {}'.format(device_status.stats()))
+    if 'detector' in state:
+        print('Staleness detector stats: {}'.format(state['detector'].stats()))
+    state['stats_printed'] = time.monotonic()
+
+
+def start_callbacks():
+    from intellikeeper_api.daemon_settings import DaemonSettings
+    from tag.alert_gate import get_alert_gate
+    from tag.dispatch import CallbackDispatcher
+    from tag.event_sink import event_sink
+
+    event_sink.start(DaemonSettings.event_batch_size, DaemonSettings.event_flush_interval,
+                     DaemonSettings.event_max_buffered)
+    dispatcher = CallbackDispatcher(DaemonSettings.callback_workers, DaemonSettings.callback_queue_size,
+                                    get_alert_gate())
+    dispatcher.start()
+    return {
+        'stats_printed': time.monotonic(),
+        'dispatcher': dispatcher
+    }
+
+
+def init_worker():
+    from tag.cache import identity_cache
+    from tag.presence import presence_engine
+
+    identity_cache.warm_up()
+    presence_engine.load()
+    return start_callbacks()
+
+
+def shutdown_worker(state):
+    from tag.event_sink import event_sink
+    from tag.webhook import close_webhook_transport
+
+    # 退出前把已入队的回调执行完，再写入缓冲中的事件
+    state['dispatcher'].drain()
+    print('Callback dispatcher drained: {}'.format(state['dispatcher'].stats()))
+    event_sink.close()
+    print('Event sink flushed: {}'.format(event_sink.stats()))
+    close_webhook_transport()
 
 
-def watch_config_sync_req():
+def handle_props(batch, state):
+    from device.status import device_status
+    from tag.cache import identity_cache
+    from tag.ingest import ingest_reports
+
+    print('save prop req x{}'.format(len(batch)))
+    messages = [message for message in map(parse_props_message, batch) if message is not None]
+
+    devices = identity_cache.get_devices(device_id for device_id, _, _ in messages)
+    reports = []
+    for device_id, event_time, tags in messages:
+        if device_id not in devices:
+            print('Unknown device with ID: {}'.format(device_id))
+            continue
+        reports.append((devices[device_id], event_time, tags))
+
+    for device_id, tag_ids, online_count in ingest_reports(reports):
+        state['dispatcher'].enqueue_lost(device_id, tag_ids, online_count)
+    # 正在上报的基站必然在线
+    device_status.set_many({device_id: True for device_id in devices})
+
+    print_stats(state)
+
+
+def handle_config_sync_req(batch, state):
     from device.iot import tag_sync_conf
-    from tag.models import Tag
-
-    consumer = KafkaConsumer(bootstrap_servers=(
-        '124.70.129.107:9094',
-        '124.70.193.90:9094',
-        '124.70.217.193:9094 '
-    ))
-    topic = TopicPartition(topic='watchConfigSyncReq', partition=2)
-    consumer.assign([topic])
-    for msg in consumer:
+    from tag.cache import identity_cache
+
+    for msg in batch:
         try:
             print(msg)
             print('conf sync req')
-            target: ConsumerRecord = msg
-            data = json.loads(target.value)
+            data = json.loads(msg.value)
             tid, = struct.unpack('>H', bytearray(data['data'][1:], 'ascii'))
-            try:
-                tag = Tag.objects.get(tid=tid)
-            except Tag.DoesNotExist:
+            # 下发的配置必须是最新的，不使用可能过期的缓存
+            tag = identity_cache.fetch_tag(tid)
+            if tag is None:
                 continue
 
             tag_sync_conf(tag)
 
-        except (TypeError, KeyError, json.JSONDecodeError):
+        except (TypeError, KeyError, ValueError, struct.error):
             print('Malformed data: {}'.format(msg))
 
 
-def watch_sensor_exception():
-    from tag.models import Tag
-    from tag.services import run_callbacks
-
-    consumer = KafkaConsumer(bootstrap_servers=(
-        '124.70.129.107:9094',
-        '124.70.193.90:9094',
-        '124.70.217.193:9094 '
-    ))
-    topic = TopicPartition(topic='sensorException', partition=2)
-    consumer.assign([topic])
-    mapping = {
-        0: 'unmask',
-        1: 'moved'
-    }
-    for msg in consumer:
+SENSOR_EXCEPTION_EVENTS = {
+    0: 'unmask',
+    1: 'moved'
+}
+
+
+def handle_sensor_exception(batch, state):
+    from tag.cache import identity_cache
+
+    for msg in batch:
         try:
             print('sensor exception req')
-            target: ConsumerRecord = msg
-            data = json.loads(target.value)
+            data = json.loads(msg.value)
             tid, event_type = struct.unpack('>HB', bytearray(data['data'][1:], 'ascii'))
-            try:
-                tag = Tag.objects.get(tid=tid)
-            except Tag.DoesNotExist:
+            tag = identity_cache.get_tag(tid)
+            if tag is None:
                 continue
-            print('Callback run: Tag {}'.format(tag))
-            run_callbacks(tag, mapping[event_type])
+            state['dispatcher'].enqueue(tag.id, SENSOR_EXCEPTION_EVENTS[event_type])
 
-        except (TypeError, KeyError, json.JSONDecodeError):
+        except (TypeError, KeyError, ValueError, struct.error):
             print('Malformed data: {}'.format(msg))
 
 
+def handle_device_status(batch, state):
+    from device.status import device_status
+
+    device_status.set_many(dict(message for message in map(parse_device_status_message, batch)
+                                if message is not None))
+
+
+def start_status_poller():
+    from device.status import device_status
+
+    stopped = threading.Event()
+    poller = threading.Thread(target=device_status.poll, args=(stopped, ), name='device-status-poller')
+    poller.start()
+    return {
+        'status_stopped': stopped,
+        'status_poller': poller
+    }
+
+
+def stop_status_poller(state):
+    from device.status import device_status
+
+    state['status_stopped'].set()
+    state['status_poller'].join()
+    device_status.shutdown()
+
+
+def sweep_staleness(detector, dispatcher, stopped):
+    from django.db import close_old_connections
+
+    from intellikeeper_api.daemon_settings import DaemonSettings
+    from tag.staleness import LeaderLock
+
+    lock = LeaderLock(DaemonSettings.staleness_leader_key, DaemonSettings.staleness_leader_lease)
+    while not stopped.wait(DaemonSettings.staleness_tick):
+        try:
+            # 只回收 sweep 用的连接，advisory lock 在 LeaderLock 自己的连接上
+            close_old_connections()
+            if not lock.acquire():
+                # 非 leader 只推进时间轮，接管时不会重复判定之前已由 leader 处理过的超时
+                detector.advance()
+                continue
+            lost, offline = detector.sweep()
+            for device_id, tag_ids, online_count in lost:
+                dispatcher.enqueue_lost(device_id, tag_ids, online_count)
+            for device_id in offline:
+                dispatcher.enqueue_device(device_id, 'device_offline')
+        except Exception:
+            traceback.print_exc()
+    lock.release()
+
+
+def start_staleness(dispatcher):
+    from intellikeeper_api.daemon_settings import DaemonSettings
+    from tag.staleness import StalenessDetector
+
+    detector = StalenessDetector(DaemonSettings.tag_offline_timeout, DaemonSettings.device_offline_timeout,
+                                 DaemonSettings.staleness_tick, DaemonSettings.staleness_slots)
+    detector.load()
+    stopped = threading.Event()
+    sweeper = threading.Thread(target=sweep_staleness, args=(detector, dispatcher, stopped), name='staleness-sweeper')
+    sweeper.start()
+    return {
+        'detector': detector,
+        'staleness_stopped': stopped,
+        'staleness_sweeper': sweeper
+    }
+
+
+def stop_staleness(state):
+    state['staleness_stopped'].set()
+    state['staleness_sweeper'].join()
+
+
+def init_staleness():
+    state = start_callbacks()
+    state.update(start_staleness(state['dispatcher']))
+    return state
+
+
+def shutdown_staleness(state):
+    stop_staleness(state)
+    shutdown_worker(state)
+
+
+def handle_staleness(batch, state):
+    for message in map(parse_props_message, batch):
+        if message is None:
+            continue
+        device_id, _, tags = message
+        # 以收到消息的时间作为最后出现时间，积压消息的 event_time 不代表标签现在仍在线
+        state['detector'].observe(device_id, {frame[0] for frame in tags})
+
+    print_stats(state)
+
+
+def run_topic(broker, topic, handler, batch_size=1, linger_ms=0):
+    from intellikeeper_api.daemon_settings import DaemonSettings
+
+    conf = DaemonSettings.topics[topic]
+    pool = TopicWorkerPool(
+        topic,
+        handler,
+        init=init_worker,
+        shutdown=shutdown_worker,
+        workers=conf['workers'],
+        batch_size=batch_size,
+        linger_ms=linger_ms,
+        queue_size=DaemonSettings.worker_queue_size
+    )
+    pool.run(broker, conf['partitions'])
+
+
+def property_loop_start(broker):
+    from intellikeeper_api.daemon_settings import DaemonSettings
+
+    run_topic(broker, 'saveProps', handle_props,
+              DaemonSettings.props_batch_size, DaemonSettings.props_batch_linger_ms)
+
+
+def watch_config_sync_req(broker):
+    run_topic(broker, 'watchConfigSyncReq', handle_config_sync_req)
+
+
+def watch_sensor_exception(broker):
+    run_topic(broker, 'sensorException', handle_sensor_exception)
+
+
+def watch_staleness(broker):
+    from intellikeeper_api.daemon_settings import DaemonSettings
+
+    # 失联检测的状态在一个进程内，不按基站分 worker；
+    # 判定由持有锁的一个实例完成，它必须看到所有基站的上报，所以总是直接指定 saveProps 的全部分区，不参与消费组的分配
+    pool = TopicWorkerPool(
+        'saveProps',
+        handle_staleness,
+        init=init_staleness,
+        shutdown=shutdown_staleness,
+        batch_size=DaemonSettings.props_batch_size,
+        linger_ms=DaemonSettings.props_batch_linger_ms,
+        queue_size=DaemonSettings.worker_queue_size
+    )
+    pool.run(broker, broker.partitions('saveProps'))
+
+
+def watch_device_status(broker):
+    from intellikeeper_api.daemon_settings import DaemonSettings
+
+    # 状态推送与后台轮询都只写缓存，一个 worker 即可
+    pool = TopicWorkerPool(
+        'deviceStatus',
+        handle_device_status,
+        init=start_status_poller,
+        shutdown=stop_status_poller,
+        workers=DaemonSettings.topics['deviceStatus']['workers'],
+        queue_size=DaemonSettings.worker_queue_size
+    )
+    pool.run(broker, DaemonSettings.topics['deviceStatus']['partitions'])
+
+
+async def run_async(broker, staleness_broker):
+    from intellikeeper_api.daemon_settings import DaemonSettings
+
+    runtime = AsyncRuntime(broker, DaemonSettings.async_max_threads, DaemonSettings.worker_queue_size)
+    # SIGTERM 时停止读取，各 topic 处理完已读取的消息后返回，再走下面的 finally 收尾
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, runtime.stop)
+    state = await runtime.call(init_worker)
+    staleness_state = dict(state, **await runtime.call(start_staleness, state['dispatcher']))
+    status_state = await runtime.call(start_status_poller)
+    topics = (
+        ('saveProps', handle_props, DaemonSettings.props_batch_size, DaemonSettings.props_batch_linger_ms),
+        ('watchConfigSyncReq', handle_config_sync_req, 1, 0),
+        ('sensorException', handle_sensor_exception, 1, 0),
+        ('deviceStatus', handle_device_status, 1, 0)
+    )
+    try:
+        await asyncio.gather(*(
+            runtime.run_topic(
+                topic,
+                handler,
+                state,
+                partitions=DaemonSettings.topics[topic]['partitions'],
+                concurrency=DaemonSettings.topics[topic]['concurrency'],
+                batch_size=batch_size,
+                linger_ms=linger_ms
+            ) for topic, handler, batch_size, linger_ms in topics
+        ), runtime.run_topic(
+            'saveProps',
+            handle_staleness,
+            staleness_state,
+            partitions=staleness_broker.partitions('saveProps'),
+            batch_size=DaemonSettings.props_batch_size,
+            linger_ms=DaemonSettings.props_batch_linger_ms,
+            broker=staleness_broker
+        ))
+    finally:
+        await runtime.call(stop_status_poller, status_state)
+        await runtime.call(stop_staleness, staleness_state)
+        await runtime.call(shutdown_worker, state)
+        runtime.shutdown()
+
+
 def main():
+    from intellikeeper_api.daemon_settings import DaemonSettings
+
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'intellikeeper_api.settings')
     django.setup()
 
+    from tag.cache import is_shared_cache
+    if not is_shared_cache():
+        print('Warning: CACHES is process-local, identity cache invalidation from the API only takes effect '
+              'after the TTL expires; configure redis or memcached')
+
+    broker = get_broker()
+    staleness_broker = get_broker(DaemonSettings.staleness_group_id)
+    if DaemonSettings.runtime == 'asyncio':
+        asyncio.run(run_async(broker, staleness_broker))
+        return
+
     detectors = {
-        Process(target=property_loop_start),
-        Process(target=watch_config_sync_req),
-        Process(target=watch_sensor_exception)
+        Process(target=property_loop_start, args=(broker,)),
+        Process(target=watch_config_sync_req, args=(broker,)),
+        Process(target=watch_sensor_exception, args=(broker,)),
+        Process(target=watch_staleness, args=(staleness_broker,)),
+        Process(target=watch_device_status, args=(broker,))
     }
     for detector in detectors:
         detector.start()
+
+    def terminate(signum, frame):
+        # 转发给各 topic 的进程，由它们通知自己的 worker 处理完已分发的消息后退出
+        for detector in detectors:
+            detector.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
     for detector in detectors:
         detector.join()
 
@@ -1,6 +1,8 @@
 import json
 import logging
+import os
 import struct
+import threading
 
 from huaweicloudsdkcore.auth.credentials import BasicCredentials
 from huaweicloudsdkcore.client import ClientBuilder
@@ -10,12 +12,17 @@ from huaweicloudsdkiotda.v5 import IoTDAClient, ShowDeviceRequest, ShowDeviceRes
     CreateCommandResponse
 
 from device.models import Device
+from intellikeeper_api.device_settings import DeviceSettings
 from intellikeeper_api.hwyun_settings import HwyunSettings
 from tag.models import Tag, Reader
 
 
-def get_iot_client():
-    config = HttpConfig.get_default_config()
+def build_iot_client():
+    config = HttpConfig(
+        timeout=(DeviceSettings.iot_connect_timeout, DeviceSettings.iot_read_timeout),
+        pool_connections=DeviceSettings.iot_pool_connections,
+        pool_maxsize=DeviceSettings.iot_pool_maxsize
+    )
     credentials = BasicCredentials(HwyunSettings.access_key_id, HwyunSettings.access_key_secret, HwyunSettings.project_id, HwyunSettings.domain_id)
     builder: ClientBuilder = IoTDAClient().new_builder(IoTDAClient)
     client: IoTDAClient = builder.with_http_config(config) \
@@ -26,6 +33,55 @@ def get_iot_client():
     return client
 
 
+class IoTClientProvider:
+    """
+    进程内共享一个 IoTDA 客户端：首次使用时构建，之后所有线程复用同一个 HTTP 连接池
+    连接不能跨进程共用，fork 出的子进程（守护进程的 worker）中丢弃继承来的客户端，下次使用时重建
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._client = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def get(self):
+        client = self._client
+        if client is not None and self._pid == os.getpid():
+            return client
+        with self._lock:
+            if self._pid != os.getpid():
+                self._client, self._pid = None, os.getpid()
+            if self._client is None:
+                self._client = self.factory()
+            return self._client
+
+    def reset(self):
+        with self._lock:
+            self._client, self._pid = None, os.getpid()
+
+    def _after_fork(self):
+        # fork 时可能有其他线程持有锁，子进程中换一把新锁
+        self._lock = threading.Lock()
+        self._client, self._pid = None, os.getpid()
+
+
+iot_client_provider = IoTClientProvider(build_iot_client)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=iot_client_provider._after_fork)
+
+
+def get_iot_client():
+    return iot_client_provider.get()
+
+
+def reset_iot_client():
+    """
+    丢弃当前进程的共享客户端（例如修改了云端配置之后），下次使用时重建
+    """
+    iot_client_provider.reset()
+
+
 def check_base_online(device_id):
     client = get_iot_client()
     res: ShowDeviceResponse = client.show_device(ShowDeviceRequest(device_id=device_id))
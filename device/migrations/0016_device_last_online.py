@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0015_auto_20200708_0437'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='last_online',
+            field=models.BooleanField(default=False, verbose_name='最后已知在线状态'),
+        ),
+    ]
@@ -19,6 +19,8 @@ class Device(models.Model):
     is_active = models.BooleanField(verbose_name='是否激活', default=False)
     created = models.DateTimeField(verbose_name='新建时间', auto_now_add=True)
     device_id = models.CharField(verbose_name='华为云设备ID', max_length=128, unique=True)
+    # 实时在线状态在缓存中（device.status），这里只记录最后一次得知的状态，缓存缺失时作为回退
+    last_online = models.BooleanField(verbose_name='最后已知在线状态', default=False)
 
     map_picture = models.ImageField(verbose_name='地图', height_field='map_picture_h', width_field='map_picture_w', upload_to=get_image_upload_path, null=True, default=None)
     map_picture_w = models.PositiveIntegerField(verbose_name='地图宽度', default=0)
@@ -2,6 +2,7 @@ from rest_framework import serializers
 
 from device.iot import check_base_online
 from device.models import Device
+from device.status import device_status
 from intellikeeper_api.shortcodes import INTELLIKEEPER_BASE_SHORT_CODES
 
 
@@ -50,4 +51,8 @@ class FullDeviceSerializer(DeviceSerializer):
         )
 
     def get_is_online(self, device: Device):
-        return check_base_online(device.device_id)
+        # 只读状态缓存，列表视图在 context['statuses'] 中一次取好；缓存中没有时为最后已知的状态，由后台补查
+        statuses = self.context.get('statuses')
+        if statuses is not None and device.device_id in statuses:
+            return statuses[device.device_id]
+        return device_status.get(device.device_id)
@@ -0,0 +1,165 @@
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.db import close_old_connections
+from huaweicloudsdkiotda.v5 import ShowDeviceRequest
+
+from device.iot import get_iot_client
+from device.models import Device
+from intellikeeper_api.device_settings import DeviceSettings
+
+
+class DeviceStatusService:
+    """
+    基站在线状态缓存：值为 True / False，存放在 Django 缓存中，ttl 秒后过期
+    写入来源：后台轮询（线程池并发 show_device）、saveProps 上报（视为在线）、云端推送的设备状态变化
+    状态变化（或缓存过期后重新写入）时同时记入 Device.last_online
+    读取只查缓存，不会等待云端；缓存中没有的基站取数据库中最后已知的状态，并在后台线程中补查
+    client_factory 返回带 show_device(request) 的线程安全客户端（默认为进程内共享的 IoTDA 客户端），测试时可替换为假的客户端
+    """
+
+    def __init__(self, client_factory=None, ttl=DeviceSettings.status_ttl, workers=DeviceSettings.status_poll_workers,
+                 key_prefix=DeviceSettings.status_key_prefix):
+        self.client_factory = client_factory or get_iot_client
+        self.ttl = ttl
+        self.workers = workers
+        self.key_prefix = key_prefix
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+        self.fetched = 0
+        self.failures = 0
+        self.pushed = 0
+
+    def key(self, device_id):
+        return '{}{}'.format(self.key_prefix, device_id)
+
+    def get(self, device_id):
+        return self.get_many((device_id, ))[device_id]
+
+    def get_many(self, device_ids):
+        """
+        返回 {device_id: True / False}，一次缓存读取，缓存缺失时再查一次数据库
+        """
+        device_ids = list(device_ids)
+        found = cache.get_many([self.key(device_id) for device_id in device_ids])
+        result = {device_id: found.get(self.key(device_id)) for device_id in device_ids}
+        missing = [device_id for device_id, online in result.items() if online is None]
+        if missing:
+            result.update(dict.fromkeys(missing, False))
+            result.update(Device.objects.filter(device_id__in=missing).values_list('device_id', 'last_online'))
+            self.request_refresh(missing)
+        return result
+
+    def set(self, device_id, online):
+        self.set_many({device_id: online})
+
+    def set_many(self, statuses):
+        if statuses:
+            self._store(statuses)
+            self.pushed += len(statuses)
+
+    def _store(self, statuses):
+        """
+        写入缓存；与缓存中原来的值不同（或原来没有）的基站同时更新 Device.last_online
+        """
+        keys = {self.key(device_id): device_id for device_id in statuses}
+        previous = cache.get_many(list(keys))
+        cache.set_many({key: bool(statuses[device_id]) for key, device_id in keys.items()}, self.ttl)
+        changed = {}
+        for key, device_id in keys.items():
+            online = bool(statuses[device_id])
+            if previous.get(key) != online:
+                changed.setdefault(online, []).append(device_id)
+        for online, changed_ids in changed.items():
+            Device.objects.filter(device_id__in=changed_ids).exclude(last_online=online).update(last_online=online)
+
+    def fetch(self, device_id):
+        """
+        向云端查询一个基站的状态并写入缓存，失败时返回 None
+        在线程池中执行，用完即归还数据库连接
+        """
+        try:
+            online = self.client_factory().show_device(ShowDeviceRequest(device_id=device_id)).status == 'ONLINE'
+        except Exception as e:
+            self.failures += 1
+            print('Failed to fetch status of device {}: {}'.format(device_id, e))
+            return None
+        try:
+            self._store({device_id: online})
+        finally:
+            close_old_connections()
+        self.fetched += 1
+        return online
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='device-status')
+            return self._executor
+
+    def refresh(self, device_ids):
+        """
+        并发查询这些基站并等待全部完成，返回 {device_id: True / False / None}
+        """
+        device_ids = list(device_ids)
+        return dict(zip(device_ids, self.executor().map(self.fetch, device_ids)))
+
+    def request_refresh(self, device_ids):
+        """
+        在后台补查，不等待结果；已在查询中的基站不重复提交
+        """
+        with self._lock:
+            device_ids = [device_id for device_id in device_ids if device_id not in self._pending]
+            self._pending.update(device_ids)
+        for device_id in device_ids:
+            self.executor().submit(self._refresh_pending, device_id)
+
+    def _refresh_pending(self, device_id):
+        try:
+            self.fetch(device_id)
+        finally:
+            with self._lock:
+                self._pending.discard(device_id)
+
+    def poll(self, stopped: threading.Event, interval=DeviceSettings.status_poll_interval):
+        """
+        每 interval 秒刷新一次所有基站的状态，直到 stopped 被设置
+        """
+        while True:
+            close_old_connections()
+            try:
+                self.refresh(Device.objects.values_list('device_id', flat=True))
+            except Exception:
+                traceback.print_exc()
+            if stopped.wait(interval):
+                return
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _after_fork(self):
+        # 线程池的线程不会被 fork 到子进程中
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = set()
+
+    def stats(self):
+        return {
+            'fetched': self.fetched,
+            'failures': self.failures,
+            'pushed': self.pushed,
+            'pending': len(self._pending)
+        }
+
+
+device_status = DeviceStatusService()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=device_status._after_fork)
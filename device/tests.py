@@ -1 +1,53 @@
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TransactionTestCase
+
+from device.models import Device
+from device.status import DeviceStatusService
+from user.models import User
+
+
+class FakeClient:
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    def show_device(self, request):
+        return type('ShowDeviceResponse', (), {'status': self.statuses[request.device_id]})()
+
+
+class DeviceStatusTest(TransactionTestCase):
+    # 后台补查在线程池中写库，需要真正提交的数据
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(mobile='+8613800000000')
+        Device.objects.create(device_id='device-online', belongs_to=user)
+        Device.objects.create(device_id='device-offline', belongs_to=user)
+        self.statuses = {'device-online': 'ONLINE', 'device-offline': 'OFFLINE'}
+        self.service = DeviceStatusService(client_factory=lambda: FakeClient(self.statuses), ttl=60, workers=2,
+                                           key_prefix='test:device:status:')
+
+    def tearDown(self):
+        self.service.shutdown()
+        cache.clear()
+
+    def last_online(self):
+        return dict(Device.objects.values_list('device_id', 'last_online'))
+
+    def test_miss_falls_back_to_last_known(self):
+        self.service.set_many({'device-online': True, 'device-offline': False})
+        self.assertEqual(self.last_online(), {'device-online': True, 'device-offline': False})
+
+        # 缓存过期后先返回数据库中最后已知的状态，不会是 None
+        cache.clear()
+        self.statuses['device-online'] = 'OFFLINE'
+        self.assertEqual(self.service.get_many(['device-online', 'device-offline', 'device-unknown']),
+                         {'device-online': True, 'device-offline': False, 'device-unknown': False})
+
+        # 后台补查完成后缓存与数据库都是云端的新状态
+        self.service.shutdown()
+        self.assertEqual(self.service.get('device-online'), False)
+        self.assertEqual(self.last_online(), {'device-online': False, 'device-offline': False})
+
+    def test_unchanged_status_does_not_write(self):
+        self.service.set('device-online', True)
+        with self.assertNumQueries(0):
+            self.service.set('device-online', True)
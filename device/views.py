@@ -5,6 +5,7 @@ from rest_framework.response import Response
 from device.models import Device
 from device.serializers import DeviceSerializer, FullDeviceSerializer
 from device.services import call_device
+from device.status import device_status
 
 
 class DeviceViewset(viewsets.ModelViewSet):
@@ -14,6 +15,13 @@ class DeviceViewset(viewsets.ModelViewSet):
     def get_queryset(self):
         return Device.objects.filter(belongs_to=self.request.user)
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            # 所有基站的在线状态一次从缓存读取
+            context['statuses'] = device_status.get_many(self.get_queryset().values_list('device_id', flat=True))
+        return context
+
     def perform_create(self, serializer):
         serializer.save(belongs_to=self.request.user)
 
@@ -0,0 +1,18 @@
+class AlertSettings:
+    # 同一标签的同一事件在窗口（秒）内只触发一次回调，窗口内的重复事件被丢弃
+    suppression_windows = {
+        'lost_signal': 300,
+        'moved': 60,
+        'unmask': 60,
+        'device_offline': 600,
+        'mass_lost_signal': 600
+    }
+    default_suppression_window = 60
+
+    # 原本在线的标签连续多少次上报中缺席才判定信号丢失，避免单帧丢失造成在线 / 离线反复跳变
+    offline_miss_threshold = 3
+
+    # 一个基站一次丢失至少 mass_lost_min_tags 个标签，且占原本在线标签的比例不低于 mass_lost_ratio 时，
+    # 只发出一条基站级的 mass_lost_signal，不再逐个标签触发 lost_signal
+    mass_lost_min_tags = 5
+    mass_lost_ratio = 0.5
@@ -0,0 +1,8 @@
+class CacheSettings:
+    # 回调解析索引：每个标签的冒泡回调计划、每个作用目标的触发器列表
+    callback_index_size = 50000
+    callback_index_ttl = 600
+
+    # 编译后的触发器模板，按 (trigger.id, trigger.updated) 缓存
+    trigger_template_cache_size = 10000
+    trigger_template_cache_ttl = 3600
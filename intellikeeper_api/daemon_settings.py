@@ -0,0 +1,64 @@
+class DaemonSettings:
+    kafka_bootstrap_servers = (
+        '124.70.129.107:9094',
+        '124.70.193.90:9094',
+        '124.70.217.193:9094'
+    )
+
+    # saveProps 批量入库：单批最多消息数，以及收到首条消息后最多等待多久（毫秒）凑批
+    props_batch_size = 100
+    props_batch_linger_ms = 200
+
+    # 基站 / 阅读器 / 标签身份缓存：每类最多缓存条数与过期时间（秒）
+    identity_cache_size = 100000
+    identity_cache_ttl = 600
+
+    # 在线状态内存副本按基站重新从数据库加载的间隔（秒）
+    presence_resync_interval = 300
+
+    # 运行统计（缓存命中、回调队列背压等）的打印间隔（秒）
+    stats_interval = 300
+
+    # 回调派发：每个 worker 中执行回调的线程数与队列上限，队列满时入库流程阻塞等待
+    callback_workers = 4
+    callback_queue_size = 10000
+
+    # 事件批量写入：攒满多少条或间隔多少秒写一次库
+    event_batch_size = 200
+    event_flush_interval = 1.0
+    # 写库失败的事件留在缓冲中重试，超过上限时丢弃最早的
+    event_max_buffered = 20000
+
+    # 'kafka'，或 'file'：离线测试时读取 file_broker_root/<topic>.jsonl
+    broker = 'kafka'
+    file_broker_root = 'broker'
+    # partitions 为 None 的 topic 加入该消费组，由 Kafka 分配分区
+    kafka_group_id = 'intellikeeper-daemon'
+
+    # 各 topic 读取的分区与 worker 进程数（asyncio 模式下为并发通道数 concurrency），
+    # 同一基站的消息固定交给同一个 worker / 通道
+    topics = {
+        'saveProps': {'partitions': (2,), 'workers': 4, 'concurrency': 4},
+        'watchConfigSyncReq': {'partitions': (2,), 'workers': 1, 'concurrency': 4},
+        'sensorException': {'partitions': (2,), 'workers': 1, 'concurrency': 2},
+        # 云端推送的设备状态变化（需在 IoTDA 数据转发中配置 device.status 事件），写入基站状态缓存（见 device.status）
+        'deviceStatus': {'partitions': (2,), 'workers': 1, 'concurrency': 1}
+    }
+    worker_queue_size = 1000
+
+    # 'process'：每个 topic 一组 worker 进程；'asyncio'：所有 topic 共用一个事件循环
+    runtime = 'process'
+    # asyncio 模式下执行 ORM / 云端 SDK 调用的线程池大小
+    async_max_threads = 16
+
+    # 失联检测：标签 / 基站超过多少秒没有出现在 saveProps 上报中即判定信号丢失 / 离线
+    tag_offline_timeout = 120
+    device_offline_timeout = 300
+    # 时间轮的刻度（秒）与槽位数，也是检测的执行间隔
+    staleness_tick = 1.0
+    staleness_slots = 512
+    # 失联检测单独使用一个消费组读取 saveProps 的全部分区（不随入库的配置分摊），不影响入库的消费位移；
+    # 多个实例中只有持有该锁的一个执行判定
+    staleness_group_id = 'intellikeeper-daemon-staleness'
+    staleness_leader_key = 'tag:staleness:leader'
+    staleness_leader_lease = 30
@@ -0,0 +1,16 @@
+class DeviceSettings:
+    # 基站在线状态缓存（见 device.status）的过期时间（秒）；缓存需为各进程共享的后端（如 Redis），
+    # 由守护进程写入，接口进程读取
+    status_ttl = 180
+    status_key_prefix = 'device:status:'
+
+    # 后台轮询所有基站状态的间隔（秒）与并发查询云端的线程数
+    status_poll_interval = 60
+    status_poll_workers = 8
+
+    # 共享的 IoTDA 客户端（见 device.iot）：连接池数量与每个池的最大连接数（不小于同时调用云端的线程数），
+    # 以及连接、读取超时（秒）
+    iot_pool_connections = 4
+    iot_pool_maxsize = 16
+    iot_connect_timeout = 5
+    iot_read_timeout = 30
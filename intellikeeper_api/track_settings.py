@@ -0,0 +1,29 @@
+class TrackSettings:
+    # 标签轨迹保留的天数，更早的数据由 rotate_tracks 命令删除或归档
+    retention_days = 90
+
+    # PostgreSQL 上 TagTrack 按月分区，rotate_tracks 预先创建之后多少个月的分区
+    partitions_ahead = 2
+
+    # 非分区数据库（SQLite）上按批删除过期轨迹，每批行数
+    prune_batch_size = 10000
+
+    # 早于多少天的轨迹由 archive_tracks 移出热表，写入按基站、按天分段的列式归档（root 下）
+    archive_after_days = 30
+    archive_root = 'track_archive'
+
+    # 帧中的阅读器距离换算为地图坐标单位的比例，用于三边定位
+    distance_scale = 1.0
+
+    # 入库时的轨迹平滑（匀速模型卡尔曼滤波）：过程噪声（加速度方差）、观测噪声方差的下限，
+    # 以及同一标签相邻两次观测间隔超过多少秒时重新开始滤波
+    smoothing_process_noise = 0.01
+    smoothing_measurement_noise = 2.0
+    smoothing_max_gap = 300
+
+    # 轨迹写入门控：标签的阅读器组合不变、位置移动不到 write_gate_min_move（两个坐标轴上），
+    # 且距上次写入不到 write_gate_heartbeat 秒时不写入新的 TagTrack；关闭时每次上报都写入
+    # 开启后静止标签的轨迹只按心跳间隔记录，按轨迹条数统计停留、按最近几条轨迹取位置的用法会受影响，默认关闭
+    write_gate_enabled = False
+    write_gate_min_move = 2
+    write_gate_heartbeat = 300
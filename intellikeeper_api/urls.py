@@ -23,7 +23,7 @@ from intellikeeper_api import settings
 from tag.views import TagViewset, find_tag, change_tag_status, test_callback, \
     TriggerViewset, get_classified_tags, test_trigger, change_trigger_status, \
     CallbackView, get_tags_info, get_track, TagCategoryViewset, checkout_tags, ReaderViewset, get_events, \
-    get_events_top10
+    get_events_top10, get_trigger_stats, get_tag_positions
 
 router = routers.DefaultRouter()
 router.register(r'devices', DeviceViewset, basename='device')
@@ -39,12 +39,14 @@ urlpatterns = [
     path('tags/<int:pk>/change-status/', change_tag_status),
     path('tags/<int:pk>/test-callback/', test_callback),
     path('tags/track/', get_track),
+    path('tags/positions/', get_tag_positions),
     path('tags/classified/', get_classified_tags),
     path('tags/info/', get_tags_info),
     path('tags/checkout/', checkout_tags),
 
     path('triggers/<int:pk>/test-trigger/', test_trigger),
     path('triggers/<int:pk>/change-status/', change_trigger_status),
+    path('triggers/<int:pk>/stats/', get_trigger_stats),
     path('triggers/used/', CallbackView.as_view()),
 
     path('events/', get_events),
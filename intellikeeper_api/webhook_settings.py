@@ -0,0 +1,16 @@
+class WebhookSettings:
+    # 连接与读取超时（秒）
+    connect_timeout = 3
+    read_timeout = 10
+
+    # 每个目标主机保持的长连接数，以及同时发往同一主机的请求上限
+    pool_size = 10
+    max_per_host = 10
+
+    # 连接失败、超时、429 与 5xx 时的重试次数，第 n 次重试前等待 backoff * 2^(n-1) 秒；
+    # POST、PUT 等非幂等请求只在连接没有建立、429 与 503 时重试，读取超时与其他 5xx 不重试，避免重复送达
+    retries = 2
+    backoff = 0.5
+
+    # 触发器调用统计写入数据库的间隔（秒）
+    stats_flush_interval = 10
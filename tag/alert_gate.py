@@ -0,0 +1,66 @@
+import threading
+import time
+
+from intellikeeper_api.alert_settings import AlertSettings
+
+
+class AlertGate:
+    """
+    回调派发前的去抖与合并：
+    allow(kind, pk, event) 对同一对象的同一事件按抑制窗口去重；
+    collapse(lost, online_count) 判断一个基站一次丢失的标签是否多到应合并为一条基站级告警
+    """
+
+    def __init__(self, windows, default_window, mass_lost_min_tags, mass_lost_ratio):
+        self.windows = windows
+        self.default_window = default_window
+        self.mass_lost_min_tags = mass_lost_min_tags
+        self.mass_lost_ratio = mass_lost_ratio
+        self._fired = {}
+        self._lock = threading.Lock()
+
+        self.allowed = 0
+        self.suppressed = 0
+        self.collapsed = 0
+
+    def allow(self, kind, pk, event, now=None):
+        now = time.monotonic() if now is None else now
+        window = self.windows.get(event, self.default_window)
+        key = (kind, pk, event)
+        with self._lock:
+            fired = self._fired.get(key)
+            if fired is not None and now - fired < window:
+                self.suppressed += 1
+                return False
+            self._fired[key] = now
+            self.allowed += 1
+            # 顺带清理过期的记录，避免长期运行时无限增长
+            if self.allowed % 10000 == 0:
+                self._prune(now)
+            return True
+
+    def _prune(self, now):
+        longest = max([self.default_window] + list(self.windows.values()))
+        self._fired = {key: fired for key, fired in self._fired.items() if now - fired < longest}
+
+    def collapse(self, lost, online_count):
+        if len(lost) < self.mass_lost_min_tags or online_count <= 0:
+            return False
+        if len(lost) / online_count < self.mass_lost_ratio:
+            return False
+        with self._lock:
+            self.collapsed += len(lost)
+        return True
+
+    def stats(self):
+        return {
+            'tracked': len(self._fired),
+            'allowed': self.allowed,
+            'suppressed': self.suppressed,
+            'collapsed': self.collapsed
+        }
+
+
+def get_alert_gate():
+    return AlertGate(AlertSettings.suppression_windows, AlertSettings.default_suppression_window,
+                     AlertSettings.mass_lost_min_tags, AlertSettings.mass_lost_ratio)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TagConfig(AppConfig):
     name = 'tag'
     key_dead_tags = '%AFCY*A*&F&F^A^^V**A&AS*()(@#^#^#7*WAHH'
+
+    def ready(self):
+        import tag.signals  # noqa
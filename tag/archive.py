@@ -0,0 +1,174 @@
+import heapq
+import json
+import math
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from intellikeeper_api.track_settings import TrackSettings
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+NO_READER = -1
+
+# 每列一个定长数组；读取时按需 mmap，不把整段读进内存
+COLUMNS = (
+    ('id', np.int64),
+    ('tag', np.int32),
+    ('created', np.int64),  # 微秒时间戳（UTC）
+    ('reader1', np.int32),
+    ('distance1', np.float32),
+    ('reader2', np.int32),
+    ('distance2', np.float32),
+    ('reader3', np.int32),
+    ('distance3', np.float32),
+    ('x', np.float32),  # 未定位为 NaN
+    ('y', np.float32),
+    ('error', np.float32),
+    ('smoothed_x', np.float32),
+    ('smoothed_y', np.float32)
+)
+# 早期归档的段中没有的列，读取时按 NaN 补齐
+OPTIONAL_COLUMNS = ('x', 'y', 'error', 'smoothed_x', 'smoothed_y')
+
+
+# 热表按同样的列顺序取出，与归档中的行可以直接合并
+TRACK_FIELDS = ('id', 'tag_id', 'created', 'reader1_id', 'distance1', 'reader2_id', 'distance2', 'reader3_id',
+                'distance3', 'x', 'y', 'error', 'smoothed_x', 'smoothed_y')
+
+
+def to_micros(value: datetime):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def day_start(value: datetime):
+    value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+
+
+class TrackArchive:
+    """
+    冷轨迹归档：root/<基站ID>/<YYYYMMDD>/<列名>.npy，每个基站每天一段，段内按 (created, id) 排序
+    列使用窄类型（int32 / float32）定长存储，查询时 mmap 打开，按 created 二分查找时间范围
+    root/<基站ID>/meta.json 记录已归档到的时间，早于该时间的轨迹只在归档中
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def device_dir(self, device_id):
+        return os.path.join(self.root, str(device_id))
+
+    def segment_dir(self, device_id, day: datetime):
+        return os.path.join(self.device_dir(device_id), day.strftime('%Y%m%d'))
+
+    def archived_until(self, device_id):
+        try:
+            with open(os.path.join(self.device_dir(device_id), 'meta.json')) as f:
+                return from_micros(json.load(f)['archived_until'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set_archived_until(self, device_id, until: datetime):
+        current = self.archived_until(device_id)
+        if current is not None and current >= until:
+            return
+        path = os.path.join(self.device_dir(device_id), 'meta.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'archived_until': to_micros(until)}, f)
+        os.replace(path + '.tmp', path)
+
+    def load_segment(self, path, mmap=True):
+        segment = {}
+        for name, dtype in COLUMNS:
+            file = os.path.join(path, '{}.npy'.format(name))
+            if name in OPTIONAL_COLUMNS and not os.path.exists(file):
+                segment[name] = np.full(len(segment['id']), np.nan, dtype)
+                continue
+            segment[name] = np.load(file, mmap_mode='r' if mmap else None)
+        return segment
+
+    def write_segment(self, device_id, day: datetime, rows):
+        """
+        rows 为按 TRACK_FIELDS 排列的轨迹行 [(id, tag_id, created, reader1_id, distance1, ..., x, y, error), ...]
+        该天已有归档时合并，按 id 去重（归档写入后、热表删除前中断的情况下重跑会遇到重复行）
+        """
+        columns = {}
+        for offset, (name, dtype) in enumerate(COLUMNS):
+            if name == 'created':
+                values = (to_micros(row[offset]) for row in rows)
+            elif name.startswith('reader'):
+                values = (NO_READER if row[offset] is None else row[offset] for row in rows)
+            elif name in OPTIONAL_COLUMNS:
+                values = (np.nan if row[offset] is None else row[offset] for row in rows)
+            else:
+                values = (row[offset] for row in rows)
+            columns[name] = np.fromiter(values, dtype, len(rows))
+
+        path = self.segment_dir(device_id, day)
+        if os.path.isdir(path):
+            existing = self.load_segment(path, mmap=False)
+            columns = {name: np.concatenate((existing[name], columns[name])) for name, _ in COLUMNS}
+            _, unique = np.unique(columns['id'], return_index=True)
+            columns = {name: column[unique] for name, column in columns.items()}
+
+        order = np.lexsort((columns['id'], columns['created']))
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, column in columns.items():
+            np.save(os.path.join(tmp, '{}.npy'.format(name)), column[order])
+        # 整段替换，读取方不会看到写了一半的段
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+
+    def read(self, device_id, tag_ids, since: datetime, until: datetime = None):
+        """
+        按时间顺序返回 tag_ids 在 [since, until) 内的归档轨迹，每行按 TRACK_FIELDS 排列
+        """
+        until = until or datetime.now(timezone.utc)
+        lower, upper = to_micros(since), to_micros(until)
+        tag_ids = np.asarray(sorted(tag_ids), dtype=np.int32)
+
+        day = day_start(since)
+        while day < until:
+            path = self.segment_dir(device_id, day)
+            day += timedelta(days=1)
+            if not os.path.isdir(path):
+                continue
+            segment = self.load_segment(path)
+            start, stop = np.searchsorted(segment['created'], (lower, upper))
+            if start == stop:
+                continue
+            mask = np.isin(segment['tag'][start:stop], tag_ids)
+            columns = [segment[name][start:stop][mask].tolist() for name, _ in COLUMNS]
+            for row in zip(*columns):
+                yield (
+                    row[0], row[1], from_micros(row[2]),
+                    None if row[3] == NO_READER else row[3], row[4],
+                    None if row[5] == NO_READER else row[5], row[6],
+                    None if row[7] == NO_READER else row[7], row[8],
+                    *(None if math.isnan(value) else value for value in row[9:])
+                )
+
+
+def merge_tracks(*sources):
+    """
+    合并若干个已按 (created, id) 排好序的轨迹行序列；同一行在归档与热表中各有一份时只保留一份
+    """
+    last_id = None
+    for row in heapq.merge(*sources, key=lambda row: (row[2], row[0])):
+        if row[0] == last_id:
+            continue
+        last_id = row[0]
+        yield row
+
+
+track_archive = TrackArchive(TrackSettings.archive_root)
@@ -0,0 +1,310 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+
+from device.models import Device
+from intellikeeper_api.daemon_settings import DaemonSettings
+from tag.models import Tag, Reader, TagCategory
+
+_MISSING = object()
+
+# 只在当前进程内有效的缓存后端
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache'
+)
+
+
+def is_shared_cache(alias='default'):
+    """
+    CACHES 中的后端是否在多个进程之间共享
+    """
+    return settings.CACHES[alias]['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+# 按键失效的记录保留的秒数，进程超过这个时间没有检查代数时整体清空
+INVALIDATION_LOG_TTL = 3600
+# 一次检查最多回放的失效记录数，落后更多时整体清空
+INVALIDATION_LOG_MAX = 1000
+
+
+def bump_generation(generation_key, keys=None):
+    """
+    通知所有进程中使用该 generation_key 的缓存失效：keys 为 None 时整体清空，否则只丢弃这些键
+    代数是共享缓存中的计数器，按键失效时把键记在新的代数下，各进程检查时回放自己错过的记录
+    跨进程生效的前提是 CACHES 配置为共享后端（redis / memcached），否则只能依赖 TTL
+    """
+    try:
+        generation = shared_cache.incr(generation_key)
+    except ValueError:
+        # 计数器还不存在；并发创建时另一方已经 add 成功，再 incr 一次
+        generation = 1 if shared_cache.add(generation_key, 1, None) else shared_cache.incr(generation_key)
+    if keys is not None:
+        shared_cache.set('{}:{}'.format(generation_key, generation), list(keys), INVALIDATION_LOG_TTL)
+
+
+def read_invalidations(generation_key, previous, generation):
+    """
+    返回代数从 previous 变为 generation 期间按键失效的键列表；
+    无法确定（记录缺失、过期或者尚未写入，落后太多，或者其间有过整体失效）时返回 None，调用方应整体清空
+    """
+    if generation == previous:
+        return []
+    if not isinstance(previous, int) or not isinstance(generation, int) \
+            or not 0 < generation - previous <= INVALIDATION_LOG_MAX:
+        return None
+    names = ['{}:{}'.format(generation_key, n) for n in range(previous + 1, generation + 1)]
+    log = shared_cache.get_many(names)
+    if len(log) < len(names):
+        return None
+    return [key for keys in log.values() for key in keys]
+
+
+class LRUCache:
+    """
+    线程安全的 LRU + TTL 缓存，带命中统计
+    配置了 generation_key 时，每隔 generation_check_interval 秒检查一次共享的代数，
+    代数变化时丢弃期间各进程按键失效的条目，无法确定时整体清空（见 bump_generation）
+    """
+
+    def __init__(self, maxsize, ttl, generation_key=None, generation_check_interval=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation_key = generation_key
+        self.generation_check_interval = generation_check_interval
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._generation_checked = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _check_generation(self):
+        now = time.monotonic()
+        if self.generation_key is None or now - self._generation_checked < self.generation_check_interval:
+            return
+        self._generation_checked = now
+        generation = shared_cache.get(self.generation_key)
+        if generation == self._generation:
+            return
+        keys = read_invalidations(self.generation_key, self._generation, generation)
+        self._generation = generation
+        if keys is None:
+            self._data.clear()
+            return
+        for key in keys:
+            self._data.pop(key, None)
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+            if self.generation_key is not None:
+                self._generation = shared_cache.get(self.generation_key)
+                self._generation_checked = time.monotonic()
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._check_generation()
+            value, expires = self._data.get(key, (_MISSING, 0))
+            if value is _MISSING or expires < time.monotonic():
+                if value is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._check_generation()
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class IdentityCache:
+    """
+    守护进程用的基站 / 阅读器 / 标签身份缓存
+    devices: device_id -> Device
+    readers: (rid, device.id) -> (reader_id, x, y)
+    tags: tid -> Tag（已 select_related device）
+    三个缓存各有自己的代数，修改一个基站、阅读器或标签只在各进程中丢弃对应的键
+    """
+    generation_key_prefix = 'tag:identity-cache:generation:'
+
+    def __init__(self, maxsize, ttl):
+        self.devices = LRUCache(maxsize, ttl, self.generation_key_prefix + 'devices')
+        self.readers = LRUCache(maxsize, ttl, self.generation_key_prefix + 'readers')
+        self.tags = LRUCache(maxsize, ttl, self.generation_key_prefix + 'tags')
+
+    def warm_up(self):
+        for lru in (self.devices, self.readers, self.tags):
+            lru.reset()
+        for device in Device.objects.iterator():
+            self.devices.set(device.device_id, device)
+        for reader_id, rid, device_id, x, y in Reader.objects.values_list('id', 'rid', 'device_id', 'x', 'y') \
+                .iterator():
+            self.readers.set((rid, device_id), (reader_id, x, y))
+        for tag in Tag.objects.select_related('device').iterator():
+            self.tags.set(tag.tid, tag)
+
+    def get_devices(self, device_ids):
+        result = {}
+        missing = set()
+        for device_id in set(device_ids):
+            device = self.devices.get(device_id)
+            if device is None:
+                missing.add(device_id)
+            else:
+                result[device_id] = device
+        if missing:
+            for device in Device.objects.filter(device_id__in=missing):
+                self.devices.set(device.device_id, device)
+                result[device.device_id] = device
+        return result
+
+    def get_device(self, device_id):
+        return self.get_devices((device_id,)).get(device_id)
+
+    def get_readers(self, device: Device, rids):
+        """
+        返回 {rid: (reader_id, x, y)}，未缓存的阅读器一次查询取回，库中没有的会被创建
+        """
+        result = {}
+        missing = set()
+        for rid in set(rids):
+            reader = self.readers.get((rid, device.id))
+            if reader is None:
+                missing.add(rid)
+            else:
+                result[rid] = reader
+        if missing:
+            found = {rid: (reader_id, x, y) for rid, reader_id, x, y in Reader.objects.filter(
+                device=device, rid__in=missing).values_list('rid', 'id', 'x', 'y')}
+            if missing - found.keys():
+                Reader.objects.bulk_create([
+                    Reader(rid=rid, device=device, x=0, y=0, name='READER_{}'.format(rid))
+                    for rid in missing - found.keys()
+                ], ignore_conflicts=True)
+                found.update({rid: (reader_id, x, y) for rid, reader_id, x, y in Reader.objects.filter(
+                    device=device, rid__in=missing - found.keys()).values_list('rid', 'id', 'x', 'y')})
+            for rid, reader in found.items():
+                self.readers.set((rid, device.id), reader)
+            result.update(found)
+        return result
+
+    def get_tags(self, device: Device, tids, create=True):
+        """
+        返回 {tid: Tag}，只包含属于该基站的标签；create 为 True 时库中没有的标签会被创建
+        """
+        result = {}
+        missing = set()
+        for tid in set(tids):
+            tag = self.tags.get(tid)
+            if tag is None:
+                missing.add(tid)
+            elif tag.device_id == device.id:
+                result[tid] = tag
+        if missing:
+            found = {tag.tid: tag for tag in Tag.objects.select_related('device').filter(tid__in=missing)}
+            if create and missing - found.keys():
+                Tag.objects.bulk_create([
+                    Tag(tid=tid, device=device, name='TAG_' + str(tid)) for tid in missing - found.keys()
+                ], ignore_conflicts=True)
+                found.update({
+                    tag.tid: tag
+                    for tag in Tag.objects.select_related('device').filter(tid__in=missing - found.keys())
+                })
+            for tid, tag in found.items():
+                self.tags.set(tid, tag)
+                if tag.device_id == device.id:
+                    result[tid] = tag
+        return result
+
+    def get_tag(self, tid):
+        tag = self.tags.get(tid)
+        if tag is None:
+            try:
+                tag = Tag.objects.select_related('device').get(tid=tid)
+            except Tag.DoesNotExist:
+                return None
+            self.tags.set(tid, tag)
+        return tag
+
+    def fetch_tag(self, tid):
+        """
+        绕过缓存从数据库读取标签并刷新缓存，用于必须与库中一致的场景（例如下发配置）
+        """
+        try:
+            tag = Tag.objects.select_related('device').get(tid=tid)
+        except Tag.DoesNotExist:
+            self.tags.pop(tid)
+            return None
+        self.tags.set(tid, tag)
+        return tag
+
+    def invalidate(self, devices=(), readers=(), tags=()):
+        """
+        在本进程与其他进程中丢弃这些键：devices 为 device_id，readers 为 (rid, device.id)，tags 为 tid
+        """
+        for lru, keys in ((self.devices, devices), (self.readers, readers), (self.tags, tags)):
+            keys = list(keys)
+            if keys:
+                for key in keys:
+                    lru.pop(key)
+                bump_generation(lru.generation_key, keys)
+
+    def invalidate_device(self, device: Device):
+        # 该基站的标签上挂着旧的 device 实例
+        self.invalidate(devices=(device.device_id, ),
+                        tags=Tag.objects.filter(device_id=device.id).values_list('tid', flat=True))
+
+    def invalidate_reader(self, reader: Reader):
+        self.invalidate(readers=((reader.rid, reader.device_id), ))
+
+    def invalidate_tag(self, tag: Tag):
+        self.invalidate(tags=(tag.tid, ))
+
+    def invalidate_category(self, category: TagCategory):
+        # 子树下标签上的分类路径、颜色都可能变化
+        if category.tree_path:
+            tags = Tag.objects.filter(category__tree_path__startswith=category.tree_path)
+        else:
+            tags = Tag.objects.filter(category_id=category.id)
+        self.invalidate(tags=tags.values_list('tid', flat=True))
+
+    def stats(self):
+        return {
+            'devices': self.devices.stats(),
+            'readers': self.readers.stats(),
+            'tags': self.tags.stats()
+        }
+
+
+identity_cache = IdentityCache(DaemonSettings.identity_cache_size, DaemonSettings.identity_cache_ttl)
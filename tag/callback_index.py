@@ -0,0 +1,104 @@
+from django.db.models import Q
+
+from intellikeeper_api.cache_settings import CacheSettings
+from tag.cache import LRUCache
+from tag.models import Callback, TagCategory
+
+SCOPE_USER = 1
+SCOPE_DEVICE = 2
+SCOPE_CATEGORY = 3
+SCOPE_TAG = 4
+
+
+class CallbackIndex:
+    """
+    回调解析索引，供守护进程触发回调时使用；接口读取挂载关系直接查库，不经过这里
+    plans: (tag.id, tag.category_id, tag.device_id) -> 按冒泡顺序排列、已关联 trigger 的 Callback 列表
+    targets: (scope, target) -> 该作用目标上的 Callback 列表
+    categories: device.id -> {category_id: parent_category_id}
+    """
+    generation_key = 'tag:callback-index:generation'
+
+    def __init__(self, maxsize, ttl):
+        self.plans = LRUCache(maxsize, ttl, self.generation_key)
+        self.targets = LRUCache(maxsize, ttl, self.generation_key)
+        self.categories = LRUCache(maxsize, ttl, self.generation_key)
+
+    def category_chain(self, category_id, device_id):
+        """
+        从 category_id 一直到根节点的分类ID列表（由近及远）
+        """
+        parents = self.categories.get(device_id)
+        if parents is None:
+            parents = dict(TagCategory.objects.filter(device_id=device_id).values_list('id', 'parent_category_id'))
+            self.categories.set(device_id, parents)
+
+        chain = []
+        while category_id is not None and category_id not in chain:
+            chain.append(category_id)
+            category_id = parents.get(category_id)
+        return chain
+
+    def get_plan(self, tag):
+        key = (tag.id, tag.category_id, tag.device_id)
+        plan = self.plans.get(key)
+        if plan is not None:
+            return plan
+
+        # 根据冒泡原则：标签callback -> 分类树（一直到根节点）callback -> 基站callback -> 用户区块callback
+        scopes = [(SCOPE_TAG, tag.id)]
+        scopes.extend((SCOPE_CATEGORY, category_id) for category_id in self.category_chain(tag.category_id,
+                                                                                            tag.device_id))
+        scopes.append((SCOPE_DEVICE, tag.device_id))
+        if tag.device.belongs_to_id is not None:
+            scopes.append((SCOPE_USER, tag.device.belongs_to_id))
+
+        condition = Q()
+        for scope, target in scopes:
+            condition |= Q(scope=scope, target=target)
+        grouped = {scope: [] for scope in scopes}
+        for callback in Callback.objects.filter(condition).select_related('trigger').order_by('id'):
+            grouped[(callback.scope, callback.target)].append(callback)
+
+        plan = []
+        for scope in scopes:
+            self.targets.set(scope, grouped[scope])
+            plan.extend(grouped[scope])
+        self.plans.set(key, plan)
+        return plan
+
+    def get_device_plan(self, device):
+        plan = list(self.get_callbacks(SCOPE_DEVICE, device.id))
+        if device.belongs_to_id is not None:
+            plan.extend(self.get_callbacks(SCOPE_USER, device.belongs_to_id))
+        return plan
+
+    def get_callbacks(self, scope, target):
+        callbacks = self.targets.get((scope, target))
+        if callbacks is None:
+            callbacks = list(Callback.objects.filter(scope=scope, target=target).select_related('trigger')
+                             .order_by('id'))
+            self.targets.set((scope, target), callbacks)
+        return callbacks
+
+    def get_triggers(self, scope, target):
+        """
+        作用目标上挂载的触发器（去重，按ID排序）
+        """
+        triggers = {callback.trigger.id: callback.trigger for callback in self.get_callbacks(scope, target)}
+        return [triggers[trigger_id] for trigger_id in sorted(triggers)]
+
+    def clear(self):
+        self.plans.clear()
+        self.targets.clear()
+        self.categories.clear()
+
+    def stats(self):
+        return {
+            'plans': self.plans.stats(),
+            'targets': self.targets.stats(),
+            'categories': self.categories.stats()
+        }
+
+
+callback_index = CallbackIndex(CacheSettings.callback_index_size, CacheSettings.callback_index_ttl)
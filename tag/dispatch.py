@@ -0,0 +1,131 @@
+import queue
+import threading
+import time
+import traceback
+
+from django.db import close_old_connections
+
+from device.models import Device
+from tag.models import Tag
+from tag.services import run_callbacks, run_device_callbacks
+
+_STOP = None
+
+
+class CallbackDispatcher:
+    """
+    回调派发队列：入库流程只负责 enqueue(tag_id, event) / enqueue_device(device_id, event)，
+    记录事件与调用触发器由后台线程完成
+    队列有界，满时 enqueue 阻塞（背压），阻塞次数与时长计入统计
+    提供 gate（AlertGate）时，入队前先按抑制窗口去重，并把基站一次性的大量信号丢失合并为一条基站级告警
+    """
+
+    def __init__(self, workers, max_queue, gate=None):
+        self.workers = workers
+        self.gate = gate
+        self.queue = queue.Queue(max_queue)
+        self.threads = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+        self.max_depth = 0
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name='callback-dispatcher-{}'.format(i), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def enqueue(self, tag_id, event):
+        if self.gate is not None and not self.gate.allow('tag', tag_id, event):
+            return
+        self._put((Tag, tag_id, event))
+
+    def enqueue_device(self, device_id, event):
+        if self.gate is not None and not self.gate.allow('device', device_id, event):
+            return
+        self._put((Device, device_id, event))
+
+    def enqueue_lost(self, device_id, tag_ids, online_count):
+        """
+        一个基站一次信号丢失的标签 tag_ids，online_count 为丢失前该基站的在线标签数
+        """
+        if self.gate is not None and self.gate.collapse(tag_ids, online_count):
+            self.enqueue_device(device_id, 'mass_lost_signal')
+            return
+        for tag_id in tag_ids:
+            self.enqueue(tag_id, 'lost_signal')
+
+    def _put(self, item):
+        if self.closed:
+            raise RuntimeError('Callback dispatcher is closed')
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            started = time.monotonic()
+            self.queue.put(item)
+            with self._lock:
+                self.blocked += 1
+                self.blocked_seconds += time.monotonic() - started
+        with self._lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            model, pk, event = item
+            try:
+                close_old_connections()
+                if model is Device:
+                    try:
+                        device = Device.objects.get(pk=pk)
+                    except Device.DoesNotExist:
+                        continue
+                    print('Callback run: Device {}'.format(device))
+                    run_device_callbacks(device, event)
+                else:
+                    try:
+                        tag = Tag.objects.select_related('device', 'device__belongs_to', 'category').get(pk=pk)
+                    except Tag.DoesNotExist:
+                        continue
+                    print('Callback run: Tag {}'.format(tag))
+                    run_callbacks(tag, event)
+                with self._lock:
+                    self.processed += 1
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                traceback.print_exc()
+            finally:
+                close_old_connections()
+
+    def drain(self):
+        """
+        不再接受新的回调，等待队列中已有的回调全部执行完
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+
+    def stats(self):
+        return {
+            'depth': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'blocked_seconds': round(self.blocked_seconds, 3)
+        }
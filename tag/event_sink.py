@@ -0,0 +1,150 @@
+import threading
+import traceback
+
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+
+from tag.events import get_desc_by_event
+from tag.models import Event
+
+NAME_MAX_LENGTH = Event._meta.get_field('name').max_length
+
+
+class EventSink:
+    """
+    事件记录缓冲：start() 之后事件先进入内存，攒满 batch_size 条或每隔 flush_interval 秒用 bulk_create 写入；
+    未 start() 时（例如 API 进程）每条事件直接写库
+    写库失败的事件放回缓冲区，下次刷新时重试，最多保留 max_buffered 条
+    """
+
+    def __init__(self):
+        self.batch_size = 1
+        self.flush_interval = None
+        self.max_buffered = None
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.recorded = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def start(self, batch_size, flush_interval, max_buffered=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='event-sink', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def record(self, tag, event, durable=False, device=None):
+        """
+        durable 为 True 时立即写库（之前缓冲的事件先写入以保持顺序），返回的 Event 带有 id
+        基站级事件 tag 为 None，需要提供 device
+        """
+        desc = get_desc_by_event(event)
+        record = Event(
+            # 标签名本身最长就是 32 个字符，拼上事件描述后截断，否则 PostgreSQL 上写入会失败
+            name=('{}{}'.format(tag.name if tag is not None else device.name, desc[1]))[:NAME_MAX_LENGTH],
+            caused_by=desc[0],
+            tag=tag,
+            device_id=device.id if device is not None else tag.device_id
+        )
+        with self._lock:
+            self.recorded += 1
+            if not durable and self._thread is not None:
+                self._buffer.append(record)
+                if len(self._buffer) < self.batch_size:
+                    return record
+        self.flush()
+        if durable or self._thread is None:
+            record.save()
+            with self._lock:
+                self.flushed += 1
+        return record
+
+    def flush(self):
+        """
+        返回是否全部写入；失败的事件已放回缓冲区头部
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+            if not pending:
+                return True
+            written, retry = self._write(pending)
+            with self._lock:
+                self.flushed += written
+                self.flushes += 1
+                if retry:
+                    self.failures += 1
+                    self._buffer[:0] = retry
+                    overflow = len(self._buffer) - self.max_buffered if self.max_buffered else 0
+                    if overflow > 0:
+                        del self._buffer[:overflow]
+                        self.dropped += overflow
+                        print('Event buffer full, dropped {} events'.format(overflow))
+            return not retry
+
+    def _write(self, pending):
+        """
+        写入一批事件，返回 (写入条数, 需要重试的事件)
+        整批失败时逐条写入：遇到连接、数据库不可用一类的错误时剩余的留待重试，
+        其他错误（违反约束、数据不合法，例如标签已被删除）只与这一条事件有关，直接丢弃，不能堵住之后的事件
+        每次写入放在单独的保存点中，在入库事务中调用时失败不会破坏外层事务
+        """
+        try:
+            with transaction.atomic():
+                Event.objects.bulk_create(pending)
+            return len(pending), []
+        except Exception:
+            traceback.print_exc()
+        written = 0
+        for i, record in enumerate(pending):
+            try:
+                with transaction.atomic():
+                    record.save()
+                written += 1
+            except (OperationalError, InterfaceError):
+                traceback.print_exc()
+                return written, pending[i:]
+            except Exception as e:
+                with self._lock:
+                    self.dropped += 1
+                print('Dropped event {}: {}'.format(record.name, e))
+        return written, []
+
+    def close(self):
+        """
+        停止定时刷新并写入剩余的事件
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        return {
+            'buffered': len(self._buffer),
+            'recorded': self.recorded,
+            'flushed': self.flushed,
+            'flushes': self.flushes,
+            'failures': self.failures,
+            'dropped': self.dropped
+        }
+
+
+event_sink = EventSink()
@@ -2,7 +2,9 @@ EVENTS = {
     'test': (0, '测试'),
     'lost_signal': (1, '信号丢失'),
     'moved': (2, '标签被移'),
-    'unmask': (3, '标签被取下')
+    'unmask': (3, '标签被取下'),
+    'device_offline': (4, '基站离线'),
+    'mass_lost_signal': (5, '大量标签信号丢失')
 }
 
 
@@ -2,9 +2,5 @@ from tag.models import Tag
 
 
 def tag_get_path(tag: Tag):
-    category = tag.category
-    path = []
-    while category is not None:
-        path.append(category.name)
-        category = category.parent_category
-    return '/'.join(reversed(path))
\ No newline at end of file
+    # 分类路径冗余存储在标签上，分类改名、移动时批量刷新
+    return tag.category_path
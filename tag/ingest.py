@@ -0,0 +1,171 @@
+from django.db import transaction
+
+from device.models import Device
+from intellikeeper_api.alert_settings import AlertSettings
+from intellikeeper_api.track_settings import TrackSettings
+from tag.cache import identity_cache
+from tag.models import Tag, TagPosition, TagTrack
+from tag.positioning import locate_readings
+from tag.positions import position_writer
+from tag.presence import presence_engine
+from tag.smoothing import track_smoother
+from tag.track_gate import track_write_gate
+
+NO_READER = 0xFFFF
+
+
+def ingest_device_reports(device: Device, reports):
+    """
+    按到达顺序处理同一基站的若干次上报 [(event_time, frames), ...]
+    返回 (信号丢失的标签ID列表, 处理后的在线标签 {tag_id: tid}, 在线标签连续缺席次数 {tag_id: misses},
+    下次上报需要检查缺席的标签ID集合)
+    """
+    readers = identity_cache.get_readers(device, {
+        rid for _, frames in reports for frame in frames for rid in (frame[1], frame[3], frame[5])
+    } - {NO_READER})
+    reader_ids = {rid: reader[0] for rid, reader in readers.items()}
+    coordinates = {reader_id: (x, y) for reader_id, x, y in readers.values()}
+    tags = identity_cache.get_tags(device, {frame[0] for _, frames in reports for frame in frames})
+    tag_ids = {tid: tag.id for tid, tag in tags.items()}
+
+    # 与内存中的在线集合做差，只有状态真正变化的标签才写库
+    was_online = presence_engine.get(device)
+    online = dict(was_online)
+    misses = {tag_id: count for tag_id, count in presence_engine.get_misses(device).items() if tag_id in online}
+    # 缺席只可能发生在上一次上报出现过的标签和已在计数的标签中，不必每次扫描全部在线标签
+    last_seen = presence_engine.get_last_seen(device)
+    if last_seen is None:
+        last_seen = set(online)
+    came_online = set()
+    lost = []
+    tracks = []
+    for event_time, frames in reports:
+        detected = {}
+        for tid, reader1_id, reader1_dis, reader2_id, reader2_dis, reader3_id, reader3_dis in frames:
+            if tid not in tag_ids:
+                # 标签识别码已被其他基站占用
+                continue
+            tracks.append(TagTrack(
+                tag_id=tag_ids[tid],
+
+                reader1_id=reader_ids.get(reader1_id),
+                distance1=reader1_dis,
+                reader2_id=reader_ids.get(reader2_id),
+                distance2=reader2_dis,
+                reader3_id=reader_ids.get(reader3_id),
+                distance3=reader3_dis,
+
+                created=event_time
+            ))
+            detected[tag_ids[tid]] = tid
+            if tag_ids[tid] not in was_online:
+                came_online.add(tag_ids[tid])
+        online.update(detected)
+        for tag_id in detected:
+            misses.pop(tag_id, None)
+
+        # 存在性检测
+        # 规则：只检查active标签、active基站且原本online标签的存在性
+        # 连续 offline_miss_threshold 次上报都缺席才判定信号丢失
+        if not device.is_active:
+            last_seen |= detected.keys()
+            continue
+        missing = {}
+        if len(online) > len(detected):
+            missing = {tag_id: online[tag_id] for tag_id in last_seen | misses.keys()
+                       if tag_id in online and tag_id not in detected}
+        missing_tags = identity_cache.get_tags(device, missing.values(), create=False)
+        invalid_tags = sorted(tag_id for tag_id, tid in missing.items()
+                              if tid in missing_tags and missing_tags[tid].is_active)
+        for tag_id in invalid_tags:
+            misses[tag_id] = misses.get(tag_id, 0) + 1
+            if misses[tag_id] >= AlertSettings.offline_miss_threshold:
+                del online[tag_id]
+                del misses[tag_id]
+                lost.append(tag_id)
+        # 没有计数的缺席标签（非active）留到下次继续检查，它们可能随时被启用
+        last_seen = set(detected) | (missing.keys() - set(invalid_tags))
+
+    # 整批一次向量化定位
+    positions = locate_readings([
+        ((track.reader1_id, track.distance1), (track.reader2_id, track.distance2), (track.reader3_id, track.distance3))
+        for track in tracks
+    ], coordinates)
+    for track, (x, y, error) in zip(tracks, positions):
+        track.x, track.y, track.error = x, y, error
+        if x is not None:
+            # 轨迹按上报顺序排列，滤波状态按时间推进
+            track.smoothed_x, track.smoothed_y = track_smoother.update(track.tag_id, track.created, x, y, error)
+
+    # 当前位置取每个标签本批最后一次观测，不受写入门控影响
+    latest = {track.tag_id: track for track in tracks}
+    position_writer.write([TagPosition(
+        tag_id=track.tag_id,
+        device_id=device.id,
+        reader1_id=track.reader1_id,
+        distance1=track.distance1,
+        reader2_id=track.reader2_id,
+        distance2=track.distance2,
+        reader3_id=track.reader3_id,
+        distance3=track.distance3,
+        x=track.smoothed_x if track.smoothed_x is not None else track.x,
+        y=track.smoothed_y if track.smoothed_y is not None else track.y,
+        error=track.error,
+        last_seen=track.created
+    ) for track in latest.values()])
+
+    if TrackSettings.write_gate_enabled:
+        tracks = [track for track in tracks if track_write_gate.admit(track)]
+    TagTrack.objects.bulk_create(tracks)
+    # 只写状态真正变化的标签；失联检测在另一个进程中置为离线的标签经 presence_engine 通知后已移出在线集合，
+    # 再次上报时同样算作重新上线
+    came_online &= online.keys()
+    if came_online:
+        Tag.objects.filter(id__in=came_online, is_online=False).update(is_online=True)
+    went_offline = {tag_id for tag_id in lost if tag_id in was_online and tag_id not in online}
+    if went_offline:
+        # 以数据库中的状态为准，只有本次真正由在线改为离线的标签才报信号丢失，已被失联检测处理过的不再重复报警
+        flipped = set(Tag.objects.select_for_update().filter(id__in=went_offline, is_online=True)
+                      .order_by('id').values_list('id', flat=True))
+        if flipped:
+            Tag.objects.filter(id__in=flipped).update(is_online=False)
+        lost = [tag_id for tag_id in lost if tag_id not in went_offline or tag_id in flipped]
+    return lost, online, misses, last_seen
+
+
+def ingest_reports(reports):
+    """
+    批量入库 saveProps 上报：reports 为按到达顺序排列的 [(device, event_time, frames), ...]
+    阅读器、标签的解析与轨迹、在线状态的写入都是集合操作，整批在一个事务中完成
+    返回 [(device.id, 信号丢失的标签ID列表, 本批之前该基站的在线标签数), ...]，事务提交之后再由调用方触发回调
+    """
+    by_device = {}
+    for device, event_time, frames in reports:
+        by_device.setdefault(device.id, (device, []))[1].append((event_time, frames))
+
+    lost = []
+    states = []
+    try:
+        with transaction.atomic():
+            for device, device_reports in by_device.values():
+                online_count = len(presence_engine.get(device))
+                device_lost, online, misses, last_seen = ingest_device_reports(device, device_reports)
+                if device_lost:
+                    lost.append((device.id, device_lost, online_count))
+                states.append((device, online, misses, last_seen))
+    except Exception:
+        # 回滚后本批新建的阅读器、标签不复存在，在线状态也需要重新从数据库加载
+        identity_cache.readers.clear()
+        identity_cache.tags.clear()
+        # 门控记住的“最后写入”随事务一起回滚了，平滑器的状态也已吸收了没有入库的轨迹
+        track_write_gate.clear()
+        position_writer.clear()
+        track_smoother.clear()
+        for device, _ in by_device.values():
+            presence_engine.invalidate(device)
+        raise
+
+    # 事务提交后才更新内存中的在线状态
+    for device, online, misses, last_seen in states:
+        presence_engine.set(device, online, misses, last_seen)
+    return lost
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from device.models import Device
+from intellikeeper_api.track_settings import TrackSettings
+from tag.archive import TRACK_FIELDS, day_start, track_archive
+from tag.models import TagTrack
+
+
+class Command(BaseCommand):
+    help = '把早于保留天数的 TagTrack 按基站、按天写入列式归档，并从热表删除'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=TrackSettings.archive_after_days,
+                            help='早于多少天的轨迹移入归档')
+        parser.add_argument('--device', type=int, help='只归档该基站（主键）的轨迹')
+        parser.add_argument('--dry-run', action='store_true', help='只输出将要归档的行数')
+
+    def handle(self, *args, **options):
+        # 按整天切分，归档段与 archived_until 都落在天的边界上
+        cutoff = day_start(timezone.now() - timedelta(days=options['days']))
+        devices = Device.objects.all()
+        if options['device'] is not None:
+            devices = devices.filter(pk=options['device'])
+
+        for device in devices:
+            tracks = TagTrack.objects.filter(tag__device=device, created__lt=cutoff)
+            if options['dry_run']:
+                self.stdout.write('Device {}: {} tracks to archive'.format(device.id, tracks.count()))
+                continue
+
+            first = tracks.order_by('created').values_list('created', flat=True).first()
+            archived = 0
+            if first is not None:
+                day = day_start(first)
+                while day < cutoff:
+                    archived += self.archive_day(device, day)
+                    day += timedelta(days=1)
+            track_archive.set_archived_until(device.id, cutoff)
+            self.stdout.write('Device {}: archived {} tracks before {}'.format(device.id, archived, cutoff.isoformat()))
+
+    def archive_day(self, device, day):
+        rows = list(TagTrack.objects.filter(
+            tag__device=device,
+            created__gte=day,
+            created__lt=day + timedelta(days=1)
+        ).values_list(*TRACK_FIELDS).iterator())
+        if not rows:
+            return 0
+
+        # 先写归档再删热表；中途失败重跑时归档按 id 去重
+        track_archive.write_segment(device.id, day, rows)
+        ids = [row[0] for row in rows]
+        for i in range(0, len(ids), TrackSettings.prune_batch_size):
+            TagTrack.objects.filter(id__in=ids[i:i + TrackSettings.prune_batch_size]).delete()
+        return len(rows)
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from device.models import Device
+from intellikeeper_api.track_settings import TrackSettings
+from tag.models import TagTrack
+from tag.positioning import locate_readings
+from tag.smoothing import TrackSmoother
+from tag.tracks import get_reader_coordinates
+
+
+class Command(BaseCommand):
+    help = '按当前的阅读器坐标重新计算 TagTrack 的定位与平滑结果（默认只处理尚未定位的行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', type=int, help='只处理该基站（主键）的轨迹')
+        parser.add_argument('--since', help='只处理该时间（ISO 8601）之后的轨迹')
+        parser.add_argument('--all', action='store_true', help='已定位的行也重新计算（例如阅读器坐标调整之后）')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        devices = Device.objects.all()
+        if options['device'] is not None:
+            devices = devices.filter(pk=options['device'])
+
+        for device in devices:
+            tracks = TagTrack.objects.filter(tag__device=device)
+            if options['since']:
+                tracks = tracks.filter(created__gte=parse_datetime(options['since']))
+            if not options['all']:
+                tracks = tracks.filter(x__isnull=True)
+            self.stdout.write('Device {}: recomputed {} tracks'.format(
+                device.id, self.recompute(tracks, get_reader_coordinates(device.id), options['batch_size'])))
+
+    def recompute(self, tracks, coordinates, batch_size):
+        # 按 id 分批向前推进，已更新的行不会被重复取到；id 基本按时间递增，平滑按 id 顺序进行
+        smoother = TrackSmoother(TrackSettings.smoothing_process_noise, TrackSettings.smoothing_measurement_noise,
+                                 TrackSettings.smoothing_max_gap)
+        done = 0
+        last_id = 0
+        while True:
+            batch = list(tracks.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'reader1_id', 'distance1', 'reader2_id', 'distance2', 'reader3_id', 'distance3', 'tag_id',
+                'created')[:batch_size])
+            if not batch:
+                return done
+            positions = locate_readings([(row[1:3], row[3:5], row[5:7]) for row in batch], coordinates)
+            updated = []
+            for row, (x, y, error) in zip(batch, positions):
+                track = TagTrack(id=row[0], x=x, y=y, error=error)
+                if x is not None:
+                    track.smoothed_x, track.smoothed_y = smoother.update(row[7], row[8], x, y, error)
+                updated.append(track)
+            TagTrack.objects.bulk_update(updated, ('x', 'y', 'error', 'smoothed_x', 'smoothed_y'))
+            done += len(batch)
+            last_id = batch[-1][0]
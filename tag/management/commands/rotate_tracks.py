@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from intellikeeper_api.track_settings import TrackSettings
+from tag import partitions
+from tag.models import TagTrack
+
+
+class Command(BaseCommand):
+    help = '预建 TagTrack 的月分区，并删除或归档超过保留期的轨迹（建议每天定时执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=TrackSettings.retention_days,
+                            help='轨迹保留天数')
+        parser.add_argument('--ahead', type=int, default=TrackSettings.partitions_ahead,
+                            help='预先创建之后多少个月的分区')
+        parser.add_argument('--archive', action='store_true',
+                            help='过期分区只从 TagTrack 摘下并保留为独立的表，不删除（仅 PostgreSQL）')
+        parser.add_argument('--dry-run', action='store_true', help='只输出将要处理的内容')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        cutoff = now - timedelta(days=options['retention_days'])
+
+        if not partitions.is_partitioned():
+            self.prune(cutoff, options['dry_run'])
+            return
+
+        if options['dry_run']:
+            expired = [name for month, name in partitions.list_partitions() if partitions.next_month(month) <= cutoff]
+            self.stdout.write('Partitions to {}: {}'.format('archive' if options['archive'] else 'drop', expired))
+            return
+
+        for name in partitions.ensure_partitions(now, options['ahead']):
+            self.stdout.write('Created partition {}'.format(name))
+        for name in partitions.expire_partitions(cutoff, options['archive']):
+            self.stdout.write('{} partition {}'.format('Archived' if options['archive'] else 'Dropped', name))
+
+    def prune(self, cutoff, dry_run):
+        """
+        非分区表：按 id 顺序分批删除过期轨迹，轨迹基本按时间顺序写入，过期的行集中在 id 较小的一端
+        """
+        expired = TagTrack.objects.filter(created__lt=cutoff)
+        if dry_run:
+            self.stdout.write('Tracks to delete: {}'.format(expired.count()))
+            return
+
+        deleted = 0
+        while True:
+            ids = list(expired.order_by('id').values_list('id', flat=True)[:TrackSettings.prune_batch_size])
+            if not ids:
+                break
+            TagTrack.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+        self.stdout.write('Deleted {} tracks older than {}'.format(deleted, cutoff.isoformat()))
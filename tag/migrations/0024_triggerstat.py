@@ -0,0 +1,30 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tag', '0023_tag_is_online'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TriggerStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calls', models.PositiveIntegerField(default=0, verbose_name='调用次数')),
+                ('failures', models.PositiveIntegerField(default=0, verbose_name='失败次数')),
+                ('retries', models.PositiveIntegerField(default=0, verbose_name='重试次数')),
+                ('total_latency', models.FloatField(default=0, verbose_name='累计耗时（秒）')),
+                ('max_latency', models.FloatField(default=0, verbose_name='最大耗时（秒）')),
+                ('last_latency', models.FloatField(default=None, null=True, verbose_name='最近一次耗时（秒）')),
+                ('last_status', models.IntegerField(default=None, null=True, verbose_name='最近一次HTTP状态码')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='最近一次错误')),
+                ('last_called', models.DateTimeField(default=None, null=True, verbose_name='最近一次调用时间')),
+                ('trigger', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stat', to='tag.Trigger', verbose_name='触发器')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tag', '0024_triggerstat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trigger',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新时间'),
+        ),
+    ]
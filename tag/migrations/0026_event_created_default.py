@@ -0,0 +1,19 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tag', '0025_trigger_updated'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='发生时间'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0015_auto_20200708_0437'),
+        ('tag', '0026_event_created_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='device',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='device.Device', verbose_name='关联基站'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='caused_by',
+            field=models.IntegerField(choices=[(0, '测试'), (1, '信号丢失'), (2, '标签被移'), (3, '标签被取下'), (4, '基站离线')], verbose_name='事件原因'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='tag',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='tag.Tag', verbose_name='标签'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tag', '0027_event_device'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='caused_by',
+            field=models.IntegerField(choices=[(0, '测试'), (1, '信号丢失'), (2, '标签被移'), (3, '标签被取下'), (4, '基站离线'), (5, '大量标签信号丢失')], verbose_name='事件原因'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:31
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+
+# 迁移按当时的结构固定下来，不引用 tag.partitions，之后对该模块的修改不会改变这次迁移的行为
+TRACK_TABLE = 'tag_tagtrack'
+LEGACY_TABLE = 'tag_tagtrack_legacy'
+DEFAULT_PARTITION = 'tag_tagtrack_default'
+MONTHS_AHEAD = 2
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(value):
+    if value.month == 12:
+        return datetime(value.year + 1, 1, 1, tzinfo=timezone.utc)
+    return datetime(value.year, value.month + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month):
+    return '{}_p{:04d}{:02d}'.format(TRACK_TABLE, month.year, month.month)
+
+
+def partition_tagtrack(apps, schema_editor):
+    """
+    把普通的 TagTrack 表改造为按 created 分月的分区表：
+    已有数据所在的月份与之后 MONTHS_AHEAD 个月各建一个分区，范围之外的数据落入 DEFAULT 分区
+    分区表的主键必须包含分区键，所以主键改为 (id, created)，id 仍由原序列生成
+    """
+    # 只有 PostgreSQL 支持声明式分区，其他数据库保持普通表，由 rotate_tracks 按批删除过期数据
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [TRACK_TABLE]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+            [TRACK_TABLE, '{}_pkey'.format(TRACK_TABLE)]
+        )
+        indexes = [indexdef for indexdef, in cursor.fetchall()]
+        cursor.execute('SELECT min(created), max(created) FROM {}'.format(TRACK_TABLE))
+        oldest, newest = cursor.fetchone()
+
+        cursor.execute('ALTER TABLE {} RENAME TO {}'.format(TRACK_TABLE, LEGACY_TABLE))
+        cursor.execute('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) PARTITION BY RANGE (created)'.format(
+            TRACK_TABLE, LEGACY_TABLE))
+        cursor.execute('ALTER TABLE {} ADD PRIMARY KEY (id, created)'.format(TRACK_TABLE))
+        cursor.execute('ALTER SEQUENCE {0}_id_seq OWNED BY {0}.id'.format(TRACK_TABLE))
+        cursor.execute('CREATE TABLE {} PARTITION OF {} DEFAULT'.format(DEFAULT_PARTITION, TRACK_TABLE))
+
+        now = datetime.now(timezone.utc)
+        month = month_start(oldest if oldest is not None else now)
+        last = month_start(max(newest, now) if newest is not None else now)
+        for _ in range(MONTHS_AHEAD):
+            last = next_month(last)
+        while month <= last:
+            cursor.execute('CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)'.format(
+                partition_name(month), TRACK_TABLE), [month, next_month(month)])
+            month = next_month(month)
+
+        cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(TRACK_TABLE, LEGACY_TABLE))
+        cursor.execute('DROP TABLE {}'.format(LEGACY_TABLE))
+
+        # 外键与索引按原来的名字重建在分区表上（索引定义是改名之前取的，指向的就是新表）
+        for name, definition in foreign_keys:
+            cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(TRACK_TABLE, name, definition))
+        for indexdef in indexes:
+            cursor.execute(indexdef)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tag', '0028_event_mass_lost_signal'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tagtrack, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tagtrack',
+            index=models.Index(fields=['tag', 'created'], name='tag_tagtrack_tag_created'),
+        ),
+    ]
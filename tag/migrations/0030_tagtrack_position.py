@@ -0,0 +1,28 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tag', '0029_tagtrack_partitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tagtrack',
+            name='error',
+            field=models.FloatField(default=None, null=True, verbose_name='定位误差'),
+        ),
+        migrations.AddField(
+            model_name='tagtrack',
+            name='x',
+            field=models.FloatField(default=None, null=True, verbose_name='横坐标'),
+        ),
+        migrations.AddField(
+            model_name='tagtrack',
+            name='y',
+            field=models.FloatField(default=None, null=True, verbose_name='纵坐标'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tag', '0030_tagtrack_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tagtrack',
+            name='smoothed_x',
+            field=models.FloatField(default=None, null=True, verbose_name='平滑后横坐标'),
+        ),
+        migrations.AddField(
+            model_name='tagtrack',
+            name='smoothed_y',
+            field=models.FloatField(default=None, null=True, verbose_name='平滑后纵坐标'),
+        ),
+    ]
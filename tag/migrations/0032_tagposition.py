@@ -0,0 +1,32 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0015_auto_20200708_0437'),
+        ('tag', '0031_tagtrack_smoothed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagPosition',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='position', serialize=False, to='tag.Tag', verbose_name='标签')),
+                ('distance1', models.FloatField(verbose_name='距离1')),
+                ('distance2', models.FloatField(verbose_name='距离2')),
+                ('distance3', models.FloatField(verbose_name='距离3')),
+                ('x', models.FloatField(default=None, null=True, verbose_name='横坐标')),
+                ('y', models.FloatField(default=None, null=True, verbose_name='纵坐标')),
+                ('error', models.FloatField(default=None, null=True, verbose_name='定位误差')),
+                ('last_seen', models.DateTimeField(verbose_name='最后上报时间')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='device.Device', verbose_name='关联基站')),
+                ('reader1', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tag.Reader', verbose_name='阅读器1')),
+                ('reader2', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tag.Reader', verbose_name='阅读器2')),
+                ('reader3', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tag.Reader', verbose_name='阅读器3')),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+def fill_tree_path(apps, schema_editor):
+    TagCategory = apps.get_model('tag', 'TagCategory')
+    parents = dict(TagCategory.objects.values_list('id', 'parent_category_id'))
+    paths = {}
+
+    def resolve(category_id):
+        # 自底向上找到已知路径的祖先；历史数据中的环从环上断开当作根分类
+        chain = []
+        while category_id is not None and category_id not in paths and category_id not in chain:
+            chain.append(category_id)
+            category_id = parents.get(category_id)
+        path, depth = paths.get(category_id, ('/', -1))
+        for current in reversed(chain):
+            path, depth = '{}{}/'.format(path, current), depth + 1
+            paths[current] = (path, depth)
+
+    for category_id in parents:
+        resolve(category_id)
+    categories = list(TagCategory.objects.only('id'))
+    for category in categories:
+        category.tree_path, category.depth = paths[category.id]
+    TagCategory.objects.bulk_update(categories, ('tree_path', 'depth'), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tag', '0032_tagposition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tagcategory',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='层级'),
+        ),
+        migrations.AddField(
+            model_name='tagcategory',
+            name='tree_path',
+            field=models.CharField(db_index=True, default='', max_length=255, verbose_name='分类路径'),
+        ),
+        migrations.RunPython(fill_tree_path, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.0.14 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+def fill_category_labels(apps, schema_editor):
+    TagCategory = apps.get_model('tag', 'TagCategory')
+    Tag = apps.get_model('tag', 'Tag')
+    categories = list(TagCategory.objects.values_list('id', 'name', 'color', 'tree_path'))
+    names = {category_id: name for category_id, name, _, _ in categories}
+    for category_id, _, color, tree_path in categories:
+        path = '/'.join(names[int(x)] for x in tree_path.strip('/').split('/') if x and int(x) in names)
+        Tag.objects.filter(category_id=category_id).update(category_path=path, category_color=color)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tag', '0033_tagcategory_tree_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='category_color',
+            field=models.CharField(default='#000000', max_length=32, verbose_name='分类颜色'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='category_path',
+            field=models.TextField(default='', verbose_name='分类路径'),
+        ),
+        migrations.RunPython(fill_category_labels, migrations.RunPython.noop),
+    ]
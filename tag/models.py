@@ -1,9 +1,14 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
 
 from device.models import Device
 from tag.events import EVENTS
 from user.models import User
 
+NO_CATEGORY_COLOR = '#000000'
+
 
 class TagCategory(models.Model):
     device = models.ForeignKey(Device, verbose_name='关联基站', on_delete=models.CASCADE)
@@ -14,6 +19,72 @@ class TagCategory(models.Model):
 
     color = models.CharField(verbose_name='颜色', max_length=32)
 
+    # 物化路径：从根分类到自身的ID，形如 /1/5/9/；depth 为所在层级，根分类为0
+    # 子树为 tree_path 以自身路径开头的分类，祖先为路径中的其余ID，各一次查询
+    tree_path = models.CharField(verbose_name='分类路径', max_length=255, db_index=True, default='')
+    depth = models.PositiveSmallIntegerField(verbose_name='层级', default=0)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记住读出时的名称、颜色与父级，保存时只有这些变化才需要刷新标签上冗余的路径与颜色
+        instance._loaded = (instance.__dict__.get('name'), instance.__dict__.get('color'),
+                            instance.__dict__.get('parent_category_id'))
+        return instance
+
+    def ancestor_ids(self):
+        """
+        从根到父分类的ID列表
+        """
+        return [int(x) for x in self.tree_path.strip('/').split('/')[:-1]] if self.tree_path else []
+
+    def get_full_path(self):
+        ancestor_ids = self.ancestor_ids()
+        names = dict(TagCategory.objects.filter(id__in=ancestor_ids).values_list('id', 'name')) if ancestor_ids else {}
+        return '/'.join([names[category_id] for category_id in ancestor_ids if category_id in names] + [self.name])
+
+    def save(self, *args, **kwargs):
+        parent = self.parent_category
+        if parent is not None and self.tree_path and parent.tree_path.startswith(self.tree_path):
+            raise ValueError('不能把分类移动到自身或其子分类之下')
+        prefix = parent.tree_path if parent is not None else '/'
+        depth = parent.depth + 1 if parent is not None else 0
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'tree_path', 'depth'}
+
+        with transaction.atomic():
+            if self.pk is None:
+                # 路径中包含自身ID，插入之后才能确定
+                super().save(*args, **kwargs)
+                self.tree_path, self.depth = '{}{}/'.format(prefix, self.pk), depth
+                TagCategory.objects.filter(pk=self.pk).update(tree_path=self.tree_path, depth=depth)
+                return
+
+            old_path, old_depth = self.tree_path, self.depth
+            self.tree_path, self.depth = '{}{}/'.format(prefix, self.pk), depth
+            super().save(*args, **kwargs)
+            if old_path and old_path != self.tree_path:
+                TagCategory.move_descendants(old_path, self.tree_path, depth - old_depth)
+
+            loaded = getattr(self, '_loaded', None)
+            if loaded is None or loaded[0] != self.name or loaded[2] != self.parent_category_id:
+                # 改名、移动影响整棵子树的路径
+                Tag.refresh_category_labels(TagCategory.objects.filter(tree_path__startswith=self.tree_path))
+            elif loaded[1] != self.color:
+                Tag.refresh_category_labels((self, ))
+            self._loaded = (self.name, self.color, self.parent_category_id)
+
+    @staticmethod
+    def move_descendants(old_path, new_path, depth_delta):
+        """
+        把路径为 old_path 的分类的所有子孙整体改到 new_path 之下，一条 UPDATE 完成
+        """
+        TagCategory.objects.filter(tree_path__startswith=old_path).exclude(tree_path=old_path).update(
+            tree_path=Concat(Value(new_path), Substr('tree_path', len(old_path) + 1),
+                             output_field=models.CharField()),
+            depth=F('depth') + depth_delta
+        )
+
 
 class Reader(models.Model):
     rid = models.PositiveIntegerField(verbose_name='阅读器识别码', unique=True)
@@ -38,6 +109,54 @@ class Tag(models.Model):
 
     is_online = models.BooleanField(verbose_name='是否在线', default=False)
 
+    # 分类路径与颜色的冗余副本，分类改名、改色、移动时按子树批量刷新（见 refresh_category_labels）
+    category_path = models.TextField(verbose_name='分类路径', default='')
+    category_color = models.CharField(verbose_name='分类颜色', max_length=32, default=NO_CATEGORY_COLOR)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if getattr(self, '_loaded_category_id', None) != self.category_id:
+            # 重新读取分类，避免使用内存中过期的路径
+            category = TagCategory.objects.filter(pk=self.category_id).first() if self.category_id else None
+            self.category_path = category.get_full_path() if category is not None else ''
+            self.category_color = category.color if category is not None else NO_CATEGORY_COLOR
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'category_path', 'category_color'}
+        super().save(*args, **kwargs)
+        self._loaded_category_id = self.category_id
+
+    @staticmethod
+    def refresh_category_labels(categories, batch_size=200):
+        """
+        重新计算这些分类下所有标签的 category_path / category_color：
+        祖先名称一次查询，标签每 batch_size 个分类一条 Case/When 的 UPDATE 写回
+        """
+        categories = list(categories)
+        if not categories:
+            return
+        names = {category.id: category.name for category in categories}
+        missing = {ancestor_id for category in categories for ancestor_id in category.ancestor_ids()} - names.keys()
+        if missing:
+            names.update(TagCategory.objects.filter(id__in=missing).values_list('id', 'name'))
+
+        for start in range(0, len(categories), batch_size):
+            batch = categories[start:start + batch_size]
+            paths, colors = [], []
+            for category in batch:
+                path = '/'.join(names[category_id] for category_id in category.ancestor_ids() + [category.id]
+                                if category_id in names)
+                paths.append(When(category_id=category.id, then=Value(path)))
+                colors.append(When(category_id=category.id, then=Value(category.color)))
+            Tag.objects.filter(category_id__in=[category.id for category in batch]).update(
+                category_path=Case(*paths, output_field=models.TextField()),
+                category_color=Case(*colors, output_field=models.CharField())
+            )
+
 
 class TagTrack(models.Model):
     tag = models.ForeignKey(Tag, verbose_name='标签', on_delete=models.CASCADE)
@@ -53,6 +172,40 @@ class TagTrack(models.Model):
 
     created = models.DateTimeField(verbose_name='记录时间') # 不用auto_now_add，cloud提供记录时间
 
+    # 由三个阅读器的距离定位得到的位置（见 tag.positioning），error 为距离残差的均方根
+    x = models.FloatField(verbose_name='横坐标', null=True, default=None)
+    y = models.FloatField(verbose_name='纵坐标', null=True, default=None)
+    error = models.FloatField(verbose_name='定位误差', null=True, default=None)
+    # 入库时按标签滤波平滑后的位置（见 tag.smoothing），读取轨迹时优先使用
+    smoothed_x = models.FloatField(verbose_name='平滑后横坐标', null=True, default=None)
+    smoothed_y = models.FloatField(verbose_name='平滑后纵坐标', null=True, default=None)
+
+    class Meta:
+        # PostgreSQL 上按 created 分月分区（见 tag.partitions），按标签读取一段时间的轨迹走该索引
+        indexes = (
+            models.Index(fields=('tag', 'created'), name='tag_tagtrack_tag_created'),
+        )
+
+
+class TagPosition(models.Model):
+    # 每个标签一行的当前位置，由入库进程批量覆盖写入；device 冗余存储，按基站取全部标签位置只查这一张表
+    tag = models.OneToOneField(Tag, verbose_name='标签', on_delete=models.CASCADE, primary_key=True, related_name='position')
+    device = models.ForeignKey(Device, verbose_name='关联基站', on_delete=models.CASCADE)
+
+    reader1 = models.ForeignKey(Reader, verbose_name='阅读器1', on_delete=models.SET_NULL, null=True, related_name='+')
+    distance1 = models.FloatField(verbose_name='距离1')
+    reader2 = models.ForeignKey(Reader, verbose_name='阅读器2', on_delete=models.SET_NULL, null=True, related_name='+')
+    distance2 = models.FloatField(verbose_name='距离2')
+    reader3 = models.ForeignKey(Reader, verbose_name='阅读器3', on_delete=models.SET_NULL, null=True, related_name='+')
+    distance3 = models.FloatField(verbose_name='距离3')
+
+    # 有平滑结果时为平滑后的位置，无法定位时为空
+    x = models.FloatField(verbose_name='横坐标', null=True, default=None)
+    y = models.FloatField(verbose_name='纵坐标', null=True, default=None)
+    error = models.FloatField(verbose_name='定位误差', null=True, default=None)
+
+    last_seen = models.DateTimeField(verbose_name='最后上报时间')
+
 
 class Trigger(models.Model):
     name = models.CharField(verbose_name='触发器名', max_length=32)
@@ -67,9 +220,23 @@ class Trigger(models.Model):
         (3, 'PUT')
     ))
     created = models.DateTimeField(verbose_name='创建时间', auto_now_add=True)
+    updated = models.DateTimeField(verbose_name='更新时间', auto_now=True)
     belongs_to = models.ForeignKey(User, verbose_name='创建者', on_delete=models.CASCADE)
 
 
+class TriggerStat(models.Model):
+    trigger = models.OneToOneField(Trigger, verbose_name='触发器', on_delete=models.CASCADE, related_name='stat')
+    calls = models.PositiveIntegerField(verbose_name='调用次数', default=0)
+    failures = models.PositiveIntegerField(verbose_name='失败次数', default=0)
+    retries = models.PositiveIntegerField(verbose_name='重试次数', default=0)
+    total_latency = models.FloatField(verbose_name='累计耗时（秒）', default=0)
+    max_latency = models.FloatField(verbose_name='最大耗时（秒）', default=0)
+    last_latency = models.FloatField(verbose_name='最近一次耗时（秒）', null=True, default=None)
+    last_status = models.IntegerField(verbose_name='最近一次HTTP状态码', null=True, default=None)
+    last_error = models.TextField(verbose_name='最近一次错误', blank=True, default='')
+    last_called = models.DateTimeField(verbose_name='最近一次调用时间', null=True, default=None)
+
+
 class Callback(models.Model):
     scope = models.IntegerField(verbose_name='作用范围', choices=(
         (1, '全局（对某个用户而言）'),
@@ -84,9 +251,12 @@ class Callback(models.Model):
 
 class Event(models.Model):
     name = models.CharField(verbose_name='事件名', max_length=32, blank=True)
-    created = models.DateTimeField(verbose_name='发生时间', auto_now_add=True)
+    # 事件可能批量写入，发生时间在记录时确定，而不是写库时
+    created = models.DateTimeField(verbose_name='发生时间', default=timezone.now)
     caused_by = models.IntegerField(verbose_name='事件原因', choices=EVENTS.values())
-    tag = models.ForeignKey(Tag, verbose_name='标签', on_delete=models.CASCADE)
+    # 基站级事件（例如基站离线）没有对应的标签
+    tag = models.ForeignKey(Tag, verbose_name='标签', on_delete=models.CASCADE, null=True)
+    device = models.ForeignKey(Device, verbose_name='关联基站', on_delete=models.CASCADE, null=True)
 
     class Meta:
         ordering = ('-created', '-id')
@@ -0,0 +1,116 @@
+from datetime import datetime, timezone
+
+from django.db import connection, transaction
+
+TRACK_TABLE = 'tag_tagtrack'
+DEFAULT_PARTITION = '{}_default'.format(TRACK_TABLE)
+PARTITION_PREFIX = '{}_p'.format(TRACK_TABLE)
+
+
+def month_start(value: datetime):
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(value: datetime):
+    if value.month == 12:
+        return datetime(value.year + 1, 1, 1, tzinfo=timezone.utc)
+    return datetime(value.year, value.month + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime):
+    return '{}{:04d}{:02d}'.format(PARTITION_PREFIX, month.year, month.month)
+
+
+def partition_month(name):
+    suffix = name[len(PARTITION_PREFIX):]
+    return datetime(int(suffix[:4]), int(suffix[4:6]), 1, tzinfo=timezone.utc)
+
+
+def is_partitioned():
+    """
+    只有 PostgreSQL 上按月分区，其他数据库（SQLite）TagTrack 仍为普通表
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TRACK_TABLE])
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """
+    返回当前挂在 TagTrack 上的按月分区 [(月份, 分区表名), ...]，按月份升序，不含 DEFAULT 分区
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s)',
+            [TRACK_TABLE]
+        )
+        names = [name for name, in cursor.fetchall() if name.startswith(PARTITION_PREFIX)]
+    return sorted((partition_month(name), name) for name in names)
+
+
+def create_partition(month: datetime):
+    """
+    创建 month 所在月份的分区；DEFAULT 分区中已有该月的数据时一并迁入新分区
+    返回是否新建了分区
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    lower, upper = month, next_month(month)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM {} WHERE created >= %s AND created < %s)'.format(DEFAULT_PARTITION),
+            [lower, upper]
+        )
+        in_default, = cursor.fetchone()
+        bounds = 'FOR VALUES FROM (%s) TO (%s)'
+        with transaction.atomic():
+            if not in_default:
+                cursor.execute('CREATE TABLE {} PARTITION OF {} {}'.format(name, TRACK_TABLE, bounds), [lower, upper])
+                return True
+            # 新分区的范围与 DEFAULT 分区中的数据重叠时不能直接创建，先摘下 DEFAULT 分区再搬数据
+            cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(TRACK_TABLE, DEFAULT_PARTITION))
+            cursor.execute('CREATE TABLE {} PARTITION OF {} {}'.format(name, TRACK_TABLE, bounds), [lower, upper])
+            cursor.execute(
+                'INSERT INTO {} SELECT * FROM {} WHERE created >= %s AND created < %s'.format(name, DEFAULT_PARTITION),
+                [lower, upper]
+            )
+            cursor.execute('DELETE FROM {} WHERE created >= %s AND created < %s'.format(DEFAULT_PARTITION),
+                           [lower, upper])
+            cursor.execute('ALTER TABLE {} ATTACH PARTITION {} DEFAULT'.format(TRACK_TABLE, DEFAULT_PARTITION))
+    return True
+
+
+def ensure_partitions(now: datetime, ahead):
+    """
+    保证当月及之后 ahead 个月的分区存在，返回新建的分区表名
+    """
+    created = []
+    month = month_start(now)
+    for _ in range(ahead + 1):
+        if create_partition(month):
+            created.append(partition_name(month))
+        month = next_month(month)
+    return created
+
+
+def expire_partitions(cutoff: datetime, archive=False):
+    """
+    处理整月都早于 cutoff 的分区：archive 为 True 时只从 TagTrack 上摘下（表保留，可另行导出），否则直接删除
+    返回处理的分区表名
+    """
+    expired = [name for month, name in list_partitions() if next_month(month) <= cutoff]
+    with connection.cursor() as cursor:
+        for name in expired:
+            if archive:
+                cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(TRACK_TABLE, name))
+            else:
+                cursor.execute('DROP TABLE {}'.format(name))
+    return expired
+
@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+
+from intellikeeper_api.track_settings import TrackSettings
+
+NO_POSITION = (None, None, None)
+
+
+def _pair(anchors, distances, first, second):
+    """
+    两个阅读器：取两圆交点在连线上的投影（不相交时夹在两个阅读器之间）
+    """
+    rows = np.arange(len(anchors))
+    p0, p1 = anchors[rows, first], anchors[rows, second]
+    d0, d1 = distances[rows, first], distances[rows, second]
+    baseline = p1 - p0
+    length2 = (baseline ** 2).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(length2 > 0, (d0 ** 2 - d1 ** 2 + length2) / (2 * length2), 0.5)
+    t = np.clip(t, 0, 1)
+    return p0 + baseline * t[:, None]
+
+
+def locate(anchors, distances):
+    """
+    批量三边定位
+    anchors: (N, 3, 2) 三个阅读器的坐标，缺失的阅读器为 NaN；distances: (N, 3)
+    返回 (N, 3) 的 [x, y, error]，error 为到各阅读器距离残差的均方根；没有有效阅读器的行为 NaN
+    三个阅读器用线性化的最小二乘，两个阅读器取连线上的点，一个阅读器取其坐标（error 即距离）
+    """
+    anchors = np.asarray(anchors, dtype=np.float64)
+    distances = np.asarray(distances, dtype=np.float64)
+    valid = ~np.isnan(anchors[:, :, 0]) & ~np.isnan(distances)
+    count = valid.sum(axis=1)
+    first = valid.argmax(axis=1)
+    last = 2 - valid[:, ::-1].argmax(axis=1)
+    position = np.full((len(anchors), 2), np.nan)
+
+    one = count == 1
+    position[one] = anchors[one, first[one]]
+
+    two = count == 2
+    position[two] = _pair(anchors[two], distances[two], first[two], last[two])
+
+    three = count == 3
+    if three.any():
+        p, d = anchors[three], distances[three]
+        # 与第一个阅读器的圆方程相减得到两个线性方程 A [x, y] = b
+        a = 2 * (p[:, 1:] - p[:, :1])
+        b = d[:, :1] ** 2 - d[:, 1:] ** 2 + (p[:, 1:] ** 2).sum(axis=2) - (p[:, :1] ** 2).sum(axis=2)
+        det = a[:, 0, 0] * a[:, 1, 1] - a[:, 0, 1] * a[:, 1, 0]
+        solved = np.abs(det) > 1e-9
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = (b[:, 0] * a[:, 1, 1] - b[:, 1] * a[:, 0, 1]) / det
+            y = (a[:, 0, 0] * b[:, 1] - a[:, 1, 0] * b[:, 0]) / det
+        result = np.stack((x, y), axis=1)
+        # 三个阅读器共线时方程组退化，按前两个阅读器处理
+        if not solved.all():
+            rows = ~solved
+            result[rows] = _pair(p[rows], d[rows], np.zeros(rows.sum(), dtype=int), np.ones(rows.sum(), dtype=int))
+        position[three] = result
+
+    with np.errstate(invalid='ignore'):
+        residual = np.where(valid, np.hypot(*(anchors - position[:, None, :]).transpose(2, 0, 1)) - distances, 0)
+        error = np.sqrt((residual ** 2).sum(axis=1) / np.maximum(count, 1))
+    error[count == 0] = np.nan
+    return np.column_stack((position, error))
+
+
+def locate_readings(readings, coordinates, scale=None):
+    """
+    readings 为 [((reader1_id, distance1), (reader2_id, distance2), (reader3_id, distance3)), ...]，
+    coordinates 为 {reader_id: (x, y)}；返回与 readings 等长的 [(x, y, error), ...]，无法定位的为 (None, None, None)
+    帧中的距离按 scale（默认 TrackSettings.distance_scale）换算为地图坐标单位
+    """
+    scale = TrackSettings.distance_scale if scale is None else scale
+    if not readings:
+        return []
+    anchors = np.full((len(readings), 3, 2), np.nan)
+    distances = np.full((len(readings), 3), np.nan)
+    for i, reading in enumerate(readings):
+        for j, (reader_id, distance) in enumerate(reading):
+            anchor = coordinates.get(reader_id)
+            if anchor is not None and distance is not None:
+                anchors[i, j] = anchor
+                distances[i, j] = distance * scale
+
+    positions = []
+    for x, y, error in locate(anchors, distances).tolist():
+        positions.append(NO_POSITION if math.isnan(x) else (x, y, error))
+    return positions
@@ -0,0 +1,43 @@
+import threading
+
+from tag.models import TagPosition
+
+UPDATE_FIELDS = ('device', 'reader1', 'distance1', 'reader2', 'distance2', 'reader3', 'distance3', 'x', 'y', 'error',
+                 'last_seen')
+
+
+class PositionWriter:
+    """
+    批量覆盖写入标签的当前位置：记住已确认在库中有行的标签，
+    其余标签先 bulk_create(ignore_conflicts=True) 补上行，再与已知标签一起 bulk_update
+    """
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self._known = set()
+        self._lock = threading.Lock()
+
+    def write(self, positions):
+        """
+        positions 为 [TagPosition, ...]，每个标签至多一行；需在入库事务中调用
+        """
+        if not positions:
+            return
+        with self._lock:
+            unknown = [position for position in positions if position.tag_id not in self._known]
+        if unknown:
+            TagPosition.objects.bulk_create(unknown, ignore_conflicts=True, batch_size=self.batch_size)
+        # 已存在的行 ignore_conflicts 不会更新，新建的行再更新一次也无妨
+        TagPosition.objects.bulk_update(positions, UPDATE_FIELDS, batch_size=self.batch_size)
+        with self._lock:
+            self._known.update(position.tag_id for position in unknown)
+
+    def clear(self):
+        with self._lock:
+            self._known.clear()
+
+    def __len__(self):
+        return len(self._known)
+
+
+position_writer = PositionWriter()
@@ -0,0 +1,121 @@
+import threading
+import time
+
+from django.core.cache import cache as shared_cache
+
+from device.models import Device
+
+from intellikeeper_api.daemon_settings import DaemonSettings
+from tag.cache import bump_generation, read_invalidations
+from tag.models import Tag
+
+
+class PresenceEngine:
+    """
+    每个基站在线标签集合的内存状态 {device.id: {tag_id: tid}}，启动时从数据库重建
+    在线状态也会被其他进程修改：失联检测置为离线的标签经 publish_offline() 通知，各进程每隔 check_interval 秒
+    从共享缓存中取回并移出在线集合（取不回时重新加载全部基站）；此外每隔 resync_interval 秒按基站从数据库重新加载一次
+    另外记录在线标签连续缺席的上报次数 {device.id: {tag_id: misses}}，用于离线判定的滞回，
+    以及每个基站上一次上报中出现的标签 {device.id: {tag_id, ...}}，缺席只需在它与正在计数的标签中查找
+    """
+    generation_key = 'tag:presence:offline-generation'
+
+    def __init__(self, resync_interval, check_interval=5):
+        self.resync_interval = resync_interval
+        self.check_interval = check_interval
+        self._online = {}
+        self._misses = {}
+        self._last_seen = {}
+        self._loaded = {}
+        self._generation = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        online = {}
+        for device_id, tag_id, tid in Tag.objects.filter(is_online=True).values_list('device_id', 'id', 'tid') \
+                .iterator():
+            online.setdefault(device_id, {})[tag_id] = tid
+        now = time.monotonic()
+        generation = shared_cache.get(self.generation_key)
+        with self._lock:
+            self._online = online
+            self._misses = {}
+            self._last_seen = {}
+            self._loaded = {device_id: now for device_id in Device.objects.values_list('id', flat=True)}
+            self._generation = generation
+            self._checked = now
+
+    @staticmethod
+    def publish_offline(tags):
+        """
+        通知所有进程这些标签已在别处置为离线，tags 为 [(device.id, tag_id), ...]
+        """
+        if tags:
+            bump_generation(PresenceEngine.generation_key, tags)
+
+    def _check_offline(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        generation = shared_cache.get(self.generation_key)
+        if generation == self._generation:
+            return
+        tags = read_invalidations(self.generation_key, self._generation, generation)
+        self._generation = generation
+        if tags is None:
+            # 错过了哪些标签无法确定，所有基站下次读取时从数据库重新加载
+            self._loaded.clear()
+            return
+        for device_id, tag_id in tags:
+            self._online.get(device_id, {}).pop(tag_id, None)
+            self._misses.get(device_id, {}).pop(tag_id, None)
+
+    def get(self, device: Device):
+        """
+        返回该基站当前在线标签 {tag_id: tid} 的副本
+        """
+        with self._lock:
+            self._check_offline()
+            loaded = self._loaded.get(device.id)
+            if loaded is not None and time.monotonic() - loaded < self.resync_interval:
+                return dict(self._online.get(device.id, {}))
+
+        online = dict(Tag.objects.filter(device=device, is_online=True).values_list('id', 'tid'))
+        with self._lock:
+            self._online[device.id] = online
+            self._misses.pop(device.id, None)
+            self._last_seen.pop(device.id, None)
+            self._loaded[device.id] = time.monotonic()
+        return dict(online)
+
+    def get_last_seen(self, device: Device):
+        """
+        上一次上报中出现的标签ID集合；重新加载后还没有上报过时为 None，此时所有在线标签都要检查
+        """
+        with self._lock:
+            last_seen = self._last_seen.get(device.id)
+            return set(last_seen) if last_seen is not None else None
+
+    def get_misses(self, device: Device):
+        with self._lock:
+            return dict(self._misses.get(device.id, {}))
+
+    def set(self, device: Device, online, misses=None, last_seen=None):
+        with self._lock:
+            self._online[device.id] = dict(online)
+            if misses is not None:
+                self._misses[device.id] = dict(misses)
+            if last_seen is not None:
+                self._last_seen[device.id] = set(last_seen)
+
+    def invalidate(self, device: Device):
+        with self._lock:
+            self._online.pop(device.id, None)
+            self._misses.pop(device.id, None)
+            self._last_seen.pop(device.id, None)
+            self._loaded.pop(device.id, None)
+
+
+presence_engine = PresenceEngine(DaemonSettings.presence_resync_interval)
@@ -1,12 +1,11 @@
 import math
-from datetime import timedelta
 
-from django.utils import timezone
 from rest_framework import serializers
 
+from device.models import Device
 from device.serializers import DeviceSerializer
-from tag.models import Tag, Trigger, TagCategory, Reader, TagTrack, Event
-from tag.facade import tag_get_path
+from tag.models import Tag, Trigger, TagCategory, Reader, Event, TriggerStat, TagPosition
+from tag.tracks import build_tracks
 
 
 class ReaderSerializer(serializers.ModelSerializer):
@@ -26,9 +25,30 @@ class ReaderSerializer(serializers.ModelSerializer):
         )
 
 
+class TagPositionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TagPosition
+        fields = (
+            'tag',
+            'reader1',
+            'distance1',
+            'reader2',
+            'distance2',
+            'reader3',
+            'distance3',
+            'x',
+            'y',
+            'error',
+            'last_seen'
+        )
+        read_only_fields = fields
+
+
 class TagSerializer(serializers.ModelSerializer):
-    path = serializers.SerializerMethodField(read_only=True)
-    color = serializers.SerializerMethodField(read_only=True)
+    # 分类路径与颜色直接取标签上的冗余字段，序列化时不再逐行查询分类
+    path = serializers.CharField(source='category_path', read_only=True)
+    color = serializers.CharField(source='category_color', read_only=True)
+    position = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Tag
@@ -44,21 +64,27 @@ class TagSerializer(serializers.ModelSerializer):
             'move_detect_on',
             'light_detect_on',
             'color',
-            'is_online'
+            'is_online',
+            'position'
         )
         read_only_fields = (
             'tid',
             'path',
-            'color'
+            'color',
+            'position'
         )
 
-    def get_path(self, obj: Tag):
-        return tag_get_path(obj)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 当前位置只在 context['with_position'] 为真时输出，查询集应 select_related('position')
+        if not self.context.get('with_position'):
+            self.fields.pop('position')
 
-    def get_color(self, obj: Tag):
-        if obj.category is None:
-            return '#000000'
-        return obj.category.color
+    def get_position(self, obj: Tag):
+        try:
+            return TagPositionSerializer(obj.position).data
+        except TagPosition.DoesNotExist:
+            return None
 
     def validate_device(self, device):
         if device.belongs_to != self.context['request'].user:
@@ -77,22 +103,12 @@ class TrackedTagSerializer(TagSerializer):
         read_only_fields = ('track', )
 
     def get_track(self, obj):
-        raw_track = TagTrack.objects.filter(tag=obj, created__gte=(timezone.now() - timedelta(days=2))).order_by('id')
-        track = []
-        for raw_position in raw_track:
-            position: TagTrack = raw_position
-            data = [x for x in [
-                (position.reader1, position.distance1),
-                (position.reader2, position.distance2),
-                (position.reader3, position.distance3),
-            ] if x[0] is not None]
-            if len(data) == 0:
-                continue
-            sorted(data, key=lambda x: x[1], reverse=True)
-            if len(track) > 0 and (abs(data[0][0].x - track[-1][0]) < 2 and abs(data[0][0].y - track[-1][1]) < 2):
-                continue
-            track.append((data[0][0].x, data[0][0].y, position.created))
-        return track
+        # 视图一次算好所有标签的轨迹放在 context['tracks'] 中；单独序列化时只算这一个标签
+        # 时间范围由 context 中的 since / until 指定，默认最近两天
+        tracks = self.context.get('tracks')
+        if tracks is None:
+            tracks = build_tracks(obj.device_id, (obj.id, ), self.context.get('since'), self.context.get('until'))
+        return tracks.get(obj.id, [])
 
 
 class TriggerSerializer(serializers.ModelSerializer):
@@ -113,6 +129,30 @@ class TriggerSerializer(serializers.ModelSerializer):
         read_only_fields = ('belongs_to',)
 
 
+class TriggerStatSerializer(serializers.ModelSerializer):
+    avg_latency = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = TriggerStat
+        fields = (
+            'calls',
+            'failures',
+            'retries',
+            'avg_latency',
+            'max_latency',
+            'last_latency',
+            'last_status',
+            'last_error',
+            'last_called'
+        )
+        read_only_fields = fields
+
+    def get_avg_latency(self, obj: TriggerStat):
+        if obj.calls == 0:
+            return None
+        return obj.total_latency / obj.calls
+
+
 class TagCategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = TagCategory
@@ -124,6 +164,13 @@ class TagCategorySerializer(serializers.ModelSerializer):
             'device'
         )
 
+    def validate_parent_category(self, parent):
+        if parent is not None and self.instance is not None and self.instance.tree_path and \
+                parent.tree_path.startswith(self.instance.tree_path):
+            raise serializers.ValidationError('不能把分类移动到自身或其子分类之下。')
+
+        return parent
+
 
 class ClassifiedTagCategorySerializer(TagCategorySerializer):
     tags = TagSerializer(many=True, read_only=True)
@@ -136,6 +183,29 @@ class ClassifiedTagCategorySerializer(TagCategorySerializer):
         read_only_fields = ('tags', )
 
 
+def build_classified_tree(categories):
+    """
+    与 ClassifiedTagCategorySerializer(categories, many=True).data 结构相同，
+    但分类、标签、基站各只查询一次，再在内存中按分类归组
+    """
+    categories = list(categories)
+    category_ids = [category.id for category in categories]
+    tags = list(Tag.objects.filter(category_id__in=category_ids).order_by('id'))
+    devices = list(Device.objects.filter(id__in={category.device_id for category in categories}))
+
+    device_data = {device.id: data for device, data in zip(devices, DeviceSerializer(devices, many=True).data)}
+    tags_by_category = {category_id: [] for category_id in category_ids}
+    for tag, data in zip(tags, TagSerializer(tags, many=True).data):
+        tags_by_category[tag.category_id].append(data)
+
+    result = []
+    for category, data in zip(categories, TagCategorySerializer(categories, many=True).data):
+        data['device'] = device_data[category.device_id]
+        data['tags'] = tags_by_category[category.id]
+        result.append(data)
+    return result
+
+
 class EventSerializer(serializers.ModelSerializer):
     tag = TagSerializer(read_only=True)
     caused_by = serializers.CharField(source='get_caused_by_display')
@@ -147,5 +217,6 @@ class EventSerializer(serializers.ModelSerializer):
             'name',
             'created',
             'caused_by',
-            'tag'
+            'tag',
+            'device'
         )
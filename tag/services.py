@@ -1,48 +1,31 @@
-import json
-
-import requests
-
 from tag import triggers
-from tag.events import get_desc_by_event
-from tag.facade import tag_get_path
-from tag.models import Trigger, Callback, TagCategory, Event
+from tag.callback_index import callback_index
+from tag.event_sink import event_sink
+from tag.models import Trigger, Callback, TagCategory
+from tag.trigger_templates import get_compiled_trigger, build_trigger_context, render_mapping
+from tag.webhook import get_webhook_transport
 
 
 def tag_get_sub_categories(category: TagCategory):
-    result = [category]
-
+    """
+    分类自身及其所有子孙分类，按物化路径一次查询（可直接用作 __in 子查询）
+    """
     if category is None:
-        return result
+        return [category]
 
-    children = TagCategory.objects.filter(parent_category=category)
-    for child in children:
-        result.extend(tag_get_sub_categories(child))
+    return TagCategory.objects.filter(tree_path__startswith=category.tree_path).order_by('tree_path')
 
-    return result
 
-
-def parse_trigger_req_str(s: str, tag, event):
-    replacements = {
-        'tag_name': tag.name,
-        'tag_tid': str(tag.tid),
-        'device_id': tag.device.device_id,
-        'device_name': tag.device.name,
-        'tag_path': tag_get_path(tag),
-        'event_type': str(get_desc_by_event(event)[0])
-    }
-    for source, replacement in replacements.items():
-        s = s.replace('{% ' + source + ' %}', replacement)
-    return s
-
-
-def invoke_trigger(trigger: Trigger, tag, event):
+def invoke_trigger(trigger: Trigger, tag, event, context=None, device=None):
     if not trigger.is_active:
         return
 
-    params = json.loads(trigger.callback_params)
-    if not isinstance(params, dict):
+    compiled = get_compiled_trigger(trigger)
+    if compiled.params is None:
         return
-    params = {k: parse_trigger_req_str(v, tag, event) for k, v in params.items()}
+    if context is None:
+        context = build_trigger_context(tag, event, device=device)
+    params = render_mapping(compiled.params, context)
 
     # 先考虑是否为内部回调
     if trigger.callback_protocol == 'intellikeeper':
@@ -53,16 +36,15 @@ def invoke_trigger(trigger: Trigger, tag, event):
         }
         if trigger.callback_url not in internal_methods:
             return
-        internal_methods[trigger.callback_url](tag, event, params)
+        internal_methods[trigger.callback_url](tag, event, params, device)
         return
 
     # 否则请求外部URL
-    headers = json.loads(trigger.callback_headers)
-    if not isinstance(headers, dict):
+    if compiled.headers is None:
         return
-    headers = {k: parse_trigger_req_str(v, tag, event) for k, v in headers.items()}
+    headers = render_mapping(compiled.headers, context)
 
-    callback_url = parse_trigger_req_str(trigger.callback_url, tag, event)
+    callback_url = compiled.url.render(context)
     callback_url = '{}://{}'.format(trigger.callback_protocol, callback_url)
 
     method = trigger.callback_method
@@ -72,41 +54,50 @@ def invoke_trigger(trigger: Trigger, tag, event):
         3: 'put'
     }
 
-    requests.request(method_maping[method], callback_url, headers=headers, data=params)
+    get_webhook_transport().request(method_maping[method], callback_url, trigger_id=trigger.id,
+                                    headers=headers, data=params)
 
 
-def handle_callbacks(callbacks: [Callback], tag, event):
+def handle_callbacks(callbacks: [Callback], tag, event, record=None):
+    context = None
     for callback in callbacks:
         if callback.is_active:
-            invoke_trigger(callback.trigger, tag, event)
+            if context is None:
+                context = build_trigger_context(tag, event, record)
+            invoke_trigger(callback.trigger, tag, event, context)
 
 
-def run_callbacks(tag, event):
-    # 首先计入事件信息中
-    desc = get_desc_by_event(event)
-    Event.objects.create(
-        name=('{}{}'.format(tag.name, desc[1])),
-        caused_by=desc[0],
-        tag=tag
-    )
+def needs_event_id(callbacks: [Callback]):
+    for callback in callbacks:
+        if not callback.is_active or not callback.trigger.is_active:
+            continue
+        try:
+            if 'event_id' in get_compiled_trigger(callback.trigger).names:
+                return True
+        except ValueError:
+            continue
+    return False
 
+
+def run_callbacks(tag, event):
     # 根据冒泡原则：标签callback -> 分类树（一直到根节点）callback -> 基站callback -> 用户区块callback
-    # 首先运行标签级别的callback
-    callbacks = Callback.objects.filter(scope=4, target=tag.id).all()
-    handle_callbacks(callbacks, tag, event)
-
-    # 然后运行分类树上的所有callback
-    category: TagCategory = tag.category
-    while category is not None:
-        callbacks = Callback.objects.filter(scope=3, target=category.id).all()
-        handle_callbacks(callbacks, tag, event)
-        category = category.parent_category
-
-    # 然后运行基站层面的callback
-    callbacks = Callback.objects.filter(scope=2, target=tag.device.id).all()
-    handle_callbacks(callbacks, tag, event)
-
-    # 然后运行全局callback
-    uid = tag.device.belongs_to.id
-    callbacks = Callback.objects.filter(scope=1, target=uid).all()
-    handle_callbacks(callbacks, tag, event)
+    # 回调计划由索引一次解析并缓存
+    callbacks = callback_index.get_plan(tag)
+
+    # 首先计入事件信息中；只有触发器模板用到 event_id 时才需要立即写库拿到ID，否则交给批量写入
+    record = event_sink.record(tag, event, durable=needs_event_id(callbacks))
+
+    handle_callbacks(callbacks, tag, event, record)
+
+
+def run_device_callbacks(device, event):
+    # 基站级事件只冒泡到基站与用户两级
+    callbacks = callback_index.get_device_plan(device)
+    record = event_sink.record(None, event, durable=needs_event_id(callbacks), device=device)
+
+    context = None
+    for callback in callbacks:
+        if callback.is_active:
+            if context is None:
+                context = build_trigger_context(None, event, record, device)
+            invoke_trigger(callback.trigger, None, event, context, device)
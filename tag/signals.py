@@ -0,0 +1,49 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from device.models import Device
+from tag.cache import identity_cache, bump_generation
+from tag.callback_index import callback_index, CallbackIndex
+from tag.models import Tag, Reader, TagCategory, Callback, Trigger, NO_CATEGORY_COLOR
+
+
+@receiver((post_save, post_delete), sender=Device)
+def invalidate_device_identity(sender, instance: Device, **kwargs):
+    identity_cache.invalidate_device(instance)
+
+
+@receiver((post_save, post_delete), sender=Reader)
+def invalidate_reader_identity(sender, instance: Reader, **kwargs):
+    identity_cache.invalidate_reader(instance)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_identity(sender, instance: Tag, **kwargs):
+    identity_cache.invalidate_tag(instance)
+
+
+@receiver((post_save, pre_delete), sender=TagCategory)
+def invalidate_category_identity(sender, instance: TagCategory, **kwargs):
+    # 删除前取子树下的标签，删除后它们的分类会被置空
+    identity_cache.invalidate_category(instance)
+
+
+@receiver(pre_delete, sender=TagCategory)
+def detach_category_subtree(sender, instance: TagCategory, **kwargs):
+    # 子分类的父级会被置空，成为根分类，整棵子树的路径随之上移，子树下标签的冗余路径一并刷新
+    Tag.objects.filter(category=instance).update(category_path='', category_color=NO_CATEGORY_COLOR)
+    if instance.tree_path:
+        descendants = list(TagCategory.objects.filter(tree_path__startswith=instance.tree_path)
+                           .exclude(pk=instance.pk).values_list('id', flat=True))
+        if descendants:
+            TagCategory.move_descendants(instance.tree_path, '/', -(instance.depth + 1))
+            Tag.refresh_category_labels(TagCategory.objects.filter(pk__in=descendants))
+
+
+@receiver((post_save, post_delete), sender=Callback)
+@receiver((post_save, post_delete), sender=Trigger)
+@receiver((post_save, post_delete), sender=TagCategory)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_callback_index(sender, instance, **kwargs):
+    callback_index.clear()
+    bump_generation(CallbackIndex.generation_key)
@@ -0,0 +1,81 @@
+import threading
+
+from intellikeeper_api.track_settings import TrackSettings
+
+
+class AxisFilter:
+    """
+    单个坐标轴上的匀速模型卡尔曼滤波，状态为位置与速度，协方差 [[p00, p01], [p01, p11]]
+    """
+    __slots__ = ('position', 'velocity', 'p00', 'p01', 'p11')
+
+    def __init__(self, position, variance):
+        self.position = position
+        self.velocity = 0.0
+        self.p00 = variance
+        self.p01 = 0.0
+        self.p11 = variance
+
+    def update(self, measurement, variance, dt, process_noise):
+        # 预测
+        self.position += self.velocity * dt
+        p00 = self.p00 + dt * (2 * self.p01 + dt * self.p11) + process_noise * dt ** 3 / 3
+        p01 = self.p01 + dt * self.p11 + process_noise * dt ** 2 / 2
+        p11 = self.p11 + process_noise * dt
+
+        # 校正
+        s = p00 + variance
+        k0, k1 = p00 / s, p01 / s
+        residual = measurement - self.position
+        self.position += k0 * residual
+        self.velocity += k1 * residual
+        self.p00 = (1 - k0) * p00
+        self.p01 = (1 - k0) * p01
+        self.p11 = p11 - k1 * p01
+        return self.position
+
+
+class TrackSmoother:
+    """
+    每个标签一份 O(1) 的滤波状态，入库时按时间顺序输入定位结果，返回平滑后的位置
+    定位误差越大的观测权重越低；相邻两次观测间隔超过 max_gap 秒时重新开始
+    """
+
+    def __init__(self, process_noise, measurement_noise, max_gap):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.max_gap = max_gap
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, tag_id, at, x, y, error=None):
+        """
+        at 为观测时间（datetime），返回 (smoothed_x, smoothed_y)
+        """
+        variance = self.measurement_noise + (error or 0) ** 2
+        with self._lock:
+            state = self._states.get(tag_id)
+            dt = (at - state[0]).total_seconds() if state is not None else None
+            if dt is None or dt < 0 or dt > self.max_gap:
+                self._states[tag_id] = (at, AxisFilter(x, variance), AxisFilter(y, variance))
+                return x, y
+            _, axis_x, axis_y = state
+            self._states[tag_id] = (at, axis_x, axis_y)
+            return (axis_x.update(x, variance, dt, self.process_noise),
+                    axis_y.update(y, variance, dt, self.process_noise))
+
+    def discard(self, tag_ids):
+        with self._lock:
+            for tag_id in tag_ids:
+                self._states.pop(tag_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+    def __len__(self):
+        return len(self._states)
+
+
+track_smoother = TrackSmoother(TrackSettings.smoothing_process_noise, TrackSettings.smoothing_measurement_noise,
+                               TrackSettings.smoothing_max_gap)
@@ -0,0 +1,159 @@
+import threading
+import time
+import uuid
+import zlib
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from device.models import Device
+from tag.cache import is_shared_cache
+from tag.models import Tag
+from tag.presence import PresenceEngine
+from tag.timing_wheel import TimingWheel
+
+
+class LeaderLock:
+    """
+    多个守护进程实例中只有持有锁的一个执行失联判定
+    PostgreSQL 使用会话级 advisory lock（连接断开即释放），锁放在专用连接上，
+    该连接不在 django.db.connections 中，close_old_connections() 不会关闭它；
+    其他数据库退化为 Django 缓存中的租约，持有者每次 acquire() 续约，超过 lease 秒未续约由其他实例接管，
+    租约要求缓存在实例之间共享，本地内存缓存下每个实例都会认为自己是 leader
+    """
+
+    def __init__(self, key, lease):
+        self.key = key
+        self.lease = lease
+        self.token = uuid.uuid4().hex
+        self._db = None
+        self._holder = None
+        if connection.vendor != 'postgresql' and not is_shared_cache():
+            print('Warning: leader lease on a process-local cache, run a single staleness instance '
+                  'or configure a shared cache')
+
+    def acquire(self):
+        if connection.vendor == 'postgresql':
+            return self._acquire_advisory()
+        return self._acquire_lease()
+
+    def _acquire_advisory(self):
+        if self._db is None:
+            self._db = connection.__class__(dict(connection.settings_dict), connection.alias)
+        elif self._db.connection is not None and not self._db.is_usable():
+            # 会话已断开，锁随之释放，重新连接后重新争抢
+            self._db.close()
+            self._holder = None
+        self._db.ensure_connection()
+        # 锁跟随数据库会话：连接没有换过就仍然持有
+        if self._holder is not None and self._holder is self._db.connection:
+            return True
+        with self._db.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [zlib.crc32(self.key.encode())])
+            acquired, = cursor.fetchone()
+        self._holder = self._db.connection if acquired else None
+        return acquired
+
+    def _acquire_lease(self):
+        if cache.add(self.key, self.token, self.lease):
+            return True
+        if cache.get(self.key) == self.token:
+            cache.set(self.key, self.token, self.lease)
+            return True
+        return False
+
+    def release(self):
+        if self._db is not None:
+            try:
+                if self._holder is not None and self._holder is self._db.connection:
+                    with self._db.cursor() as cursor:
+                        cursor.execute('SELECT pg_advisory_unlock(%s)', [zlib.crc32(self.key.encode())])
+            finally:
+                self._db.close()
+                self._db = None
+                self._holder = None
+        elif connection.vendor != 'postgresql' and cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+
+class StalenessDetector:
+    """
+    按最后一次出现的时间判定失联：标签超过 tag_timeout 秒没有出现在任何上报中即视为信号丢失，
+    基站超过 device_timeout 秒没有上报即视为离线
+    最后出现时间挂在时间轮上，每次 sweep 只检查到期的槽位，不扫描全表
+    """
+
+    def __init__(self, tag_timeout, device_timeout, tick=1.0, slots=512):
+        self.tags = TimingWheel(tag_timeout, tick, slots)
+        self.devices = TimingWheel(device_timeout, tick, slots)
+        self._lock = threading.Lock()
+
+    def load(self, now=None):
+        """
+        启动时把数据库中在线的标签与 active 基站都当作刚刚出现过，给它们一个完整的超时周期
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            for device_id, tid in Tag.objects.filter(is_online=True).values_list('device__device_id', 'tid') \
+                    .iterator():
+                self.tags.touch((device_id, tid), now)
+            for device_id in Device.objects.filter(is_active=True).values_list('device_id', flat=True).iterator():
+                self.devices.touch(device_id, now)
+
+    def observe(self, device_id, tids, at=None):
+        at = time.time() if at is None else at
+        with self._lock:
+            self.devices.touch(device_id, at)
+            for tid in tids:
+                self.tags.touch((device_id, tid), at)
+
+    def advance(self, now=None):
+        """
+        推进时间轮，返回超时的 ([((device_id, tid), last_seen), ...], [(device_id, last_seen), ...])
+        """
+        with self._lock:
+            return self.tags.advance(now), self.devices.advance(now)
+
+    def sweep(self, now=None):
+        """
+        推进时间轮，返回 ([(基站ID, 信号丢失的标签ID列表, 丢失前该基站的在线标签数), ...], 离线的基站ID列表)
+        信号丢失的标签在这里置为离线，规则与上报时的存在性检测相同：只处理 active 基站上 active 且 online 的标签
+        """
+        expired_tags, expired_devices = self.advance(now)
+
+        by_device = {}
+        for (device_id, tid), _ in expired_tags:
+            by_device.setdefault(device_id, set()).add(tid)
+
+        lost = []
+        # 入库进程也会把缺席的标签置为离线：锁住在线的行再改写，同一个标签只由先改写的一方报信号丢失
+        with transaction.atomic():
+            for device_id, tids in by_device.items():
+                online = list(Tag.objects.select_for_update(of=('self', )).filter(
+                    device__device_id=device_id,
+                    is_online=True,
+                    is_active=True,
+                    device__is_active=True
+                ).order_by('id').values_list('device_id', 'id', 'tid'))
+                device_lost = [(pk, tag_id) for pk, tag_id, tid in online if tid in tids]
+                if device_lost:
+                    lost.append((device_lost[0][0], [tag_id for _, tag_id in device_lost], len(online)))
+            if lost:
+                Tag.objects.filter(id__in=[tag_id for _, tag_ids, _ in lost for tag_id in tag_ids]) \
+                    .update(is_online=False)
+        # 入库进程内存中的在线集合随之移除这些标签
+        PresenceEngine.publish_offline([(device_pk, tag_id) for device_pk, tag_ids, _ in lost for tag_id in tag_ids])
+
+        offline = []
+        if expired_devices:
+            offline = list(Device.objects.filter(
+                device_id__in=[device_id for device_id, _ in expired_devices],
+                is_active=True
+            ).values_list('id', flat=True))
+        return lost, offline
+
+    def stats(self):
+        return {
+            'tags': len(self.tags),
+            'devices': len(self.devices)
+        }
@@ -1 +1,294 @@
-# Create your tests here.
+import json
+import multiprocessing
+import os
+import sys
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.db import DataError, OperationalError, connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from device.models import Device
+from intellikeeper_api.alert_settings import AlertSettings
+from tag.cache import IdentityCache, identity_cache
+from tag.event_sink import EventSink
+from tag.ingest import ingest_reports
+from tag.models import Event, Tag, TagCategory
+from tag.positions import position_writer
+from tag.presence import presence_engine
+from tag.serializers import ClassifiedTagCategorySerializer, build_classified_tree
+from tag.smoothing import track_smoother
+from tag.staleness import StalenessDetector
+from tag.track_gate import track_write_gate
+from user.models import User
+
+# 守护进程以脚本方式运行，同目录的模块直接 import
+sys.path.insert(0, os.path.join(settings.BASE_DIR, 'daemon'))
+from broker import MemoryBroker  # noqa: E402
+from consumer_pool import TopicWorkerPool, worker_index  # noqa: E402
+
+
+class ClassifiedTreeTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(mobile='+8613800000000')
+        tid = 0
+        for i in range(3):
+            device = Device.objects.create(device_id='device-{}'.format(i), name='基站{}'.format(i), belongs_to=user)
+            parent = None
+            for j in range(5):
+                parent = TagCategory.objects.create(device=device, name='分类{}'.format(j), color='#00000{}'.format(j),
+                                                    parent_category=parent)
+                for _ in range(j):
+                    tid += 1
+                    Tag.objects.create(device=device, tid=tid, name=str(tid), category=parent)
+        self.user = user
+
+    def test_query_count(self):
+        # 分类、标签、基站各一次，与分类、标签数量无关
+        with self.assertNumQueries(3):
+            build_classified_tree(TagCategory.objects.filter(device__belongs_to=self.user))
+
+    def test_same_shape(self):
+        categories = TagCategory.objects.filter(device__belongs_to=self.user).order_by('id')
+        expected = ClassifiedTagCategorySerializer(categories, many=True).data
+        self.assertEqual(build_classified_tree(categories), expected)
+
+
+class StalenessResumeTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(mobile='+8613800000000')
+        self.device = Device.objects.create(device_id='device-staleness', belongs_to=user, is_active=True)
+        for tid in (1, 2):
+            Tag.objects.create(device=self.device, tid=tid, name=str(tid), is_active=True)
+        # 进程内的单例状态与其他用例隔离
+        identity_cache.warm_up()
+        presence_engine.load()
+        patcher = mock.patch.object(presence_engine, 'check_interval', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        track_smoother.clear()
+        track_write_gate.clear()
+        position_writer.clear()
+
+    def report(self, tids):
+        return ingest_reports([(self.device, timezone.now(), [(tid, 0xFFFF, 0, 0xFFFF, 0, 0xFFFF, 0) for tid in tids])])
+
+    def sweep(self):
+        now = time.time()
+        detector = StalenessDetector(120, 300, 1.0, 512)
+        detector.observe(self.device.device_id, (1, 2), now)
+        lost, _ = detector.sweep(now + 200)
+        return lost
+
+    def online(self):
+        return list(Tag.objects.order_by('tid').values_list('tid', 'is_online'))
+
+    def test_sweep_then_resume(self):
+        self.report((1, 2))
+        self.assertEqual(self.online(), [(1, True), (2, True)])
+
+        lost = self.sweep()
+        self.assertEqual([(device_id, len(tag_ids)) for device_id, tag_ids, _ in lost], [(self.device.id, 2)])
+        self.assertEqual(self.online(), [(1, False), (2, False)])
+
+    def test_only_changed_tags_are_written(self):
+        self.report((1, 2))
+        with CaptureQueriesContext(connection) as queries:
+            self.report((1, 2))
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "tag_tag"')])
+
+        # 缺席只在上一次上报出现过的标签中查找，连续缺席达到阈值后只改写这一个标签
+        tag_id = Tag.objects.get(tid=2).id
+        lost = []
+        for _ in range(AlertSettings.offline_miss_threshold):
+            lost += self.report((1, ))
+        self.assertEqual([(device_id, tag_ids) for device_id, tag_ids, _ in lost], [(self.device.id, [tag_id])])
+        self.assertEqual(self.online(), [(1, True), (2, False)])
+
+        # 入库进程收到失联检测的通知后不再认为两个标签在线，再次上报时恢复库中的在线状态
+        self.report((1, 2))
+        self.assertEqual(self.online(), [(1, True), (2, True)])
+
+    def test_sweep_then_missing_does_not_alarm_twice(self):
+        self.report((1, 2))
+        self.assertEqual(len(self.sweep()), 1)
+
+        # 失联检测已经报过信号丢失，入库时连续缺席不再重复报
+        for _ in range(AlertSettings.offline_miss_threshold):
+            self.assertEqual(self.report(()), [])
+        self.assertEqual(self.online(), [(1, False), (2, False)])
+
+    def test_only_changed_tags_are_written(self):
+        self.report((1, 2))
+        with CaptureQueriesContext(connection) as queries:
+            self.report((1, 2))
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "tag_tag"')])
+
+        # 缺席只在上一次上报出现过的标签中查找，连续缺席达到阈值后只改写这一个标签
+        tag_id = Tag.objects.get(tid=2).id
+        lost = []
+        for _ in range(AlertSettings.offline_miss_threshold):
+            lost += self.report((1, ))
+        self.assertEqual([(device_id, tag_ids) for device_id, tag_ids, _ in lost], [(self.device.id, [tag_id])])
+        self.assertEqual(self.online(), [(1, True), (2, False)])
+
+
+class EventSinkTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(mobile='+8613800000000')
+        device = Device.objects.create(device_id='device-events', belongs_to=user)
+        self.tag = Tag.objects.create(device=device, tid=1, name='1')
+
+    def test_failed_flush_keeps_events(self):
+        sink = EventSink()
+        sink.start(100, 3600)
+        try:
+            for _ in range(3):
+                sink.record(self.tag, 'lost_signal')
+            down = OperationalError('database is down')
+            with mock.patch.object(Event.objects, 'bulk_create', side_effect=down), \
+                    mock.patch.object(Event, 'save', side_effect=down):
+                self.assertFalse(sink.flush())
+            self.assertEqual(Event.objects.count(), 0)
+            self.assertEqual(sink.stats()['buffered'], 3)
+            self.assertEqual(sink.stats()['failures'], 1)
+
+            # 数据库恢复后下一次刷新写入之前失败的事件，刷新线程仍在运行
+            self.assertTrue(sink.flush())
+            self.assertEqual(Event.objects.count(), 3)
+            self.assertTrue(sink._thread.is_alive())
+        finally:
+            sink.close()
+        self.assertEqual(sink.stats()['flushed'], 3)
+
+    def test_invalid_event_does_not_block(self):
+        sink = EventSink()
+        sink.start(100, 3600)
+        save = Event.save
+
+        def strict_save(record, *args, **kwargs):
+            # 模拟 PostgreSQL 对 max_length 的检查
+            if len(record.name) > 32:
+                raise DataError('value too long for type character varying(32)')
+            return save(record, *args, **kwargs)
+
+        try:
+            long_named = Tag(id=self.tag.id, device_id=self.tag.device_id, tid=1, name='n' * 32)
+            self.assertEqual(len(sink.record(long_named, 'lost_signal').name), 32)
+            sink._buffer.append(Event(name='x' * 40, caused_by=1, tag=self.tag, device_id=self.tag.device_id))
+            sink.record(self.tag, 'lost_signal')
+            with mock.patch.object(Event.objects, 'bulk_create', side_effect=DataError('value too long')), \
+                    mock.patch.object(Event, 'save', strict_save):
+                self.assertTrue(sink.flush())
+            self.assertEqual(Event.objects.count(), 2)
+            self.assertEqual(sink.stats()['buffered'], 0)
+            self.assertEqual(sink.stats()['dropped'], 1)
+        finally:
+            sink.close()
+
+    def test_overflow_drops_oldest(self):
+        sink = EventSink()
+        sink.start(100, 3600, max_buffered=2)
+        try:
+            records = [sink.record(self.tag, 'lost_signal') for _ in range(3)]
+            down = OperationalError('database is down')
+            with mock.patch.object(Event.objects, 'bulk_create', side_effect=down), \
+                    mock.patch.object(Event, 'save', side_effect=down):
+                sink.flush()
+            self.assertEqual(sink._buffer, records[1:])
+            self.assertEqual(sink.stats()['dropped'], 1)
+        finally:
+            sink.close()
+
+
+class IdentityInvalidationTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(mobile='+8613800000000')
+        self.devices = [Device.objects.create(device_id='device-{}'.format(i), belongs_to=user) for i in range(2)]
+        for tid in range(4):
+            Tag.objects.create(device=self.devices[tid % 2], tid=tid, name=str(tid))
+        # 另一个进程中的缓存：只能通过共享缓存中的代数得知失效
+        self.other = IdentityCache(100, 600)
+        for lru in (self.other.devices, self.other.readers, self.other.tags):
+            lru.generation_check_interval = 0
+        self.other.warm_up()
+
+    def cached_tids(self):
+        return sorted(tid for tid in range(4) if self.other.tags.get(tid) is not None)
+
+    def test_tag_save_evicts_only_that_tag(self):
+        tag = Tag.objects.get(tid=1)
+        tag.name = 'renamed'
+        tag.save()
+        self.assertEqual(self.cached_tids(), [0, 2, 3])
+        self.assertIsNotNone(self.other.devices.get('device-0'))
+        self.assertEqual(self.other.get_tag(1).name, 'renamed')
+
+    def test_device_save_evicts_its_tags(self):
+        self.devices[1].name = 'renamed'
+        self.devices[1].save()
+        self.assertEqual(self.cached_tids(), [0, 2])
+        self.assertIsNone(self.other.devices.get('device-1'))
+        self.assertIsNotNone(self.other.devices.get('device-0'))
+
+    def test_category_save_evicts_its_tags(self):
+        category = TagCategory.objects.create(device=self.devices[0], name='分类', color='#000000')
+        Tag.objects.filter(tid=2).update(category=category)
+        category.name = 'renamed'
+        category.save()
+        self.assertEqual(self.cached_tids(), [0, 1, 3])
+
+
+POOL_RESULTS = None
+
+
+def record_handler(batch, state):
+    # 在 worker 进程中执行，处理结果经队列交回测试进程
+    for record in batch:
+        message = json.loads(record.value)
+        if message.get('fail'):
+            raise ValueError('failed to handle offset {}'.format(record.offset))
+        POOL_RESULTS.put((os.getpid(), message['device_id'], message['seq']))
+
+
+class TopicWorkerPoolTest(SimpleTestCase):
+    def setUp(self):
+        global POOL_RESULTS
+        POOL_RESULTS = multiprocessing.Queue()
+        self.broker = MemoryBroker()
+
+    def results(self, count):
+        return [POOL_RESULTS.get(timeout=5) for _ in range(count)]
+
+    def test_device_order_across_workers(self):
+        devices = ['device-{}'.format(i) for i in range(6)]
+        for seq in range(60):
+            device_id = devices[seq % len(devices)]
+            self.broker.publish('saveProps', {'device_id': device_id, 'seq': seq}, partition=seq % 2)
+        self.broker.close()
+        TopicWorkerPool('saveProps', record_handler, workers=3, batch_size=4, linger_ms=5).run(self.broker)
+
+        by_device = {}
+        for pid, device_id, seq in self.results(60):
+            by_device.setdefault(device_id, []).append((pid, seq))
+        # 同一基站总由同一个 worker 按发布顺序处理，各 worker 都分到了基站
+        for device_id, handled in by_device.items():
+            self.assertEqual(len({pid for pid, _ in handled}), 1)
+            self.assertEqual([seq for _, seq in handled], sorted(seq for _, seq in handled))
+        self.assertEqual(len({handled[0][0] for handled in by_device.values()}),
+                         len({worker_index(device_id.encode(), 3) for device_id in devices}))
+        self.assertEqual(self.broker.committed, {('saveProps', 0): 30, ('saveProps', 1): 30})
+
+    def test_failed_batch_stalls_partition(self):
+        for seq in range(20):
+            self.broker.publish('saveProps', {'device_id': 'device-{}'.format(seq % 3), 'seq': seq, 'fail': seq == 8},
+                                partition=seq % 2)
+        self.broker.close()
+        TopicWorkerPool('saveProps', record_handler, workers=2).run(self.broker)
+
+        self.assertEqual(len(self.results(19)), 19)
+        # seq 8 是分区 0 的第 4 条（位移 4），分区 0 的位移停在它这里，分区 1 全部提交
+        self.assertEqual(self.broker.committed, {('saveProps', 0): 4, ('saveProps', 1): 10})
@@ -0,0 +1,78 @@
+import time
+
+
+class TimingWheel:
+    """
+    哈希时间轮：touch(key) 刷新最后出现时间 O(1)，advance(now) 返回超时未出现的 key
+    每个 key 在轮上最多挂一个槽位；到期时若期间被 touch 过，则按最后出现时间重新挂到后面的槽位（惰性重排），
+    所以代价与 key 的数量无关，只与到期检查的次数有关
+    """
+
+    def __init__(self, timeout, tick=1.0, slots=512):
+        self.timeout = timeout
+        self.tick = tick
+        self.slots = [dict() for _ in range(slots)]
+        self.last_seen = {}
+        self.scheduled = set()
+        self.cursor = None
+        self.current_tick = 0
+
+    def _tick_of(self, at):
+        return int(at // self.tick)
+
+    def _schedule(self, key, deadline):
+        deadline_tick = max(self._tick_of(deadline), self.current_tick + 1)
+        slot = self.slots[deadline_tick % len(self.slots)]
+        # 记录到期的绝对刻度，转一圈以上的 key 在未到期的轮次被跳过
+        slot[key] = deadline_tick
+        self.scheduled.add(key)
+
+    def touch(self, key, at=None):
+        at = time.time() if at is None else at
+        if self.cursor is None:
+            self.cursor = self.current_tick = self._tick_of(at)
+        self.last_seen[key] = at
+        if key not in self.scheduled:
+            self._schedule(key, at + self.timeout)
+
+    def discard(self, key):
+        self.last_seen.pop(key, None)
+        if key in self.scheduled:
+            self.scheduled.discard(key)
+            for slot in self.slots:
+                slot.pop(key, None)
+
+    def advance(self, now=None):
+        """
+        推进到 now，返回 [(key, last_seen), ...]，返回的 key 不再被跟踪，直到再次 touch
+        """
+        now = time.time() if now is None else now
+        target = self._tick_of(now)
+        if self.cursor is None:
+            self.cursor = self.current_tick = target
+            return []
+
+        expired = []
+        # 落后超过一整圈时每个槽位只需检查一次
+        start = max(self.cursor + 1, target - len(self.slots) + 1)
+        for tick in range(start, target + 1):
+            self.current_tick = tick
+            slot = self.slots[tick % len(self.slots)]
+            for key, deadline_tick in list(slot.items()):
+                if deadline_tick > target:
+                    continue
+                del slot[key]
+                self.scheduled.discard(key)
+                last_seen = self.last_seen.get(key)
+                if last_seen is None:
+                    continue
+                if now - last_seen >= self.timeout:
+                    del self.last_seen[key]
+                    expired.append((key, last_seen))
+                else:
+                    self._schedule(key, last_seen + self.timeout)
+        self.cursor = self.current_tick = target
+        return expired
+
+    def __len__(self):
+        return len(self.last_seen)
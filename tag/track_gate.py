@@ -0,0 +1,52 @@
+import threading
+
+from intellikeeper_api.track_settings import TrackSettings
+
+
+class TrackWriteGate:
+    """
+    轨迹写入门控：每个标签记住最后一次写入的阅读器组合、位置与时间，
+    只有阅读器组合变化、位置移动超过 min_move，或距上次写入超过 heartbeat 秒时才写入新的 TagTrack
+    """
+
+    def __init__(self, min_move, heartbeat):
+        self.min_move = min_move
+        self.heartbeat = heartbeat
+        self._last = {}
+        self._lock = threading.Lock()
+
+        self.admitted = 0
+        self.suppressed = 0
+
+    def admit(self, track):
+        readers = frozenset(reader_id for reader_id in (track.reader1_id, track.reader2_id, track.reader3_id)
+                            if reader_id is not None)
+        x = track.smoothed_x if track.smoothed_x is not None else track.x
+        y = track.smoothed_y if track.smoothed_y is not None else track.y
+        with self._lock:
+            last = self._last.get(track.tag_id)
+            if last is not None:
+                last_readers, last_x, last_y, last_written = last
+                elapsed = (track.created - last_written).total_seconds()
+                moved = x is not None and last_x is not None and \
+                    (abs(x - last_x) >= self.min_move or abs(y - last_y) >= self.min_move)
+                if readers == last_readers and not moved and 0 <= elapsed < self.heartbeat:
+                    self.suppressed += 1
+                    return False
+            self._last[track.tag_id] = (readers, x, y, track.created)
+            self.admitted += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._last.clear()
+
+    def stats(self):
+        return {
+            'tags': len(self._last),
+            'admitted': self.admitted,
+            'suppressed': self.suppressed
+        }
+
+
+track_write_gate = TrackWriteGate(TrackSettings.write_gate_min_move, TrackSettings.write_gate_heartbeat)
@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from tag.archive import TRACK_FIELDS, merge_tracks, track_archive
+from tag.models import Reader, TagTrack
+from tag.positioning import locate_readings
+
+# 相邻两个位置在两个坐标轴上都相差不到该值时视为未移动，不计入轨迹
+MIN_MOVE = 2
+
+
+def get_reader_coordinates(device_id):
+    return {reader_id: (x, y) for reader_id, x, y in Reader.objects.filter(device_id=device_id)
+            .values_list('id', 'x', 'y')}
+
+
+def iter_track_rows(device_id, tag_ids, since, until=None, tags=None):
+    """
+    按 (created, id) 顺序流式返回一批标签在 [since, until) 内的轨迹行（格式同 TRACK_FIELDS），
+    热表只查询一次并用 iterator() 逐块读取；早于归档时间点的部分与归档合并
+    tags 为这批标签的 Tag 查询集时作为子查询使用，不把 tag_ids 逐个作为参数传给数据库（SQLite 最多 999 个）
+    """
+    rows = TagTrack.objects.filter(tag__in=tags.order_by().values('id') if tags is not None else tag_ids,
+                                   created__gte=since)
+    if until is not None:
+        rows = rows.filter(created__lt=until)
+    rows = rows.order_by('created', 'id').values_list(*TRACK_FIELDS).iterator()
+
+    archived_until = track_archive.archived_until(device_id)
+    if archived_until is not None and since < archived_until:
+        rows = merge_tracks(
+            track_archive.read(device_id, tag_ids, since, min(until or archived_until, archived_until)),
+            rows
+        )
+    return rows
+
+
+def iter_positions(rows, coordinates, chunk_size=5000):
+    """
+    为轨迹行补上位置，返回 (row, (x, y, error))：入库时已平滑的行使用平滑后的位置，已定位的行使用库中的位置，
+    其余（定位功能之前的历史数据）按 chunk_size 条一批向量化定位
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from _locate_chunk(chunk, coordinates)
+            chunk = []
+    yield from _locate_chunk(chunk, coordinates)
+
+
+def _locate_chunk(chunk, coordinates):
+    missing = [row for row in chunk if row[9] is None]
+    located = dict(zip((row[0] for row in missing), locate_readings(
+        [((row[3], row[4]), (row[5], row[6]), (row[7], row[8])) for row in missing], coordinates)))
+    for row in chunk:
+        if row[12] is not None:
+            yield row, (row[12], row[13], row[11])
+        elif row[9] is not None:
+            yield row, (row[9], row[10], row[11])
+        else:
+            yield row, located[row[0]]
+
+
+def build_tracks(device_id, tags, since=None, until=None):
+    """
+    一次遍历计算多个标签的轨迹 {tag_id: [(x, y, created), ...]}：
+    每条记录取定位得到的位置，与该标签上一个位置相比没有明显移动时跳过
+    tags 为 Tag 查询集（在轨迹查询中作为子查询）或者标签ID列表
+    """
+    since = since or timezone.now() - timedelta(days=2)
+    if isinstance(tags, QuerySet):
+        tag_ids = list(tags.values_list('id', flat=True))
+    else:
+        tag_ids, tags = list(tags), None
+    coordinates = get_reader_coordinates(device_id)
+
+    tracks = {tag_id: [] for tag_id in tag_ids}
+    last = {}
+    for row, (x, y, _) in iter_positions(iter_track_rows(device_id, tag_ids, since, until, tags), coordinates):
+        if x is None:
+            continue
+        tag_id = row[1]
+        previous = last.get(tag_id)
+        if previous is not None and abs(x - previous[0]) < MIN_MOVE and abs(y - previous[1]) < MIN_MOVE:
+            continue
+        last[tag_id] = (x, y)
+        tracks[tag_id].append((x, y, row[2]))
+    return tracks
@@ -0,0 +1,84 @@
+import json
+import re
+
+from intellikeeper_api.cache_settings import CacheSettings
+from tag.cache import LRUCache
+from tag.events import get_desc_by_event
+from tag.facade import tag_get_path
+from tag.models import Trigger
+
+PLACEHOLDER = re.compile(r'{% (\w+) %}')
+
+
+class TriggerTemplate:
+    """
+    预先切分好的 {% name %} 模板；渲染时只做一次拼接，未知的占位符原样保留
+    """
+
+    def __init__(self, source: str):
+        self.parts = PLACEHOLDER.split(source)
+        self.names = frozenset(self.parts[1::2])
+
+    def render(self, context):
+        parts = self.parts[:]
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            parts[i] = context[name] if name in context else '{% ' + name + ' %}'
+        return ''.join(parts)
+
+
+def compile_mapping(raw: str):
+    mapping = json.loads(raw)
+    if not isinstance(mapping, dict):
+        return None
+    return {k: TriggerTemplate(v) if isinstance(v, str) else v for k, v in mapping.items()}
+
+
+def render_mapping(mapping, context):
+    return {k: v.render(context) if isinstance(v, TriggerTemplate) else v for k, v in mapping.items()}
+
+
+class CompiledTrigger:
+    def __init__(self, trigger: Trigger):
+        self.url = TriggerTemplate(trigger.callback_url)
+        self.params = compile_mapping(trigger.callback_params)
+        # 内部回调不使用 headers
+        self.headers = compile_mapping(trigger.callback_headers) if trigger.callback_protocol != 'intellikeeper' \
+            else None
+
+        # 模板中用到的全部变量
+        self.names = set(self.url.names)
+        for mapping in (self.params, self.headers):
+            for value in (mapping or {}).values():
+                if isinstance(value, TriggerTemplate):
+                    self.names |= value.names
+
+
+def build_trigger_context(tag, event, record=None, device=None):
+    """
+    一次事件只计算一次的模板变量；record 为本次事件记录，已写库时提供 event_id
+    基站级事件 tag 为 None，标签相关的变量为空
+    """
+    device = device if device is not None else tag.device
+    return {
+        'event_id': str(record.id) if record is not None and record.id is not None else '',
+        'tag_name': tag.name if tag is not None else '',
+        'tag_tid': str(tag.tid) if tag is not None else '',
+        'device_id': device.device_id,
+        'device_name': device.name,
+        'tag_path': tag_get_path(tag) if tag is not None else '',
+        'event_type': str(get_desc_by_event(event)[0])
+    }
+
+
+# (trigger.id, trigger.updated) -> CompiledTrigger，触发器修改后 updated 变化，旧的编译结果自然失效
+_compiled_triggers = LRUCache(CacheSettings.trigger_template_cache_size, CacheSettings.trigger_template_cache_ttl)
+
+
+def get_compiled_trigger(trigger: Trigger):
+    key = (trigger.id, trigger.updated)
+    compiled = _compiled_triggers.get(key)
+    if compiled is None:
+        compiled = CompiledTrigger(trigger)
+        _compiled_triggers.set(key, compiled)
+    return compiled
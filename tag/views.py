@@ -1,3 +1,6 @@
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_filters import rest_framework as drf_filter
 from huaweicloudsdkcore.exceptions.exceptions import ServerResponseException
 from huaweicloudsdkiotda.v5 import ListPropertiesRequest
@@ -10,10 +13,12 @@ from device.iot import get_iot_client, tag_sync_conf, get_readers
 from device.models import Device
 from device.services import call_device
 from intellikeeper_api.hwyun_settings import HwyunSettings
-from tag.models import Tag, Callback, Trigger, TagCategory, Reader, Event
+from tag.models import Tag, Callback, Trigger, TagCategory, Reader, Event, TriggerStat, TagPosition
 from tag.serializers import TagSerializer, TriggerSerializer, TagCategorySerializer, ReaderSerializer, \
-    ClassifiedTagCategorySerializer, TrackedTagSerializer, EventSerializer
+    TrackedTagSerializer, EventSerializer, TriggerStatSerializer, \
+    TagPositionSerializer, build_classified_tree
 from tag.services import invoke_trigger, tag_get_sub_categories, run_callbacks
+from tag.tracks import build_tracks
 
 
 class TagFilter(drf_filter.FilterSet):
@@ -41,13 +46,20 @@ class TagViewset(viewsets.ModelViewSet):
         device_id = self.request.query_params['device']
         try:
             device = Device.objects.get(pk=device_id, belongs_to=self.request.user)
-            return Tag.objects.filter(device=device)
         except Device.DoesNotExist:
             raise ValidationError
+        tags = Tag.objects.filter(device=device)
+        if self.with_position():
+            tags = tags.select_related('position')
+        return tags
+
+    def with_position(self):
+        return self.request.query_params.get('with_position', 'false') == 'true'
 
     def get_serializer_context(self):
         return {
-            'request': self.request
+            'request': self.request,
+            'with_position': self.with_position()
         }
 
     def perform_update(self, serializer: TagSerializer):
@@ -207,6 +219,7 @@ class CallbackView(views.APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request):
+        # 直接查库：callback_index 是进程内缓存，只在守护进程中使用，多个 Web 进程之间看到的可能不一致
         scope = int(request.query_params.get('scope', 1))
         target = int(request.query_params.get('target', 0))
 
@@ -379,6 +392,18 @@ def change_trigger_status(request, pk):
     return Response()
 
 
+@api_view(('GET',))
+@permission_classes((permissions.IsAuthenticated,))
+def get_trigger_stats(request, pk):
+    try:
+        trigger = Trigger.objects.get(pk=pk, belongs_to=request.user)
+    except Trigger.DoesNotExist:
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    stat = TriggerStat.objects.filter(trigger=trigger).first() or TriggerStat(trigger=trigger)
+    return Response(TriggerStatSerializer(stat).data)
+
+
 @api_view(('GET',))
 @permission_classes((permissions.IsAuthenticated,))
 def get_tags_info(request):
@@ -422,7 +447,19 @@ def get_classified_tags(request):
     except Device.DoesNotExist:
         qs = TagCategory.objects.filter(device__belongs_to=request.user)
 
-    return Response(ClassifiedTagCategorySerializer(qs, many=True).data)
+    return Response(build_classified_tree(qs))
+
+
+@api_view(('GET', ))
+@permission_classes((permissions.IsAuthenticated, ))
+def get_tag_positions(request):
+    try:
+        device = Device.objects.get(pk=request.query_params.get('device'), belongs_to=request.user)
+    except Device.DoesNotExist:
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    # 按基站取所有标签的当前位置，只查 TagPosition 一张表（device 上有索引）
+    return Response(TagPositionSerializer(TagPosition.objects.filter(device=device), many=True).data)
 
 
 @api_view(('GET', ))
@@ -433,10 +470,22 @@ def get_track(request):
     except Device.DoesNotExist:
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
-    return Response(TrackedTagSerializer(
-        TagFilter(request.GET, queryset=Tag.objects.filter(device=device)).qs,
-        many=True
-    ).data)
+    # 可选的 since / until（ISO 8601），早于热表保留范围的部分从归档中读取
+    context = {}
+    for name in ('since', 'until'):
+        if name in request.query_params:
+            try:
+                value = parse_datetime(request.query_params[name])
+            except ValueError:
+                value = None
+            if value is None:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            context[name] = value if timezone.is_aware(value) else timezone.make_aware(value)
+
+    tags = TagFilter(request.GET, queryset=Tag.objects.filter(device=device)).qs
+    # 所有标签的轨迹在一次流式查询中算出，序列化时直接取用
+    context['tracks'] = build_tracks(device.id, tags, context.get('since'), context.get('until'))
+    return Response(TrackedTagSerializer(tags, many=True, context=context).data)
 
 
 @api_view(('GET', ))
@@ -448,7 +497,7 @@ def get_events(request):
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
     return Response(EventSerializer(
-        Event.objects.filter(tag__device=device),
+        Event.objects.filter(Q(tag__device=device) | Q(device=device)),
         many=True
     ).data)
 
@@ -462,6 +511,6 @@ def get_events_top10(request):
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
     return Response(EventSerializer(
-        Event.objects.filter(tag__device=device)[:10],
+        Event.objects.filter(Q(tag__device=device) | Q(device=device))[:10],
         many=True
     ).data)
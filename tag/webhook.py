@@ -0,0 +1,197 @@
+import atexit
+import os
+import threading
+import time
+import traceback
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from intellikeeper_api.webhook_settings import WebhookSettings
+
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+# 非幂等的请求对方可能已经处理过，只在确定没有被处理时重试：连接失败，或者对方明确拒绝（429、503）
+SAFE_RETRY_STATUS = frozenset((429, 503))
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+
+class WebhookTransport:
+    """
+    外部回调的 HTTP 客户端：按主机复用长连接、限制单主机并发、超时与指数退避重试，
+    并按触发器累计调用耗时与失败次数，由后台线程每隔 stats_flush_interval 秒写入 TriggerStat，close() 时写入剩余的统计
+    """
+
+    def __init__(self, connect_timeout, read_timeout, pool_size, max_per_host, retries, backoff,
+                 stats_flush_interval):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.stats_flush_interval = stats_flush_interval
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._host_limits = {}
+        self._pending_stats = {}
+        self._stopped = threading.Event()
+        self._flusher = None
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+    def request(self, method, url, trigger_id=None, **kwargs):
+        """
+        返回最终的 Response；重试用尽仍连接失败时返回 None，不向调用方抛出网络异常
+        """
+        started = time.monotonic()
+        response = None
+        error = ''
+        attempt = 0
+        limit = self._host_limit(url)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        while True:
+            with limit:
+                try:
+                    response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                    error = '' if response.status_code < 400 else 'HTTP {}'.format(response.status_code)
+                    retry = response.status_code in (RETRY_STATUS if idempotent else SAFE_RETRY_STATUS)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    response = None
+                    error = str(e)
+                    # 读取超时、连接中途断开时请求可能已经送达，非幂等的请求只在连接没有建立时重试
+                    retry = idempotent or isinstance(e, requests.ConnectTimeout) or self._not_sent(e)
+            if not retry or attempt >= self.retries:
+                break
+            attempt += 1
+            # 退避等待时不占用该主机的并发名额
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+
+        if trigger_id is not None:
+            self._record(trigger_id, time.monotonic() - started, attempt, response, error)
+        return response
+
+    @staticmethod
+    def _not_sent(error):
+        # 建立连接阶段的失败（拒绝连接、DNS 解析失败）请求一定没有发出
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def _record(self, trigger_id, latency, retries, response, error):
+        from django.utils import timezone
+
+        with self._lock:
+            stat = self._pending_stats.setdefault(trigger_id, {
+                'calls': 0,
+                'failures': 0,
+                'retries': 0,
+                'total_latency': 0.0,
+                'max_latency': 0.0
+            })
+            stat['calls'] += 1
+            stat['failures'] += 1 if error else 0
+            stat['retries'] += retries
+            stat['total_latency'] += latency
+            stat['max_latency'] = max(stat['max_latency'], latency)
+            stat['last_latency'] = latency
+            stat['last_status'] = response.status_code if response is not None else None
+            stat['last_error'] = error[:1000]
+            stat['last_called'] = timezone.now()
+            if self._flusher is None and not self._stopped.is_set():
+                self._flusher = threading.Thread(target=self._run, name='webhook-stats', daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        from django.db import close_old_connections
+
+        while not self._stopped.wait(self.stats_flush_interval):
+            try:
+                close_old_connections()
+                self.flush_stats()
+            except Exception:
+                traceback.print_exc()
+
+    def flush_stats(self):
+        from django.db.models import F
+        from django.db.models.functions import Greatest
+
+        from tag.models import TriggerStat, Trigger
+
+        with self._lock:
+            pending, self._pending_stats = self._pending_stats, {}
+
+        for trigger_id, stat in pending.items():
+            if not Trigger.objects.filter(pk=trigger_id).exists():
+                continue
+            TriggerStat.objects.get_or_create(trigger_id=trigger_id)
+            TriggerStat.objects.filter(trigger_id=trigger_id).update(
+                calls=F('calls') + stat['calls'],
+                failures=F('failures') + stat['failures'],
+                retries=F('retries') + stat['retries'],
+                total_latency=F('total_latency') + stat['total_latency'],
+                max_latency=Greatest(F('max_latency'), stat['max_latency']),
+                last_latency=stat['last_latency'],
+                last_status=stat['last_status'],
+                last_error=stat['last_error'],
+                last_called=stat['last_called']
+            )
+
+    def close(self):
+        """
+        停止后台写入线程并写入剩余的统计
+        """
+        self._stopped.set()
+        with self._lock:
+            flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            flusher.join()
+        self.flush_stats()
+
+
+_transport = None
+_transport_pid = None
+_transport_lock = threading.Lock()
+
+
+def get_webhook_transport():
+    """
+    每个进程一个共享的 WebhookTransport（连接池不能跨 fork 共用）
+    """
+    global _transport, _transport_pid
+
+    with _transport_lock:
+        if _transport is None or _transport_pid != os.getpid():
+            _transport = WebhookTransport(
+                WebhookSettings.connect_timeout,
+                WebhookSettings.read_timeout,
+                WebhookSettings.pool_size,
+                WebhookSettings.max_per_host,
+                WebhookSettings.retries,
+                WebhookSettings.backoff,
+                WebhookSettings.stats_flush_interval
+            )
+            _transport_pid = os.getpid()
+        return _transport
+
+
+@atexit.register
+def close_webhook_transport():
+    """
+    写入本进程中尚未写入的调用统计；fork 出的子进程继承的父进程实例不处理，避免重复计数
+    """
+    global _transport
+
+    with _transport_lock:
+        transport = _transport if _transport_pid == os.getpid() else None
+        _transport = None
+    if transport is not None:
+        transport.close()